@@ -17,11 +17,12 @@ We will explore the following concepts:
 *   **Grouping Strategies:** Methods for combining raw UoMs into more homogenous groups.
 *   **Kolmogorov-Smirnov (KS) Test:** A statistical test to measure the similarity between two distributions.
 
-The application consists of three pages:
+The application consists of four pages:
 
 *   **Data Generation:** Generates synthetic operational loss data with customizable characteristics.
 *   **UoM Grouping:** Allows you to select and apply UoM grouping strategies, including business knowledge-based grouping.
 *   **Homogeneity Assessment:** Visualizes the statistical homogeneity of grouped UoMs using the Kolmogorov-Smirnov (KS) test and empirical Cumulative Distribution Functions (CDFs).
+*   **Capital Estimation:** Fits frequency and severity distributions per grouped UoM and simulates VaR and expected shortfall at 99.9% to compare grouping strategies.
 
 
 **Formulae:**
@@ -33,7 +34,9 @@ The scaled version for distance $d_{ij}$ between two UoMs $i$ and $j$ with sampl
 $$ \displaystyle d_{ij}=\frac{n_i n_j}{n_i+n_j}\sup_X |F_i(x)-F_j(x)| $$
 """)
 # Your code starts here
-page = st.sidebar.selectbox(label="Navigation", options=["Data Generation", "UoM Grouping", "Homogeneity Assessment"])
+page = st.sidebar.selectbox(label="Navigation", options=["Data Generation", "UoM Grouping", "Homogeneity Assessment", "Capital Estimation"])
+from application_pages.profiling import profiling_controls, profiling_panel
+profiling = profiling_controls()
 if page == "Data Generation":
     from application_pages.data_generation import run_data_generation
     run_data_generation()
@@ -43,6 +46,10 @@ elif page == "UoM Grouping":
 elif page == "Homogeneity Assessment":
     from application_pages.homogeneity_assessment import run_homogeneity_assessment
     run_homogeneity_assessment()
+elif page == "Capital Estimation":
+    from application_pages.capital_estimation import run_capital_estimation
+    run_capital_estimation()
+profiling_panel(profiling)
 # Your code ends
 
 
@@ -0,0 +1,75 @@
+
+import time
+
+import streamlit as st
+
+from uom_core.jobs import BackgroundJobs, JobCancelled, JobOwner
+
+# Seconds between progress refreshes of a running job.
+POLL_SECONDS = 0.5
+
+@st.cache_resource
+def get_background_jobs():
+    """Job runner shared by all sessions; each session only sees its own slots."""
+    return BackgroundJobs()
+
+def session_owner():
+    """This session's ``JobOwner``; the session state keeps it (and its finished jobs) alive."""
+    if 'session_owner' not in st.session_state:
+        st.session_state['session_owner'] = JobOwner()
+    return st.session_state['session_owner']
+
+def cached_digest(source, name, compute):
+    """``compute()`` once per ``source`` object, so reruns do not hash the same data again."""
+    digests = st.session_state.setdefault('input_digests', {})
+    if name not in digests or digests[name][0] is not source:
+        digests[name] = (source, compute())
+    return digests[name][1]
+
+def run_in_background(name, key, func, *args, **kwargs):
+    """Starts ``func`` for this session unless a job with the same input ``key`` exists."""
+    return get_background_jobs().submit(session_owner(), name, key, func, *args, **kwargs)
+
+def _progress_text(job, label):
+    total = f" of {job.total:,}" if job.total else ""
+    return f"{label}: {job.done:,}{total} done ({job.elapsed:.0f} s)"
+
+def wait_for_job(job, label):
+    """Waits for a job while showing its progress, and returns its result.
+
+    Every progress update lets Streamlit interrupt this run when a widget changes; the job
+    keeps running and the next run picks it up instead of starting over.
+    """
+    if not job.finished:
+        bar = st.progress(job.fraction, text=label)
+        while not job.finished:
+            bar.progress(job.fraction, text=_progress_text(job, label))
+            time.sleep(POLL_SECONDS / 5)
+        bar.empty()
+    return job.result()
+
+def show_job(job, label, render, render_partial=None):
+    """Renders a job's result, or its progress and partial result without blocking the page.
+
+    While the job runs a fragment polls it every ``POLL_SECONDS``, showing a progress bar
+    and ``render_partial(job.partial)``; once it finishes the whole page reruns and
+    ``render(result)`` is called.
+    """
+    if job.finished:
+        try:
+            result = job.result()
+        except JobCancelled:
+            st.info(f"{label} was cancelled because its inputs changed.")
+            return
+        render(result)
+        return
+
+    @st.fragment(run_every=POLL_SECONDS)
+    def poll():
+        if job.finished:
+            st.rerun()
+        st.progress(job.fraction, text=_progress_text(job, label))
+        if render_partial is not None and job.partial is not None:
+            render_partial(job.partial)
+
+    poll()
@@ -0,0 +1,130 @@
+
+import streamlit as st
+import pandas as pd
+import os
+
+from uom_core.capital import FREQUENCY_MODELS, fit_loss_models, fit_loss_models_sketched, simulate_capital
+from application_pages.profiling import get_profiler
+
+def run_capital_estimation():
+    profiler = get_profiler()
+
+    # ---------- Page title ----------
+    st.header("Capital Estimation")
+
+    st.markdown(r"""
+    **Why group UoMs at all?**
+
+    Operational‑risk capital is computed per unit of measure from a *loss distribution approach*:
+    a frequency distribution for the number of losses in a year and a severity distribution for
+    the size of each loss. The annual aggregate loss
+
+    $$S = \sum_{i=1}^{N} X_i, \qquad N \sim \text{Poisson}(\lambda) \text{ or } \text{NB}(r, p), \quad X_i \sim \text{Lognormal}(\mu, \sigma)$$
+
+    has no closed form, so it is simulated. Capital is its 99.9 % quantile (**VaR**); the
+    **expected shortfall (ES)** is the mean loss in the years beyond the VaR.
+    Re‑run this page after trying another strategy on the **UoM Grouping** page to compare them.
+    """)
+
+    # ---------- Guard clause ----------
+    if 'grouping' not in st.session_state:
+        st.info(
+            "Please generate synthetic data on the **Data Generation** page and group UoMs "
+            "on the **UoM Grouping** page first."
+        )
+        return
+
+    grouping = st.session_state['grouping']
+    grouped_data = grouping.frame()
+    sketches = st.session_state.get('loss_sketches') if 'loss_amount' not in grouped_data.columns else None
+
+    # ---------- Sidebar controls ----------
+    st.sidebar.subheader("Monte Carlo settings")
+    frequency_model = st.sidebar.radio(
+        "Frequency distribution",
+        options=FREQUENCY_MODELS,
+        format_func=lambda model: {'auto': "Automatic", 'poisson': "Poisson",
+                                   'negative_binomial': "Negative binomial"}[model],
+        help="Automatic uses a negative binomial for groups whose monthly loss counts are "
+             "overdispersed (variance above the mean) and a Poisson otherwise.",
+        disabled=sketches is not None
+    )
+    n_years = st.sidebar.select_slider(
+        "Simulated years per group",
+        options=[100_000, 1_000_000, 10_000_000],
+        value=1_000_000,
+        format_func=lambda years: f"{years:,}"
+    )
+    seed = st.sidebar.number_input("Simulation seed", min_value=0, value=0, step=1)
+    with st.sidebar.expander("Performance"):
+        n_jobs = st.number_input(
+            "Simulation worker processes",
+            min_value=1,
+            value=os.cpu_count() or 1,
+            key="capital_n_jobs",
+            help="Blocks of simulated years are spread over these processes. The results do not "
+                 "depend on the number of processes."
+        )
+
+    # ---------- Fitted models ----------
+    st.subheader("1. Fitted frequency and severity per group")
+    try:
+        with profiler.span("fit loss models"):
+            if sketches is None:
+                models = fit_loss_models(grouped_data, frequency_model=frequency_model)
+            else:
+                models = fit_loss_models_sketched(grouped_data, sketches)
+    except Exception as e:
+        st.error(f"Error fitting loss models: {e}")
+        return
+    if 'loss_date' not in grouped_data.columns or not grouped_data['loss_date'].notna().any():
+        severity = " and the severity is fitted to sketch quantiles" if sketches is not None else ""
+        st.caption(f"No loss dates are available, so the frequency is a Poisson with one year of "
+                   f"observation{severity}.")
+    st.dataframe(models)
+
+    # ---------- Simulation ----------
+    st.subheader("2. Capital per group")
+    if st.button("Run Monte Carlo simulation"):
+        try:
+            with profiler.span("simulate capital", years=n_years, groups=len(models)):
+                capital = simulate_capital(models, n_years=n_years, seed=int(seed), n_jobs=int(n_jobs))
+        except Exception as e:
+            st.error(f"Error during the simulation: {e}")
+            return
+        runs = st.session_state.setdefault('capital_runs', {})
+        runs[grouping.name or "Current grouping"] = {
+            'groups': len(capital), 'simulated years': n_years,
+            'expected loss': capital['expected_loss'].sum(),
+            'sum of VaR 99.9%': capital['var'].sum(), 'sum of ES 99.9%': capital['es'].sum(),
+            'capital': capital,
+        }
+
+    runs = st.session_state.get('capital_runs', {})
+    current = runs.get(grouping.name or "Current grouping")
+    if current is None:
+        st.info("Press **Run Monte Carlo simulation** to estimate capital for the current grouping.")
+    else:
+        st.markdown("""
+        VaR and ES at 99.9 % with 95 % confidence intervals. The VaR interval comes from the
+        order statistics of the simulated years; a wide interval means more years are needed.
+        """)
+        st.dataframe(current['capital'].rename(columns={
+            'expected_loss': "Expected loss", 'var': "VaR", 'var_low': "VaR low", 'var_high': "VaR high",
+            'es': "ES", 'es_low': "ES low", 'es_high': "ES high"
+        }))
+
+    # ---------- Strategy comparison ----------
+    if runs:
+        st.subheader("3. Grouping strategies compared")
+        st.markdown("""
+        Capital summed over the groups of each strategy you simulated, assuming no
+        diversification between groups. Merging UoMs changes the fitted tails and hence capital.
+        """)
+        st.dataframe(pd.DataFrame.from_dict(
+            {name: {key: value for key, value in run.items() if key != 'capital'} for name, run in runs.items()},
+            orient='index'
+        ))
+
+if __name__ == "__main__":
+    run_capital_estimation()
@@ -1,36 +1,140 @@
 
 import streamlit as st
-import pandas as pd
-import numpy as np
-
-def generate_synthetic_data(num_uoms, loss_events_per_uom, severity_mean_range, severity_std_range):
-    """Generates synthetic operational loss data."""
-    if severity_mean_range[0] > severity_mean_range[1] or any(x < 0 for x in severity_mean_range):
-        raise ValueError("Invalid severity mean range.")
-    if severity_std_range[0] > severity_std_range[1] or any(x < 0 for x in severity_std_range):
-        raise ValueError("Invalid severity std range.")
-
-    data = []
-    for uom_id in range(num_uoms):
-        for _ in range(loss_events_per_uom):
-            mean = np.random.uniform(severity_mean_range[0], severity_mean_range[1])
-            std = np.random.uniform(severity_std_range[0], severity_std_range[1])
-            loss_amount = np.random.lognormal(mean, std)
-            loss_date = pd.to_datetime('2023-01-01') + pd.to_timedelta(np.random.randint(0, 365), unit='D')
-            event_type = np.random.choice(['Fraud', 'Error', 'System Failure'])
-            business_line = np.random.choice(['Retail', 'Investment', 'Corporate'])
-            data.append([uom_id, loss_amount, loss_date, event_type, business_line])
-    df = pd.DataFrame(data, columns=['uom_id', 'loss_amount', 'loss_date', 'event_type', 'business_line'])
-    return df
+import os
+from datetime import date, timedelta
+
+from uom_core.data import generate_synthetic_data
+from uom_core.index import LossIndex
+from uom_core.io import iter_loss_batches, load_loss_data, open_loss_dataset
+from uom_core.sketch import build_sketches, sketch_cell_frame
+from application_pages.profiling import get_profiler
+
+@st.cache_resource(max_entries=2)
+def load_loss_data_cached(path, modified, start_date, end_date):
+    """Loads a loss file once per (path, modification time, date range) and shares the frame."""
+    return load_loss_data(path, start_date=start_date, end_date=end_date)
+
+@st.cache_resource(max_entries=2)
+def generate_synthetic_data_cached(num_uoms, loss_events_per_uom, severity_mean_range, severity_std_range,
+                                   random_state):
+    """Generates a data set once per parameter set and shares the frame, so revisiting this
+    page keeps the loss index and grouping built from it."""
+    return generate_synthetic_data(num_uoms, loss_events_per_uom, severity_mean_range, severity_std_range,
+                                   random_state=random_state)
+
+@st.cache_resource(max_entries=2)
+def build_loss_sketches_cached(path, modified, start_date=None, end_date=None):
+    """Streams a loss file into one quantile sketch per (UoM, event type) present."""
+    keys = [key for key in ('uom_id', 'event_type') if key in open_loss_dataset(path).schema.names]
+    batches = iter_loss_batches(path, start_date, end_date, columns=keys + ['loss_amount'])
+    sketches = build_sketches(batches, keys=keys)
+    return sketches, sketch_cell_frame(sketches, keys=keys)
+
+# Session entries computed from the current loss data, dropped when the data changes: the
+# sorted-sample index, sweep cells and scores, input digests, capital runs, the KS matrix
+# of sketch mode, the business-override buffer and the k-medoids warm start.
+PER_DATA_KEYS = ('loss_index', 'sweep_cache', 'input_digests', 'capital_runs', 'sketch_ks_matrix',
+                 'override_buffer', 'kmedoids_medoids')
+
+def store_loss_data(data, sketches=None):
+    """Stores the session's loss data (and its sketches in sketch mode).
+
+    A grouping of earlier data is dropped so the session never keeps a second data set alive,
+    and so is every other result derived from earlier data (``PER_DATA_KEYS``).
+    """
+    grouping = st.session_state.get('grouping')
+    if grouping is not None and grouping.data is not data:
+        del st.session_state['grouping']
+    if st.session_state.get('synthetic_data') is not data:
+        for key in PER_DATA_KEYS:
+            st.session_state.pop(key, None)
+    if sketches is None:
+        st.session_state.pop('loss_sketches', None)
+    else:
+        st.session_state['loss_sketches'] = sketches
+    st.session_state['synthetic_data'] = data
+
+def get_loss_index(data):
+    """Sorted-sample index of ``data``, built once per data set and kept in the session.
+
+    Every page reads its sorted losses, group buffers and ECDFs from this index, so moving
+    between pages does not sort the losses again. It is rebuilt whenever ``data`` is not
+    the frame it was built from.
+    """
+    entry = st.session_state.get('loss_index')
+    if entry is None or entry[0] is not data:
+        with get_profiler().span("build loss index", rows=len(data)):
+            entry = (data, LossIndex(data))
+        st.session_state['loss_index'] = entry
+    return entry[1]
+
+def run_data_loading():
+    st.sidebar.markdown("""
+    **Load historical loss events**
+
+    Point to a Parquet file, a directory of Parquet files, or an Arrow/Feather file with the
+    columns `uom_id`, `loss_amount` and optionally `event_type`, `business_line`, `loss_date`.
+    """)
+    path = st.sidebar.text_input("Loss data path", help="Path on the server running this app.")
+    start_date = end_date = None
+    if st.sidebar.checkbox("Filter by loss date", help="Only rows in the date range are read from disk."):
+        date_range = st.sidebar.date_input("Loss date range", value=(date(2023, 1, 1), date(2023, 12, 31)))
+        if len(date_range) == 2:
+            start_date, end_date = date_range[0], date_range[1] + timedelta(days=1)
+
+    approximate = st.sidebar.checkbox(
+        "Approximate out-of-core mode (quantile sketches)",
+        help="Streams the file in batches and keeps a fixed-size quantile sketch per UoM and event type "
+             "instead of every loss, for files that do not fit in memory. KS distances, homogeneity "
+             "statistics and ECDFs are then approximate, with the error bound shown next to them."
+    )
+
+    if not path:
+        st.info("Enter the path of a Parquet or Arrow file in the sidebar to load loss data.")
+        return
+    if approximate:
+        try:
+            with get_profiler().span("build sketches"):
+                sketches, cells = build_loss_sketches_cached(path, os.path.getmtime(path), start_date, end_date)
+        except (ImportError, OSError, KeyError, ValueError) as e:
+            st.error(f"Error: {e}")
+            return
+        st.dataframe(cells.head())
+        st.write(f"Summarised **{cells['n_events'].sum():,}** loss events in **{len(sketches):,}** sketches "
+                 f"using **{sum(s.nbytes for s in sketches.values()) / 2**20:,.2f} MiB** of memory.")
+        st.write("Counts of original UoM IDs:")
+        st.write(cells.groupby('uom_id')['n_events'].sum())
+        store_loss_data(cells, sketches)  # one row per sketch; no loss_amount column
+        return
+
+    try:
+        with get_profiler().span("load loss data"):
+            loss_data = load_loss_data_cached(path, os.path.getmtime(path), start_date, end_date)
+    except (ImportError, OSError, KeyError, ValueError) as e:
+        st.error(f"Error: {e}")
+        return
+
+    st.dataframe(loss_data.head())
+    st.write(f"Loaded **{len(loss_data):,}** loss events using "
+             f"**{loss_data.memory_usage(deep=True).sum() / 2**20:,.1f} MiB** of memory.")
+    st.write("Counts of original UoM IDs:")
+    st.write(loss_data['uom_id'].value_counts())
+    store_loss_data(loss_data)
 
 def run_data_generation():
     st.header("Synthetic Data Generation")
     st.markdown("""
     This page allows you to generate synthetic operational loss data with customizable characteristics.
     Adjust the parameters in the sidebar to control the number of UoMs, loss events per UoM, and the severity distribution.
-    The generated data will be displayed below.
+    The generated data will be displayed below. You can also switch the data source to load
+    historical loss events from Parquet or Arrow files instead.
     """)
 
+    data_source = st.sidebar.radio("Data source", options=["Generate synthetic data", "Load Parquet/Arrow file"])
+    if data_source == "Load Parquet/Arrow file":
+        run_data_loading()
+        return
+
     num_uoms = st.sidebar.slider("Number of Raw UoMs", min_value=2, max_value=20, value=5,
                                     help="Number of initial 'raw' Units of Measure to simulate loss data for.")
     loss_events_per_uom = st.sidebar.slider("Loss Events per UoM", min_value=10, max_value=1000, value=100,
@@ -39,13 +143,17 @@ def run_data_generation():
                                             help="Range for the mean parameter ($\mu$) of the underlying normal distribution for log-normal loss severity. Controls the average loss amount.")
     severity_std_range = st.sidebar.slider("Severity Std Dev Range (Log-normal $\sigma$)", min_value=0.1, max_value=5.0, value=(1.0, 2.0),
                                             help="Range for the standard deviation parameter ($\sigma$) of the underlying normal distribution for log-normal loss severity. Controls the dispersion of loss amounts.")
+    random_seed = st.sidebar.number_input("Random Seed", min_value=0, value=42, step=1,
+                                          help="Seed for the random number generator. The same seed reproduces the same data set.")
 
     try:
-        synthetic_data = generate_synthetic_data(num_uoms, loss_events_per_uom, severity_mean_range, severity_std_range)
+        with get_profiler().span("generate_synthetic_data", rows=num_uoms * loss_events_per_uom):
+            synthetic_data = generate_synthetic_data_cached(num_uoms, loss_events_per_uom, severity_mean_range,
+                                                            severity_std_range, int(random_seed))
         st.dataframe(synthetic_data.head())
         st.write("Counts of original UoM IDs:")
         st.write(synthetic_data['uom_id'].value_counts())
-        st.session_state['synthetic_data'] = synthetic_data  # Store in session state
+        store_loss_data(synthetic_data)
     except ValueError as e:
         st.error(f"Error: {e}")
 
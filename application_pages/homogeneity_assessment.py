@@ -1,109 +1,37 @@
 
+import hashlib
+
 import streamlit as st
 import pandas as pd
-import numpy as np
-from scipy.stats import kstest
-import plotly.graph_objects as go
-import plotly.express as px
-
-# Re-define calculate_ks_distance here because it's used by create_ks_distance_matrix and assess_homogeneity
-def calculate_ks_distance(data1, data2):
-    """Calculates the Kolmogorov-Smirnov distance (D-statistic) between two datasets."""
-    data1 = np.sort(data1)
-    data2 = np.sort(data2)
-    n1 = len(data1)
-    n2 = len(data2)
-    if n1 == 0 or n2 == 0:
-        return 0.0  # Handle empty datasets
-    d = 0.0
-    i = 0
-    j = 0
-    while i < n1 and j < n2:
-        if data1[i] <= data2[j]:
-            cdf1 = (i + 1) / n1
-            cdf2 = j / n2
-            d = max(d, abs(cdf1 - cdf2))
-            i += 1
-        else:
-            cdf1 = i / n1
-            cdf2 = (j + 1) / n2
-            d = max(d, abs(cdf1 - cdf2))
-            j += 1
-    while i < n1:
-        cdf1 = (i + 1) / n1
-        cdf2 = 1
-        d = max(d, abs(cdf1 - cdf2))
-        i += 1
-    while j < n2:
-        cdf1 = 1
-        cdf2 = (j + 1) / n2
-        d = max(d, abs(cdf1 - cdf2))
-        j += 1
-    return d
-
-def assess_homogeneity(data):
-    """Evaluates homogeneity within each grouped UoM using KS test.
-    Args:
-        data: DataFrame with uom_id, loss_amount, grouped_uom_id.
-    Returns:
-        Dictionary of homogeneity metrics for each grouped_uom_id.
-    """
-    if not isinstance(data, pd.DataFrame):
-        raise TypeError("Input data must be a Pandas DataFrame.")
-    if data.empty:
-        return {}
-    if 'grouped_uom_id' not in data.columns:
-        raise KeyError("The 'grouped_uom_id' column is missing.")
-    if 'loss_amount' not in data.columns:
-        raise KeyError("The 'loss_amount' column is missing.")
-    if not pd.api.types.is_numeric_dtype(data['loss_amount']):
-        raise TypeError("The 'loss_amount' column must be numeric.")
-
-    grouped_data = data.groupby('grouped_uom_id')['loss_amount'].apply(list)
-    results = {}
-
-    for group_id, losses in grouped_data.items():
-        if len(losses) < 2:
-            results[group_id] = np.nan  # Not enough data for KS test
-            continue
-        ks_statistic, p_value = kstest(losses, 'norm', args=(np.mean(losses), np.std(losses)))
-        results[group_id] = ks_statistic
-    return results
-
-def plot_cdfs(data, grouped_uom_id_col='grouped_uom_id'):
-    """Plots Empirical CDFs of losses for each raw UoM within its grouped UoM."""
-    fig = go.Figure()
-    unique_grouped_uoms = data[grouped_uom_id_col].unique()
-
-    # Define a color-blind-friendly palette
-    colors = px.colors.qualitative.Plotly  # Or other suitable palette like D3, Safe, Pastel
-
-    for i, grouped_id in enumerate(unique_grouped_uoms):
-        group_data = data[data[grouped_uom_id_col] == grouped_id]
-        unique_raw_uoms_in_group = sorted(group_data['uom_id'].unique())
-
-        for j, raw_uom_id in enumerate(unique_raw_uoms_in_group):
-            losses = group_data[group_data['uom_id'] == raw_uom_id]['loss_amount'].values
-            if len(losses) > 1:
-                sorted_losses = np.sort(losses)
-                y_cdf = np.arange(1, len(sorted_losses) + 1) / len(sorted_losses)
-                # Assign a distinct color for each raw UoM within the group, cycling through colors
-                # Use a combination of group_id and raw_uom_id for consistent naming
-                trace_color = colors[(i * len(unique_raw_uoms_in_group) + j) % len(colors)]
-                fig.add_trace(go.Scatter(x=sorted_losses, y=y_cdf,
-                                          mode='lines',
-                                          name=f'Group {grouped_id} - Raw UoM {raw_uom_id}',
-                                          line=dict(color=trace_color),
-                                          hovertemplate=f"Raw UoM: {raw_uom_id}<br>Loss Amount: %{{x}}<br>CDF: %{{y:.2f}}<extra></extra>"))
-
-    fig.update_layout(title='Empirical CDFs of Losses per Grouped UoM',
-                      xaxis_title='Loss Amount',
-                      yaxis_title='CDF',
-                      legend_title='UoMs',
-                      hovermode='x unified',
-                      font=dict(size=12))  # Ensure font size >= 12 pt
-    return fig
+
+from uom_core.homogeneity import (
+    assess_homogeneity, assess_homogeneity_pvalues, assess_homogeneity_sketched, assess_within_group_distances
+)
+from uom_core.jobs import frame_digest
+from uom_core.plotting import plot_cdfs
+from application_pages.background import cached_digest, run_in_background, show_job
+from application_pages.data_generation import get_loss_index
+from application_pages.profiling import get_profiler
+
+def grouping_digest(grouping):
+    """Content hash of a grouping: the losses it groups and its group labels."""
+    digest = hashlib.blake2b(frame_digest(grouping.data, ['uom_id', 'loss_amount']).encode(), digest_size=16)
+    digest.update(grouping.labels.tobytes())
+    return digest.hexdigest()
+
+def ks_table(homogeneity_results):
+    return (
+        pd.DataFrame.from_dict(
+            homogeneity_results,
+            orient="index",
+            columns=["KS statistic"]
+        )
+        .sort_index()
+    )
+
 def run_homogeneity_assessment():
+    profiler = get_profiler()
+
     # ---------- Page title ----------
     st.header("Homogeneity Assessment")
 
@@ -123,14 +51,20 @@ def run_homogeneity_assessment():
     """)
 
     # ---------- Guard clause ----------
-    if 'grouped_data' not in st.session_state:
+    if 'grouping' not in st.session_state:
         st.info(
             "Please generate synthetic data on the **Data Generation** page and group UoMs "
             "on the **UoM Grouping** page first."
         )
         return
 
-    grouped_data = st.session_state['grouped_data']
+    # A view over the shared loss data plus the group labels; no columns are copied.
+    grouping = st.session_state['grouping']
+    grouped_data = grouping.frame()
+    # Out-of-core mode: rows are (UoM, event type) cells summarised by quantile sketches.
+    sketches = st.session_state.get('loss_sketches') if 'loss_amount' not in grouped_data.columns else None
+    # Sorted losses of the session's data, shared with the UoM Grouping page.
+    index = get_loss_index(grouping.data) if sketches is None else None
 
     # ---------- KS table ----------
     st.subheader("1. KS statistics by group")
@@ -142,26 +76,57 @@ def run_homogeneity_assessment():
       0.1 ≤ KS < 0.2 → acceptable  
       KS ≥ 0.2 → investigate outliers or consider re‑grouping
     """)
-    try:
-        homogeneity_results = assess_homogeneity(grouped_data)
+
+    def render_ks_table(homogeneity_results):
         if homogeneity_results:
-            ks_df = (
-                pd.DataFrame.from_dict(
-                    homogeneity_results,
-                    orient="index",
-                    columns=["KS statistic"]
-                )
-                .sort_index()
-            )
+            ks_df = ks_table(homogeneity_results)
+            if sketches is None and st.checkbox(
+                "Add bootstrap p-values",
+                help="Simulates normal samples of each group's size, fits and tests them like the "
+                     "group itself (Lilliefors), and reports how often their KS statistic is at least "
+                     "as large. Groups stop resampling once the answer at 5 % is clear."
+            ):
+                with profiler.span("bootstrap p-values"):
+                    ks_df["p-value"] = pd.Series(assess_homogeneity_pvalues(grouped_data, index=index))
             st.dataframe(ks_df)
         else:
             st.info(
                 "Not enough observations in some groups. "
                 "Each group must have at least two loss events for the KS test."
             )
+
+    try:
+        if sketches is None:
+            # Computed in the background: groups appear as they are scored, and a rerun with
+            # the same grouping picks up the running or finished job.
+            key = cached_digest(grouping, 'grouping', lambda: grouping_digest(grouping))
+            job = run_in_background("homogeneity", key, assess_homogeneity, grouped_data, index=index)
+            show_job(job, "KS statistics by group", render_ks_table,
+                     render_partial=lambda partial: st.dataframe(ks_table(dict(partial))))
+        else:
+            with profiler.span("KS table"):
+                homogeneity_results, error_bounds = assess_homogeneity_sketched(grouped_data, sketches)
+            st.caption(f"Approximate statistics from quantile sketches: each is within "
+                       f"{max(error_bounds.values(), default=0.0):.3g} of the exact value with 99% confidence.")
+            render_ks_table(homogeneity_results)
     except Exception as e:
         st.error(f"Error during homogeneity assessment: {e}")
 
+    if sketches is None and st.checkbox("Show pairwise KS distances between raw UoMs inside each group"):
+        st.markdown("""
+        For groups that merge several raw UoMs, this table lists the two-sample KS distance
+        between every pair of members. Large values point at the raw UoMs that break homogeneity.
+        """)
+        try:
+            with profiler.span("within-group KS distances"):
+                pair_distances = assess_within_group_distances(grouped_data, index=index)
+            if pair_distances.empty:
+                st.info("Every group contains a single raw UoM, so there are no pairs to compare.")
+            else:
+                st.dataframe(pair_distances.sort_values('ks_distance', ascending=False), hide_index=True)
+        except Exception as e:
+            st.error(f"Error computing within-group KS distances: {e}")
+
     # ---------- ECDF plot ----------
     st.subheader("2. Overlay of ECDFs inside each group")
     st.markdown(r"""
@@ -174,8 +139,10 @@ def run_homogeneity_assessment():
     Hover to see exact UoM and CDF values.
     """)
     try:
-        fig = plot_cdfs(grouped_data)
-        st.plotly_chart(fig, use_container_width=True)
+        with profiler.span("ECDF figure"):
+            fig = plot_cdfs(grouped_data, sketches=sketches, index=index)
+        with profiler.span("render ECDF figure"):
+            st.plotly_chart(fig, use_container_width=True)
     except Exception as e:
         st.error(f"Error plotting ECDFs: {e}")
 
@@ -0,0 +1,54 @@
+
+import streamlit as st
+
+from uom_core.profiling import Profiler
+
+def get_profiler():
+    """The profiler of the current session, created on first use (disabled)."""
+    if 'profiler' not in st.session_state:
+        st.session_state['profiler'] = Profiler()
+    return st.session_state['profiler']
+
+def profiling_controls():
+    """Sidebar switches for profiling; call before the page runs. Returns the panel container."""
+    profiler = get_profiler()
+    panel = st.sidebar.expander("Profiling")
+    with panel:
+        profiler.enabled = st.checkbox(
+            "Time each stage",
+            help="Records how long each stage of the page takes. Off by default; when off the "
+                 "instrumentation costs next to nothing."
+        )
+        profiler.trace_memory = st.checkbox(
+            "Trace memory (tracemalloc)",
+            disabled=not profiler.enabled,
+            help="Also records the memory allocated by each stage. Tracing slows the app down noticeably."
+        )
+    profiler.reset()
+    if profiler.enabled and profiler.trace_memory and not profiler.tracing_memory:
+        panel.caption("Another session is tracing memory; only one session can at a time.")
+    return panel
+
+def profiling_panel(panel):
+    """Fills the sidebar panel with the breakdown of this run and export buttons."""
+    profiler = get_profiler()
+    if not profiler.enabled:
+        return
+    with panel:
+        spans = profiler.summary()
+        if not spans:
+            st.caption("No stages ran on this page.")
+            return
+        st.dataframe(
+            [{'stage': ' ' * span['depth'] + span['name'],
+              'ms': round(span['duration_ms'], 1),
+              **({'Δ KiB': round(span['memory_delta_kib']), 'peak KiB': round(span['peak_kib'])}
+                 if 'peak_kib' in span else {})}
+             for span in spans],
+            hide_index=True
+        )
+        st.download_button("Download spans (JSON)", profiler.to_json(),
+                           file_name="uom_profile.json", mime="application/json")
+        st.download_button("Download trace events", profiler.to_trace_events(),
+                           file_name="uom_trace.json", mime="application/json",
+                           help="Open in chrome://tracing or https://ui.perfetto.dev.")
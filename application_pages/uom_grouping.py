@@ -1,75 +1,89 @@
 
 import streamlit as st
-import pandas as pd
 import numpy as np
-import plotly.express as px
-
-# Re-define calculate_ks_distance here because it's used by create_ks_distance_matrix
-def calculate_ks_distance(data1, data2):
-    """Calculates the Kolmogorov-Smirnov distance (D-statistic) between two datasets."""
-    data1 = np.sort(data1)
-    data2 = np.sort(data2)
-    n1 = len(data1)
-    n2 = len(data2)
-    if n1 == 0 or n2 == 0:
-        return 0.0  # Handle empty datasets
-    d = 0.0
-    i = 0
-    j = 0
-    while i < n1 and j < n2:
-        if data1[i] <= data2[j]:
-            cdf1 = (i + 1) / n1
-            cdf2 = j / n2
-            d = max(d, abs(cdf1 - cdf2))
-            i += 1
-        else:
-            cdf1 = i / n1
-            cdf2 = (j + 1) / n2
-            d = max(d, abs(cdf1 - cdf2))
-            j += 1
-    while i < n1:
-        cdf1 = (i + 1) / n1
-        cdf2 = 1
-        d = max(d, abs(cdf1 - cdf2))
-        i += 1
-    while j < n2:
-        cdf1 = 1
-        cdf2 = (j + 1) / n2
-        d = max(d, abs(cdf1 - cdf2))
-        j += 1
-    return d
-
-def group_uoms_by_business_knowledge(data, event_types_to_group):
-    """Groups UoMs based on business rules (event types)."""
-    data_copy = data.copy()  # Work on a copy to avoid modifying original data
-    data_copy['grouped_uom_id'] = data_copy['uom_id']  # Initialize with original uom_id
-
-    if event_types_to_group:
-        mask = data_copy['event_type'].isin(event_types_to_group)
-        if mask.any():  # Only group if there are matching event types
-            # Use a consistent ID for the grouped UoM, e.g., a hash of sorted event types
-            # Or simply assign a distinct, non-conflicting ID
-            # For simplicity, let's just make them all group 9999 if selected
-            data_copy.loc[mask, 'grouped_uom_id'] = 9999 # A distinct ID for combined group
-    return data_copy
-
-def create_ks_distance_matrix(data):
-    """Creates a symmetric matrix of KS distances between all raw UoMs."""
-    uom_ids = sorted(data['uom_id'].unique())
-    num_uoms = len(uom_ids)
-    ks_matrix = np.zeros((num_uoms, num_uoms))
-    uom_losses = {uid: data[data['uom_id'] == uid]['loss_amount'].values for uid in uom_ids}
-
-    for i in range(num_uoms):
-        for j in range(i, num_uoms):
-            uom_i_data = uom_losses[uom_ids[i]]
-            uom_j_data = uom_losses[uom_ids[j]]
-            distance = calculate_ks_distance(uom_i_data, uom_j_data)
-            ks_matrix[i, j] = distance
-            ks_matrix[j, i] = distance # Symmetric matrix
-    return pd.DataFrame(ks_matrix, index=[f"UoM {uid}" for uid in uom_ids], columns=[f"UoM {uid}" for uid in uom_ids])
+import os
+
+from uom_core.cache import KSMatrixCache
+from uom_core.clustering import as_distance, dominant_categories, seriation_order
+from uom_core.grouping import (
+    BUSINESS_GROUP_ID, GroupedLosses, business_group_labels, cluster_group_mapping,
+    create_ks_distance_matrix, create_ks_pvalue_matrix, create_sketch_ks_distance_matrix
+)
+from uom_core.plotting import HEATMAP_TEXT_MAX_SIDE, block_labels, plot_heatmap
+from uom_core.significance import DEFAULT_RESAMPLES
+from uom_core.sweep import LossCells, sweep_configurations, sweep_groupings
+from uom_core.jobs import frame_digest
+from application_pages.background import cached_digest, run_in_background, show_job, wait_for_job
+from application_pages.data_generation import get_loss_index
+from application_pages.profiling import get_profiler
+
+def clustering_controls(num_uoms):
+    """Sidebar widgets shared by the clustering strategies; returns (method, k)."""
+    algorithm = st.sidebar.radio(
+        "Clustering algorithm",
+        options=["Average linkage (hierarchical)", "K-medoids"],
+        help="K-means needs coordinates, so we cluster the KS distance matrix directly. "
+             "Average linkage builds the dendrogram once and cuts it for each K; "
+             "K-medoids picks K representative UoMs and starts from the previous solution."
+    )
+    k = st.sidebar.slider(
+        "Desired number of clusters (K)",
+        min_value=2,
+        max_value=num_uoms,
+        value=3
+    )
+    return ("kmedoids" if algorithm == "K-medoids" else "average"), k
+
+@st.cache_resource
+def get_ks_matrix_cache():
+    """KS matrix cache shared by all sessions; set UOM_KS_CACHE_DIR to keep it on disk."""
+    return KSMatrixCache(cache_dir=os.environ.get("UOM_KS_CACHE_DIR"))
+
+def ks_matrix_job(data, scaled=False, n_jobs=1):
+    """Background job computing the exact KS matrix of the raw UoMs, keyed by the losses' content."""
+    digest = cached_digest(data, 'ks_input', lambda: frame_digest(data, ['uom_id', 'loss_amount']))
+    return run_in_background(
+        "scaled KS matrix" if scaled else "KS matrix", (digest, n_jobs),
+        create_ks_distance_matrix, data, scaled=scaled, n_jobs=n_jobs, cache=get_ks_matrix_cache(),
+        index=get_loss_index(data)
+    )
+
+def raw_uom_ks_matrix(data, scaled=False, n_jobs=1):
+    """KS matrix of the raw UoMs: exact, or from the session's quantile sketches in sketch mode."""
+    sketches = st.session_state.get('loss_sketches')
+    if sketches is None or 'loss_amount' in data.columns:
+        return wait_for_job(ks_matrix_job(data, scaled=scaled, n_jobs=n_jobs), "KS distance matrix")
+    key = (id(sketches), scaled)
+    if st.session_state.get('sketch_ks_matrix', (None,))[0] != key:
+        st.session_state['sketch_ks_matrix'] = (key, *create_sketch_ks_distance_matrix(data, sketches, scaled))
+    _, ks_matrix, error = st.session_state['sketch_ks_matrix']
+    st.caption(f"Approximate distances from quantile sketches: each entry is within {error:.3g} "
+               "of the exact value with 99% confidence.")
+    return ks_matrix
+
+def render_heatmap(matrix, title, color_label, order=None, key="heatmap", **style):
+    """Draws a UoM matrix within a bounded size; aggregated heatmaps get a tile drill-down."""
+    fig, edges, labels = plot_heatmap(matrix.to_numpy(), matrix.index, title, color_label, order=order, **style)
+    st.plotly_chart(fig, use_container_width=True)
+    if len(edges) - 1 == len(matrix):
+        return
+    st.caption(f"{len(matrix):,} UoMs are shown as {len(edges) - 1} × {len(edges) - 1} blocks; each "
+               "cell is the mean over a block of UoMs. Pick a tile to see its UoMs one by one.")
+    tiles = block_labels(labels, edges)
+    rows, cols = st.columns(2)
+    i = rows.selectbox("Tile rows", options=range(len(tiles)), format_func=tiles.__getitem__, key=f"{key}_tile_rows")
+    j = cols.selectbox("Tile columns", options=range(len(tiles)), format_func=tiles.__getitem__, key=f"{key}_tile_cols")
+    rows_in, cols_in = slice(edges[i], edges[i + 1]), slice(edges[j], edges[j + 1])
+    ordered = matrix.to_numpy() if order is None else matrix.to_numpy()[np.ix_(order, order)]
+    tile, _, _ = plot_heatmap(ordered[rows_in, cols_in], labels[rows_in], f"{title}: tile {tiles[i]} × {tiles[j]}",
+                              color_label, column_labels=labels[cols_in], **style)
+    st.plotly_chart(tile, use_container_width=True)
 
 def run_uom_grouping():
+    import plotly.express as px  # only needed once the page renders
+
+    profiler = get_profiler()
+
     # ---------- Page title ----------
     st.header("UoM Grouping Strategy")
 
@@ -92,7 +106,14 @@ def run_uom_grouping():
         st.info("Please generate synthetic data on the **Data Generation** page first.")
         return
 
-    synthetic_data = st.session_state['synthetic_data'].copy()  # safety copy
+    # Shared and read-only: every strategy only labels its rows, so the session holds one copy.
+    synthetic_data = st.session_state['synthetic_data']
+
+    # Loaded files may lack event types; the strategies built on them are then unavailable.
+    has_event_types = 'event_type' in synthetic_data.columns
+    if not has_event_types:
+        st.warning("The loss data has no `event_type` column, so Business Knowledge Grouping, the "
+                   "Combined Approach and the scenario sweep are not available.")
 
     # ---------- Sidebar controls ----------
     st.sidebar.subheader("Step 1 – Choose a grouping strategy")
@@ -101,17 +122,27 @@ def run_uom_grouping():
         options=[
             "No Grouping (Raw UoMs)",
             "Business Knowledge Grouping",
-            "Statistical Clustering (K‑means) (Coming Soon)",
-            "Combined Approach (Coming Soon)"
+            "Statistical Clustering (KS distance)",
+            "Combined Approach (Business Override + Clustering)"
+        ] if has_event_types else [
+            "No Grouping (Raw UoMs)",
+            "Statistical Clustering (KS distance)"
         ],
         help="How should raw UoMs be merged into more homogeneous groups?"
     )
 
-    grouped_data = synthetic_data.copy()  # default: no grouping
+    with st.sidebar.expander("Performance"):
+        n_jobs = st.number_input(
+            "KS worker processes",
+            min_value=1,
+            value=os.cpu_count() or 1,
+            help="Processes used for the KS distance matrix. Small data sets are always computed "
+                 "in a single process because starting workers would cost more than it saves."
+        )
 
     # ---------- Strategy: none ----------
     if grouping_strategy == "No Grouping (Raw UoMs)":
-        grouped_data['grouped_uom_id'] = grouped_data['uom_id']
+        grouping = GroupedLosses(synthetic_data, synthetic_data['uom_id'].to_numpy(), name="Raw UoMs")
         st.success("Showing raw UoMs with **no** grouping. "
                    "Use this as a baseline for comparison.")
 
@@ -129,56 +160,99 @@ def run_uom_grouping():
             default=['Fraud', 'Error']
         )
 
-        grouped_data = group_uoms_by_business_knowledge(
-            synthetic_data,
-            event_types_to_group
-        )
+        with profiler.span("business grouping"):
+            grouping = GroupedLosses(
+                synthetic_data,
+                business_group_labels(synthetic_data, event_types_to_group),
+                name=f"Business ({', '.join(event_types_to_group) or 'none merged'})"
+            )
 
         st.info(
             f"Business override in action. "
             f"The selected event types **{', '.join(event_types_to_group)}** are now labelled "
-            f"`grouped_uom_id = 9999` so they can be analysed as one unit."
+            f"`grouped_uom_id = {BUSINESS_GROUP_ID}` so they can be analysed as one unit."
         )
 
-    # ---------- Strategy: future statistical clustering ----------
+    # ---------- Strategy: statistical clustering ----------
     elif grouping_strategy.startswith("Statistical Clustering"):
-        st.sidebar.slider(
-            "Desired number of clusters (K)",
-            min_value=2,
-            max_value=len(synthetic_data['uom_id'].unique()),
-            value=3
-        )
-        st.warning(
-            "Statistical clustering will group UoMs that *look* alike statistically "
-            "using KS distance as the similarity metric. "
-            "This feature is not yet implemented."
+        method, k = clustering_controls(synthetic_data['uom_id'].nunique())
+        with profiler.span("KS matrix"):
+            ks_matrix = raw_uom_ks_matrix(synthetic_data, n_jobs=int(n_jobs))
+        with profiler.span("clustering", method=method, k=k):
+            mapping, medoids = cluster_group_mapping(
+                np.sort(synthetic_data['uom_id'].unique()), ks_matrix, k,
+                method=method,
+                medoids=st.session_state.get('kmedoids_medoids')
+            )
+            grouping = GroupedLosses.from_mapping(synthetic_data, mapping, name=f"Clustering (K={k}, {method})")
+        if medoids is not None:
+            st.session_state['kmedoids_medoids'] = medoids
+        st.info(
+            f"Raw UoMs were clustered into **{len(grouping.group_ids)}** groups "
+            "by their KS distances. Each group is labelled with the smallest raw UoM id it contains."
         )
-        grouped_data['grouped_uom_id'] = grouped_data['uom_id']  # no change yet
 
-    # ---------- Strategy: future combined approach ----------
+    # ---------- Strategy: combined approach ----------
     elif grouping_strategy.startswith("Combined Approach"):
-        st.sidebar.checkbox(
+        apply_business_override = st.sidebar.checkbox(
             "Apply business override inside clustering",
-            help="Example: halve the KS distance for predefined categories so they are more likely to cluster."
+            value=True,
+            help="Halve the KS distance between UoMs of the predefined category so they are more likely to cluster."
         )
-        st.warning(
-            "The combined approach will let you blend domain knowledge with clustering by "
-            "adjusting distances before running K‑means. Not implemented yet."
+        override_categories = st.sidebar.multiselect(
+            "Predefined category (dominant event type of a UoM)",
+            options=['Fraud', 'Error', 'System Failure'],
+            default=['Fraud'],
+            disabled=not apply_business_override
         )
+        method, k = clustering_controls(synthetic_data['uom_id'].nunique())
 
         st.markdown(r"""
-        **Illustration of a distance adjustment**
+        **Distance adjustment applied before clustering**
 
         $$\tilde{d}_{ij} =
         \begin{cases}
-        \frac{1}{2}\, d_{ij} & \text{if both units belong to the predefined DPA category} \\
+        \frac{1}{2}\, d_{ij} & \text{if both units belong to the predefined category} \\
         d_{ij} & \text{otherwise}
         \end{cases}$$
 
         Cutting the distance in half makes the algorithm treat these pairs as *closer*,
-        increasing the chance they fall into the same cluster.
+        increasing the chance they fall into the same cluster. A UoM belongs to the category
+        when most of its loss events have one of the selected event types.
         """)
-        grouped_data['grouped_uom_id'] = grouped_data['uom_id']  # no change yet
+
+        with profiler.span("KS matrix"):
+            ks_matrix = raw_uom_ks_matrix(synthetic_data, n_jobs=int(n_jobs))
+        override_uoms = []
+        if apply_business_override and override_categories:
+            categories = dominant_categories(
+                synthetic_data, weights='n_events' if 'n_events' in synthetic_data.columns else None
+            )
+            override_uoms = categories.index[categories.isin(override_categories)]
+
+        # The adjusted matrix is rebuilt in the same buffer on every rerun.
+        buffer = st.session_state.get('override_buffer')
+        if buffer is None or buffer.shape != ks_matrix.shape:
+            buffer = np.empty(ks_matrix.shape)
+            st.session_state['override_buffer'] = buffer
+        with profiler.span("clustering", method=method, k=k, override_uoms=len(override_uoms)):
+            mapping, medoids = cluster_group_mapping(
+                np.sort(synthetic_data['uom_id'].unique()), ks_matrix, k,
+                method=method,
+                medoids=st.session_state.get('kmedoids_medoids'),
+                override_uoms=override_uoms,
+                buffer=buffer
+            )
+            override_label = ', '.join(override_categories) if apply_business_override else 'off'
+            grouping = GroupedLosses.from_mapping(
+                synthetic_data, mapping, name=f"Combined (K={k}, {method}, override: {override_label})"
+            )
+        if medoids is not None:
+            st.session_state['kmedoids_medoids'] = medoids
+        st.info(
+            f"**{len(override_uoms)}** UoMs fall in the predefined category. After the distance "
+            f"adjustment the raw UoMs form **{len(grouping.group_ids)}** groups."
+        )
 
     # ---------- Show grouped data ----------
     st.subheader("Preview of grouped data")
@@ -186,15 +260,16 @@ def run_uom_grouping():
     The table below shows the first few rows after applying your chosen strategy.
     Use it to verify that IDs changed as expected.
     """)
-    st.dataframe(grouped_data.head())
+    st.dataframe(grouping.head())
 
     st.markdown("""
     **Count of observations per `grouped_uom_id`**  
     A jump in the count for ID 9999 confirms that several raw UoMs were merged.
     """)
-    st.write(grouped_data['grouped_uom_id'].value_counts().sort_index())
+    # Sketch mode has one row per sketch, so its events are counted from n_events.
+    st.write(grouping.counts(weights='n_events' if 'n_events' in synthetic_data.columns else None))
 
-    st.session_state['grouped_data'] = grouped_data  # store result
+    st.session_state['grouping'] = grouping  # labels only; the data is shared
 
     # ---------- KS distance heat‑map ----------
     st.subheader("Similarity between raw UoMs (KS distance)")
@@ -210,25 +285,137 @@ def run_uom_grouping():
     * Zeros on the diagonal indicate each UoM compared with itself.  
     * Dark clusters imply candidates for grouping if you are following a data‑driven approach.
     """)
-    try:
-        ks_dist_matrix = create_ks_distance_matrix(synthetic_data)
-        fig = px.imshow(
-            ks_dist_matrix,
-            text_auto=".2f",
-            labels=dict(x="UoM ID", y="UoM ID", color="KS distance"),
-            x=ks_dist_matrix.columns,
-            y=ks_dist_matrix.index,
-            color_continuous_scale=px.colors.sequential.Viridis_r
-        )
-        fig.update_layout(
-            title_text="Kolmogorov–Smirnov Distance Matrix (raw UoMs)",
-            font=dict(size=12)
-        )
-        fig.update_xaxes(side="top")
-        st.plotly_chart(fig, use_container_width=True)
+    scaled = st.checkbox(
+        r"Scale distances by sample size ($d_{ij} = \frac{n_i n_j}{n_i+n_j} D_{ij}$)",
+        help="Weights each D-statistic by the sizes of the two samples, so that gaps backed by more data count for more."
+    )
+    seriate = st.checkbox(
+        "Order UoMs by similarity (seriation)",
+        value=synthetic_data['uom_id'].nunique() > HEATMAP_TEXT_MAX_SIDE,
+        help="Reorders the UoMs along the average-linkage dendrogram so that similar UoMs sit "
+             "next to each other and clusters show up as dark blocks on the diagonal."
+    )
+    order = None
+
+    def render_ks(ks_dist_matrix):
+        nonlocal order
+        if seriate:
+            with profiler.span("seriation"):
+                order = seriation_order(as_distance(ks_dist_matrix))
+        with profiler.span("heatmap figure"):
+            render_heatmap(
+                ks_dist_matrix,
+                title="Kolmogorov–Smirnov Distance Matrix (raw UoMs)",
+                color_label="Scaled KS distance" if scaled else "KS distance",
+                colorscale=px.colors.sequential.Viridis_r,
+                order=order,
+                key="ks"
+            )
 
+    try:
+        if 'loss_amount' not in synthetic_data.columns:  # sketch mode: fast, computed in place
+            with profiler.span("KS matrix (heatmap)", scaled=scaled):
+                render_ks(raw_uom_ks_matrix(synthetic_data, scaled=scaled, n_jobs=int(n_jobs)))
+        else:
+            # Computed in the background: the page stays responsive and shows rows as they finish.
+            job = ks_matrix_job(synthetic_data, scaled=scaled, n_jobs=int(n_jobs))
+            labels = np.array([f"UoM {uid}" for uid in np.sort(synthetic_data['uom_id'].unique())])
+
+            def render_partial(partial):
+                matrix = np.array(partial, dtype=np.float32)
+                matrix[job.done:, job.done:] = np.nan  # rows not computed yet
+                fig, _, _ = plot_heatmap(matrix, labels, "KS distances computed so far", "KS distance",
+                                         colorscale=px.colors.sequential.Viridis_r)
+                st.plotly_chart(fig, use_container_width=True)
+
+            show_job(job, "KS distance matrix", render_ks, render_partial=None if scaled else render_partial)
     except Exception as e:
         st.error(f"Could not compute or display KS matrix: {e}")
 
+    # ---------- Significance of the KS distances ----------
+    if 'loss_amount' in synthetic_data.columns and st.checkbox(
+        "Show permutation p-values",
+        help="The same D can be significant for large samples and noise for small ones. "
+             "The p-value is the share of random relabellings of the two pooled samples whose "
+             "KS distance is at least as large as the observed one."
+    ):
+        n_resamples = st.select_slider("Permutations per pair", options=[1_000, 5_000, 10_000, 50_000],
+                                       value=DEFAULT_RESAMPLES)
+        st.markdown(r"""
+        Pairs stop resampling as soon as their p-value is clearly above or below 5 %, so only
+        borderline pairs use every permutation. Small p-values (dark) mean the two UoMs are
+        unlikely to share one loss distribution.
+        """)
+        try:
+            with profiler.span("permutation p-values", n_resamples=n_resamples):
+                pvalue_matrix = create_ks_pvalue_matrix(synthetic_data, n_resamples=n_resamples, n_jobs=int(n_jobs),
+                                                        index=get_loss_index(synthetic_data))
+            render_heatmap(
+                pvalue_matrix,
+                title="Permutation p-values of the KS distance (raw UoMs)",
+                color_label="p-value",
+                colorscale=px.colors.sequential.Viridis,
+                zmin=0, zmax=1,
+                order=order,
+                key="pvalues",
+                text_format=".3f"
+            )
+        except Exception as e:
+            st.error(f"Could not compute KS p-values: {e}")
+
+    # ---------- Scenario sweep ----------
+    if 'loss_amount' in synthetic_data.columns and st.checkbox(
+        "Sweep grouping configurations",
+        help="Scores many configurations at once instead of trying them one by one in the sidebar.",
+        disabled=not has_event_types
+    ):
+        run_scenario_sweep(synthetic_data, int(n_jobs))
+
+def run_scenario_sweep(synthetic_data, n_jobs):
+    """Ranks business groupings of every event type subset and clusterings over a range of K."""
+    profiler = get_profiler()
+    st.subheader("Scenario sweep")
+    st.markdown(r"""
+    Every configuration below is scored with the per‑group KS statistic of the
+    **Homogeneity Assessment** page. Configurations are ranked by the KS statistic averaged
+    over groups weighted by their number of losses, so lower is more homogeneous.
+    A group that appears in several configurations is scored only once.
+    """)
+    num_uoms = synthetic_data['uom_id'].nunique()
+    event_types = sorted(synthetic_data['event_type'].dropna().unique())
+    k_range = st.slider("Range of K for clustering", min_value=2, max_value=max(num_uoms, 3),
+                        value=(2, min(num_uoms, 8)))
+    override_categories = st.multiselect(
+        "Predefined category for the override runs (empty: no override runs)",
+        options=event_types,
+        default=[category for category in ['Fraud'] if category in event_types]
+    )
+    configurations = sweep_configurations(event_types, range(k_range[0], k_range[1] + 1), override_categories)
+
+    # The cell buffer (split from the shared loss index) and the scores of groups seen so
+    # far are kept for this data set.
+    cached = st.session_state.get('sweep_cache')
+    if cached is None or cached[0] is not synthetic_data:
+        index = get_loss_index(synthetic_data)
+        with profiler.span("split loss cells"):
+            cached = (synthetic_data, LossCells(synthetic_data, index=index), {})
+        st.session_state['sweep_cache'] = cached
+    _, cells, scores = cached
+    try:
+        with profiler.span("KS matrix"):
+            ks_matrix = raw_uom_ks_matrix(synthetic_data, n_jobs=n_jobs)
+        with profiler.span("scenario sweep", configurations=len(configurations)):
+            summary, per_group = sweep_groupings(synthetic_data, configurations, ks_matrix, n_jobs=n_jobs,
+                                                 cells=cells, scores=scores)
+    except Exception as e:
+        st.error(f"Could not run the scenario sweep: {e}")
+        return
+    st.dataframe(summary.rename(columns={
+        'rank': "Rank", 'strategy': "Strategy", 'groups': "Groups", 'weighted_mean_ks': "Weighted mean KS",
+        'mean_ks': "Mean KS", 'max_ks': "Max KS"
+    }))
+    chosen = st.selectbox("Per-group KS statistics of", options=summary.index)
+    st.dataframe(per_group[per_group['configuration'] == chosen].drop(columns='configuration'), hide_index=True)
+
 if __name__ == "__main__":
     run_uom_grouping()
@@ -0,0 +1,442 @@
+"""Equivalence checks of the fast engines against their reference implementations.
+
+Each check builds small samples with and without ties and requires the optimised
+engine to reproduce the reference result exactly (or to the stated tolerance):
+
+    python benchmarks/check_equivalence.py
+
+The exit status is 1 when any check fails, so the script can gate a CI job next to
+``run_benchmarks.py --compare``.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import traceback
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uom_core.cache import KSMatrixCache  # noqa: E402
+from uom_core.data import (  # noqa: E402
+    SyntheticStream, draw_uom_parameters, iter_synthetic_chunks, write_synthetic_parquet
+)
+from uom_core.grouping import create_ks_distance_matrix, create_ks_pvalue_matrix  # noqa: E402
+from uom_core import homogeneity  # noqa: E402
+from uom_core.homogeneity import (  # noqa: E402
+    assess_homogeneity, assess_homogeneity_pvalues, assess_within_group_distances, group_samples,
+    normal_ks_statistics
+)
+from uom_core.index import LossIndex  # noqa: E402
+from uom_core.io import load_loss_data  # noqa: E402
+from uom_core.ks import SortedSamples, calculate_ks_distance, ks_distance_matrix, ks_distance_row  # noqa: E402
+from uom_core.parallel import ks_distance_matrix_parallel  # noqa: E402
+from uom_core.pipeline import group_losses  # noqa: E402
+from uom_core.plotting import ecdf_curves  # noqa: E402
+from uom_core.significance import ks_permutation_pvalues, normal_ks_pvalues  # noqa: E402
+from uom_core.sweep import LossCells, score_memberships, sweep_configurations, sweep_groupings  # noqa: E402
+
+
+def two_pointer_ks_distance(data1, data2):
+    """The original KS distance loop, kept as the reference of the vectorized engine.
+
+    On equal values the step of ``data1`` is taken before the step of ``data2``, so a
+    sample compared with itself has distance 1/n rather than 0.
+    """
+    data1 = np.sort(data1)
+    data2 = np.sort(data2)
+    n1 = len(data1)
+    n2 = len(data2)
+    if n1 == 0 or n2 == 0:
+        return 0.0
+    d = 0.0
+    i = 0
+    j = 0
+    while i < n1 and j < n2:
+        if data1[i] <= data2[j]:
+            d = max(d, abs((i + 1) / n1 - j / n2))
+            i += 1
+        else:
+            d = max(d, abs(i / n1 - (j + 1) / n2))
+            j += 1
+    while i < n1:
+        d = max(d, abs((i + 1) / n1 - 1))
+        i += 1
+    while j < n2:
+        d = max(d, abs(1 - (j + 1) / n2))
+        j += 1
+    return d
+
+
+def kstest_homogeneity(data):
+    """The original homogeneity loop: scipy's KS test of each group against its fitted normal."""
+    from scipy.stats import kstest
+
+    results = {}
+    for group_id, losses in data.groupby('grouped_uom_id')['loss_amount'].apply(list).items():
+        if len(losses) < 2:
+            results[group_id] = np.nan
+            continue
+        with np.errstate(invalid='ignore', divide='ignore'):  # constant groups give NaN
+            results[group_id] = kstest(losses, 'norm', args=(np.mean(losses), np.std(losses))).statistic
+    return results
+
+
+def reference_within_group_distances(data):
+    """Two-pointer distance of every pair of raw UoMs in a group, the lower uom_id first."""
+    rows = []
+    for group_id, group in data.groupby('grouped_uom_id', sort=True):
+        losses = {uid: uom['loss_amount'].to_numpy() for uid, uom in group.groupby('uom_id', sort=True)}
+        uids = list(losses)
+        rows += [(group_id, a, b, two_pointer_ks_distance(losses[a], losses[b]))
+                 for k, a in enumerate(uids) for b in uids[k + 1:]]
+    return pd.DataFrame(rows, columns=['grouped_uom_id', 'uom_id_1', 'uom_id_2', 'ks_distance'])
+
+
+def reference_matrix(samples):
+    """The original matrix loop: the upper triangle, mirrored.
+
+    With ties the two-pointer distance is not symmetric, so the mirror is part of the
+    reference behaviour.
+    """
+    matrix = np.zeros((len(samples), len(samples)))
+    for i in range(len(samples)):
+        for j in range(i, len(samples)):
+            matrix[i, j] = matrix[j, i] = two_pointer_ks_distance(samples[i], samples[j])
+    return matrix
+
+
+EVENT_TYPES = ['Error', 'Fraud', 'System Failure']
+
+
+def sample_sets(seed=0):
+    """Named lists of UoM samples: continuous, heavily tied, and of mixed (incl. tiny) sizes."""
+    rng = np.random.default_rng(seed)
+    continuous = [rng.lognormal(6 + 0.1 * k, 1.5, int(n)) for k, n in enumerate(rng.integers(20, 200, 12))]
+    tied = [rng.integers(0, 8, int(n)).astype(float) for n in rng.integers(5, 60, 12)]
+    mixed = [rng.lognormal(6, 1, 1), np.array([3.0, 3.0]), rng.integers(0, 3, 40).astype(float),
+             rng.lognormal(6, 1, 150), np.repeat(2.0, 7)]
+    return {'continuous': continuous, 'tied': tied, 'mixed sizes': mixed}
+
+
+def with_event_types(data, seed=2):
+    data['event_type'] = np.random.default_rng(seed).choice(EVENT_TYPES, len(data))
+    return data
+
+
+def as_frame(samples):
+    return pd.DataFrame({'uom_id': np.repeat(np.arange(len(samples)), [len(s) for s in samples]),
+                         'loss_amount': np.concatenate(samples)})
+
+
+def expect_equal(actual, expected, what, atol=0.0):
+    actual, expected = np.asarray(actual, dtype=float), np.asarray(expected, dtype=float)
+    if actual.shape != expected.shape:
+        raise AssertionError(f"{what}: shape {actual.shape} != {expected.shape}")
+    if not np.array_equal(np.isnan(actual), np.isnan(expected)):
+        raise AssertionError(f"{what}: NaN where the reference has a value, or the reverse")
+    error = np.abs(np.nan_to_num(actual) - np.nan_to_num(expected)).max(initial=0.0)
+    if error > atol:
+        raise AssertionError(f"{what}: differs from the reference by up to {error:.3g}")
+
+
+# ---------- KS engine ----------
+
+def check_ks_pair():
+    for name, samples in sample_sets().items():
+        for a in samples:
+            for b in samples:
+                expect_equal(calculate_ks_distance(a, b), two_pointer_ks_distance(a, b), f"{name} pair")
+                expect_equal(calculate_ks_distance(np.sort(a), np.sort(b), presorted=True),
+                             two_pointer_ks_distance(a, b), f"{name} presorted pair")
+
+
+def check_ks_matrix():
+    for name, samples in sample_sets().items():
+        sorted_samples = SortedSamples.from_frame(as_frame(samples))
+        expected = reference_matrix(samples)
+        expect_equal(ks_distance_matrix(sorted_samples), expected, f"{name} matrix")
+        # A row takes UoM i as the first sample; tiny blocks force every block boundary.
+        for i, a in enumerate(samples):
+            row = ks_distance_row(sorted_samples, i, np.arange(len(samples)), block_size=7)
+            expect_equal(row, [two_pointer_ks_distance(a, b) for b in samples], f"{name} row {i}")
+            row = ks_distance_row(sorted_samples, i, np.arange(len(samples)), block_size=7, first=False)
+            expect_equal(row, [two_pointer_ks_distance(b, a) for b in samples], f"{name} reversed row {i}")
+        # Tie convention: a sample against itself takes all steps of the first copy at each
+        # value first, so its distance is the largest multiplicity / n (1/n without ties).
+        multiplicity = [np.unique(a, return_counts=True)[1].max() for a in samples]
+        expect_equal(np.diag(expected), np.divide(multiplicity, sorted_samples.counts),
+                     f"{name} diagonal (tie convention)", atol=1e-12)
+
+
+def check_parallel_matrix():
+    """The process pool fills the same float32 values as the serial engine, for any tiling."""
+    for name, samples in sample_sets().items():
+        sorted_samples = SortedSamples.from_frame(as_frame(samples))
+        serial = ks_distance_matrix(sorted_samples)
+        for tile_size in (1, 3, len(samples)):
+            parallel = ks_distance_matrix_parallel(sorted_samples, n_jobs=2, tile_size=tile_size, min_work=0)
+            if parallel.dtype != np.float32:
+                raise AssertionError(f"{name} parallel matrix: dtype {parallel.dtype}, expected float32")
+            expect_equal(parallel, serial.astype(np.float32), f"{name} parallel matrix (tiles of {tile_size})")
+        scaled = ks_distance_matrix_parallel(sorted_samples, n_jobs=2, scaled=True, min_work=0)
+        expect_equal(scaled, ks_distance_matrix(sorted_samples, scaled=True), f"{name} scaled parallel matrix",
+                     atol=1e-5 * max(1.0, np.abs(scaled).max()))
+
+
+def cache_scenarios(samples, rng):
+    """(label, before, after) sample lists of the cache check."""
+    # One UoM changed, one dropped and one added.
+    changed = list(samples)
+    changed[1] = rng.lognormal(5, 1, 30)
+    changed = changed[:-1] + [rng.integers(0, 5, 25).astype(float)]
+    # Relabelled UoMs: cached pairs come back in the opposite order, plus one new UoM.
+    relabelled = samples[::-1] + [rng.integers(0, 5, 25).astype(float)]
+    # A UoM with the losses of another one; with ties its cached pairs must keep their order.
+    duplicated = list(samples) + [samples[0]]
+    return [('update', samples, changed), ('relabel', samples, relabelled),
+            ('duplicate', duplicated, duplicated + [rng.integers(0, 5, 25).astype(float)])]
+
+
+def check_cache_updates():
+    """Incremental cache updates equal a full recompute, whatever the cache has seen before."""
+    rng = np.random.default_rng(1)
+    for name, samples in sample_sets().items():
+        for scenario, before_samples, after_samples in cache_scenarios(samples, rng):
+            before = SortedSamples.from_frame(as_frame(before_samples))
+            after = SortedSamples.from_frame(as_frame(after_samples))
+            what = f"{name} cache {scenario}"
+            for n_jobs in (1, 2):
+                full = (ks_distance_matrix(after) if n_jobs == 1
+                        else ks_distance_matrix_parallel(after, n_jobs=n_jobs))
+                with tempfile.TemporaryDirectory() as cache_dir:
+                    cache = KSMatrixCache(cache_dir=cache_dir)
+                    cache.get_matrix(before, n_jobs=3 - n_jobs)  # an entry of the other dtype first
+                    cache.get_matrix(before, n_jobs=n_jobs)
+                    pairs = cache.stats['pairs_computed']
+                    incremental = cache.get_matrix(after, n_jobs=n_jobs)
+                    if (scenario == 'update' and cache.stats['pairs_computed'] - pairs
+                            >= len(after_samples) * (len(after_samples) + 1) // 2):
+                        raise AssertionError(f"{what} (n_jobs={n_jobs}): the update recomputed every pair")
+                    # A new cache warm-starts from the matrices saved on disk.
+                    from_disk = KSMatrixCache(cache_dir=cache_dir).get_matrix(after, n_jobs=n_jobs)
+                for label, matrix in (('incremental', incremental), ('from disk', from_disk)):
+                    if matrix.dtype != full.dtype:
+                        raise AssertionError(f"{what} {label} (n_jobs={n_jobs}): dtype {matrix.dtype}, "
+                                             f"expected {full.dtype}")
+                    expect_equal(matrix, full, f"{what} {label} (n_jobs={n_jobs})")
+
+
+# ---------- Homogeneity ----------
+
+def grouped_frame(samples):
+    """Frame of ``samples`` merged in pairs, with UoM 0 alone (size-1 and constant groups included)."""
+    data = as_frame(samples)
+    data['grouped_uom_id'] = np.where(data['uom_id'] == 0, -1, data['uom_id'] // 2)
+    return data
+
+
+def check_homogeneity():
+    """The segment engine reproduces scipy.stats.kstest per group, NaN rule included."""
+    for name, samples in sample_sets().items():
+        data = grouped_frame(samples)
+        expected = kstest_homogeneity(data)
+        actual = assess_homogeneity(data)
+        expect_equal(list(actual), list(expected), f"{name} homogeneity groups")
+        expect_equal(list(actual.values()), list(expected.values()), f"{name} homogeneity", atol=1e-12)
+        # Chunked progress reporting splits the buffer between groups; the values must not change.
+        chunk, homogeneity.PROGRESS_CHUNK = homogeneity.PROGRESS_CHUNK, 50
+        try:
+            chunked = assess_homogeneity(data, progress=lambda done, total, partial: None)
+        finally:
+            homogeneity.PROGRESS_CHUNK = chunk
+        expect_equal(list(chunked.values()), list(actual.values()), f"{name} homogeneity in chunks")
+
+        actual = assess_within_group_distances(data)
+        expected = reference_within_group_distances(data)
+        for column in expected.columns:
+            expect_equal(actual[column], expected[column], f"{name} within-group {column}")
+
+
+# ---------- Significance ----------
+
+def check_significance():
+    """Resampled p-values do not depend on the worker count, and their statistics are the engine's."""
+    for name, samples in sample_sets().items():
+        data = grouped_frame(samples)
+        uoms = SortedSamples.from_frame(data)
+        pairs = np.column_stack(np.triu_indices(len(samples), k=1))
+        statistics, pvalues, used = ks_permutation_pvalues(uoms, pairs, n_resamples=300, seed=4)
+        expect_equal(statistics, [two_pointer_ks_distance(samples[i], samples[j]) for i, j in pairs],
+                     f"{name} permutation statistics", atol=1e-12)
+        _, parallel_pvalues, parallel_used = ks_permutation_pvalues(uoms, pairs, n_resamples=300, seed=4, n_jobs=2)
+        expect_equal(parallel_pvalues, pvalues, f"{name} permutation p-values (n_jobs=2)")
+        expect_equal(parallel_used, used, f"{name} permutation replicates (n_jobs=2)")
+
+        groups = SortedSamples.from_frame(data, key='grouped_uom_id')
+        statistics = normal_ks_statistics(groups)
+        serial = normal_ks_pvalues(groups, statistics, n_resamples=300, seed=5)
+        parallel = normal_ks_pvalues(groups, statistics, n_resamples=300, seed=5, n_jobs=2)
+        for part, actual, expected in zip(('p-values', 'replicates'), parallel, serial):
+            expect_equal(actual, expected, f"{name} bootstrap {part} (n_jobs=2)")
+
+        # The indexed paths resample the same sorted samples as the frame-based ones.
+        index = LossIndex(data)
+        expected = assess_homogeneity_pvalues(data, n_resamples=300, seed=6)
+        actual = assess_homogeneity_pvalues(data, n_resamples=300, seed=6, index=index)
+        expect_equal(list(actual.values()), list(expected.values()), f"{name} indexed group p-values")
+        expect_equal(create_ks_pvalue_matrix(data, n_resamples=300, seed=7, index=index),
+                     create_ks_pvalue_matrix(data, n_resamples=300, seed=7), f"{name} indexed p-value matrix")
+
+
+# ---------- Synthetic stream ----------
+
+def check_synthetic_stream():
+    """Streamed data depends on the parameters, chunk size and seed only, not on the workers."""
+    parameters = draw_uom_parameters(7, (50, 400), (5.0, 7.0), (1.0, 2.0), seed=8)
+    stream = SyntheticStream(parameters, chunk_rows=250, seed=9)
+    expected = pd.concat([stream.chunk(index) for index in range(len(stream))], ignore_index=True)
+    if len(expected) != stream.n_events:
+        raise AssertionError(f"synthetic stream: {len(expected)} rows, expected {stream.n_events}")
+    counts = expected['uom_id'].value_counts().reindex(parameters.index, fill_value=0)
+    expect_equal(counts, parameters['n_events'], "synthetic stream events per UoM")
+
+    reversed_order = [stream.chunk(index) for index in reversed(range(len(stream)))][::-1]
+    if not pd.concat(reversed_order, ignore_index=True).equals(expected):
+        raise AssertionError("synthetic stream: chunks depend on the order they are generated in")
+    if not pd.concat(iter_synthetic_chunks(stream, n_jobs=2), ignore_index=True).equals(expected):
+        raise AssertionError("synthetic stream: chunks from two workers differ")
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_synthetic_parquet(stream, directory, n_jobs=2)
+        written = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+        loaded = load_loss_data(directory)
+    if not written.equals(expected):
+        raise AssertionError("synthetic stream: Parquet files written by two workers differ")
+    if len(loaded) != len(expected):
+        raise AssertionError("synthetic stream: the Parquet directory does not load back whole")
+
+
+# ---------- Scenario sweep ----------
+
+def check_sweep():
+    """Sweep scores equal the homogeneity statistic of each grouped frame, for any worker count."""
+    rng = np.random.default_rng(10)
+    for name, samples in sample_sets().items():
+        data = with_event_types(as_frame(samples))
+        ks_matrix = create_ks_distance_matrix(data)
+        configurations = sweep_configurations(EVENT_TYPES, range(2, len(samples)), ['Fraud'])
+        summary, per_group = sweep_groupings(data, configurations, ks_matrix)
+        for configuration in configurations:
+            options = {'event_types': configuration.get('event_types'), 'k': configuration.get('k', 3),
+                       'override_categories': configuration.get('override_categories')}
+            grouped = group_losses(data, configuration['strategy'], ks_matrix, **options).frame()
+            expected = assess_homogeneity(grouped)
+            actual = per_group[per_group['configuration'] == configuration['name']]
+            what = f"{name} sweep '{configuration['name']}'"
+            expect_equal(actual['grouped_uom_id'], list(expected), f"{what} groups")
+            expect_equal(actual['ks_statistic'], list(expected.values()), f"{what} statistics")
+            expect_equal(actual['n_events'], grouped['grouped_uom_id'].value_counts().sort_index(), f"{what} sizes")
+
+        # Enough memberships for several pool tasks, so the parallel path really runs.
+        cells = LossCells(data)
+        memberships = list(dict.fromkeys(
+            tuple(sorted(rng.choice(len(cells), size=rng.integers(1, len(cells) + 1), replace=False)))
+            for _ in range(200)))
+        expect_equal(score_memberships(cells.samples, memberships, n_jobs=2, min_work=0),
+                     score_memberships(cells.samples, memberships), f"{name} sweep scores (n_jobs=2)")
+        parallel_summary, parallel_per_group = sweep_groupings(data, configurations, ks_matrix, n_jobs=2)
+        if not (parallel_summary.equals(summary) and parallel_per_group.equals(per_group)):
+            raise AssertionError(f"{name} sweep results differ with n_jobs=2")
+
+
+# ---------- Loss index ----------
+
+def expect_same_samples(actual, expected, what):
+    expect_equal(actual.ids, expected.ids, f"{what} ids")
+    expect_equal(actual.offsets, expected.offsets, f"{what} offsets")
+    expect_equal(actual.values, expected.values, f"{what} values")
+
+
+def check_indexed_paths():
+    """Every computation reads the same sorted samples from a LossIndex as from the frame."""
+    for name, samples in sample_sets().items():
+        # Shuffled rows, so the index has to reorder them.
+        data = with_event_types(as_frame(samples).sample(frac=1.0, random_state=3, ignore_index=True))
+        data['grouped_uom_id'] = data['uom_id'] // 2
+        index = LossIndex(data)
+
+        expect_same_samples(index.uoms, SortedSamples.from_frame(data), f"{name} index")
+        for actual, expected, part in zip(index.group_samples(data['grouped_uom_id'].to_numpy()),
+                                          group_samples(data), ('groups', 'cells', 'cell offsets')):
+            if part == 'cell offsets':
+                expect_equal(actual, expected, f"{name} {part}")
+            else:
+                expect_same_samples(actual, expected, f"{name} {part}")
+        for scaled in (False, True):
+            expect_equal(create_ks_distance_matrix(data, scaled=scaled, index=index),
+                         create_ks_distance_matrix(data, scaled=scaled), f"{name} KS matrix (scaled={scaled})")
+
+        expected = assess_homogeneity(data)
+        actual = assess_homogeneity(data, index=index)
+        expect_equal(list(actual), list(expected), f"{name} homogeneity groups")
+        expect_equal(list(actual.values()), list(expected.values()), f"{name} homogeneity")
+        if not assess_within_group_distances(data, index=index).equals(assess_within_group_distances(data)):
+            raise AssertionError(f"{name} within-group distances differ")
+        for (group, members), (expected_group, expected_members) in zip(ecdf_curves(data, index=index),
+                                                                         ecdf_curves(data), strict=True):
+            expect_equal([group] + [uid for uid, _, _ in members],
+                         [expected_group] + [uid for uid, _, _ in expected_members], f"{name} ECDF ids")
+            for (_, x, y), (_, expected_x, expected_y) in zip(members, expected_members):
+                expect_equal(np.concatenate([x, y]), np.concatenate([expected_x, expected_y]), f"{name} ECDF")
+
+        cells, expected_cells = LossCells(data, index=index), LossCells(data)
+        expect_same_samples(cells.samples, expected_cells.samples, f"{name} sweep cells")
+        if (not np.array_equal(cells.uom_ids, expected_cells.uom_ids)
+                or not np.array_equal(cells.event_types, expected_cells.event_types)
+                or cells.uom_cells != expected_cells.uom_cells):
+            raise AssertionError(f"{name} sweep cells: different cell keys")
+        configurations = sweep_configurations(EVENT_TYPES, range(2, len(samples)), ['Fraud'])
+        ks_matrix = create_ks_distance_matrix(data)
+        for actual, expected in zip(sweep_groupings(data, configurations, ks_matrix, index=index),
+                                    sweep_groupings(data, configurations, ks_matrix)):
+            if not actual.equals(expected):
+                raise AssertionError(f"{name} sweep results differ")
+
+
+CHECKS = {
+    'ks pair': check_ks_pair,
+    'ks matrix': check_ks_matrix,
+    'parallel matrix': check_parallel_matrix,
+    'cache updates': check_cache_updates,
+    'homogeneity': check_homogeneity,
+    'significance': check_significance,
+    'synthetic stream': check_synthetic_stream,
+    'sweep': check_sweep,
+    'indexed paths': check_indexed_paths,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('checks', nargs='*', metavar='CHECK',
+                        help=f"Checks to run (default: all): {', '.join(CHECKS)}.")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(unknown)}")
+    failed = 0
+    for name in args.checks or CHECKS:
+        try:
+            CHECKS[name]()
+            print(f"PASS  {name}")
+        except Exception:
+            failed += 1
+            print(f"FAIL  {name}")
+            traceback.print_exc()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""Scaling benchmarks for the data-generation, KS and homogeneity hot paths.
+
+Sweeps the number of UoMs and loss events per UoM well beyond the app's slider limits,
+records the best wall time and the peak traced memory of each case, and can save the
+results as a baseline or compare them against one:
+
+    python benchmarks/run_benchmarks.py --profile quick --save benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --profile quick --compare benchmarks/baseline.json
+
+With ``--compare`` the exit status is 1 when any case got slower (or used more memory)
+than the baseline by more than ``--threshold``, so the script can gate a CI job.
+Baselines are machine specific; record them on the machine that runs the gate.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uom_core.data import generate_synthetic_data  # noqa: E402
+from uom_core.grouping import create_ks_distance_matrix, group_uoms_by_business_knowledge  # noqa: E402
+from uom_core.homogeneity import assess_homogeneity  # noqa: E402
+from uom_core.ks import calculate_ks_distance  # noqa: E402
+
+# The app's sliders stop at 20 UoMs and 1,000 events per UoM. KS matrix cases with more
+# than ``max_matrix_work`` pairs x events are skipped to keep a run within minutes.
+PROFILES = {
+    'quick': {'uoms': [20, 100, 200], 'events': [1_000, 10_000], 'max_matrix_work': 100_000_000},
+    'full': {'uoms': [20, 100, 500, 2_000], 'events': [1_000, 10_000, 100_000], 'max_matrix_work': 1_000_000_000},
+}
+# Data sets with more loss rows than this are skipped.
+MAX_ROWS = 20_000_000
+# Cases faster than this are repeated and the best time kept.
+MIN_SECONDS = 0.2
+MAX_REPEATS = 5
+# Time differences below this are treated as noise by the regression gate.
+NOISE_SECONDS = 0.005
+
+
+def _data(num_uoms, events):
+    return generate_synthetic_data(num_uoms, events, (5.0, 7.0), (1.0, 2.0), random_state=0)
+
+
+def _grouped(num_uoms, events):
+    return group_uoms_by_business_knowledge(_data(num_uoms, events), ['Fraud', 'Error'])
+
+
+# Each setup builds its inputs outside the timed region and returns the callable to time.
+def bench_generate(num_uoms, events):
+    return lambda: _data(num_uoms, events)
+
+
+def bench_ks_pair(num_uoms, events):
+    rng = np.random.default_rng(0)
+    a, b = rng.lognormal(6, 1.5, events), rng.lognormal(6.2, 1.4, events)
+    return lambda: calculate_ks_distance(a, b)
+
+
+def bench_ks_matrix(num_uoms, events):
+    data = _data(num_uoms, events)
+    return lambda: create_ks_distance_matrix(data)
+
+
+def bench_business_grouping(num_uoms, events):
+    data = _data(num_uoms, events)
+    return lambda: group_uoms_by_business_knowledge(data, ['Fraud', 'Error'])
+
+
+def bench_homogeneity(num_uoms, events):
+    grouped = _grouped(num_uoms, events)
+    return lambda: assess_homogeneity(grouped)
+
+
+def bench_plot_cdfs(num_uoms, events):
+    from uom_core.plotting import plot_cdfs
+
+    grouped = _grouped(num_uoms, events)
+    return lambda: plot_cdfs(grouped)
+
+
+def _fits(num_uoms, events, grid):
+    return num_uoms * events <= MAX_ROWS
+
+
+# name -> (setup, whether a (num_uoms, events, profile grid) case is run)
+BENCHMARKS = {
+    'generate_synthetic_data': (bench_generate, _fits),
+    # A single pair, so only the events axis is swept.
+    'calculate_ks_distance': (bench_ks_pair, lambda num_uoms, events, grid: num_uoms == grid['uoms'][0]),
+    'create_ks_distance_matrix': (
+        bench_ks_matrix,
+        lambda num_uoms, events, grid: num_uoms * num_uoms / 2 * events <= grid['max_matrix_work']),
+    'group_uoms_by_business_knowledge': (bench_business_grouping, _fits),
+    'assess_homogeneity': (bench_homogeneity, _fits),
+    'plot_cdfs': (bench_plot_cdfs, _fits),
+}
+
+
+def measure(func):
+    """Best wall time over up to ``MAX_REPEATS`` runs, and peak traced memory of one run, in MiB."""
+    times = []
+    while not times or (sum(times) < MIN_SECONDS and len(times) < MAX_REPEATS):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak / 2**20
+
+
+def run(profile, only=None):
+    grid = PROFILES[profile]
+    results = []
+    for name, (setup, accept) in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        for num_uoms in grid['uoms']:
+            for events in grid['events']:
+                if not accept(num_uoms, events, grid):
+                    continue
+                seconds, peak_mib = measure(setup(num_uoms, events))
+                results.append({'benchmark': name, 'num_uoms': num_uoms, 'events_per_uom': events,
+                                'seconds': seconds, 'peak_mib': peak_mib})
+                print(f"{name:34s} uoms={num_uoms:<6d} events={events:<8d} "
+                      f"{seconds * 1000:10.1f} ms {peak_mib:10.1f} MiB", flush=True)
+    return results
+
+
+def environment():
+    import pandas as pd
+
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'machine': platform.machine(), 'processor': platform.processor(), 'cpu_count': os.cpu_count()}
+
+
+def compare(results, baseline, threshold):
+    """Prints the ratio to the baseline of each case; returns the cases beyond ``threshold``."""
+    key = lambda r: (r['benchmark'], r['num_uoms'], r['events_per_uom'])  # noqa: E731
+    previous = {key(r): r for r in baseline['results']}
+    regressions = []
+    print(f"\n{'benchmark':34s} {'uoms':>6s} {'events':>8s} {'time x':>8s} {'memory x':>9s}")
+    for r in results:
+        old = previous.get(key(r))
+        if old is None:
+            continue
+        time_ratio = r['seconds'] / max(old['seconds'], 1e-9)
+        memory_ratio = r['peak_mib'] / max(old['peak_mib'], 1e-9)
+        slower = time_ratio > 1 + threshold and r['seconds'] - old['seconds'] > NOISE_SECONDS
+        larger = memory_ratio > 1 + threshold and r['peak_mib'] - old['peak_mib'] > 1.0
+        flag = '  REGRESSION' if slower or larger else ''
+        print(f"{r['benchmark']:34s} {r['num_uoms']:6d} {r['events_per_uom']:8d} "
+              f"{time_ratio:8.2f} {memory_ratio:9.2f}{flag}")
+        if flag:
+            regressions.append(r)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick')
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS), help="Run only these benchmarks.")
+    parser.add_argument('--save', metavar='PATH', help="Write the results as a baseline JSON file.")
+    parser.add_argument('--compare', metavar='PATH', help="Baseline JSON file to compare against.")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Allowed relative slowdown or memory growth before failing (default 0.25).")
+    args = parser.parse_args(argv)
+
+    results = run(args.profile, args.only)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'profile': args.profile, 'environment': environment(), 'results': results}, f, indent=2)
+        print(f"Saved {len(results)} results to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} case(s) regressed by more than {args.threshold:.0%}.")
+            return 1
+        print("No regressions.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
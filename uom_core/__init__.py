@@ -0,0 +1 @@
+"""UI-free computational core for the UoM Homogeneity & Clustering Explorer."""
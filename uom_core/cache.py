@@ -0,0 +1,198 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from uom_core.ks import ks_distance_matrix, ks_distance_row, scale_factors
+from uom_core.parallel import ks_distance_matrix_parallel
+
+
+def sample_hashes(samples):
+    """Content hash of every UoM's sorted losses, independent of row order in the source."""
+    return [hashlib.blake2b(samples.sample(k).tobytes(), digest_size=16).hexdigest()
+            for k in range(len(samples))]
+
+
+def _entry_key(hashes, dtype):
+    return hashlib.blake2b((''.join(hashes) + np.dtype(dtype).str).encode(), digest_size=16).hexdigest()
+
+
+def matrix_dtype(n_jobs):
+    """dtype of the raw matrix for ``n_jobs``: float64 serially, float32 from the process pool."""
+    return np.dtype(np.float64 if n_jobs == 1 else np.float32)
+
+
+class KSMatrixCache:
+    """LRU cache of raw KS distance matrices keyed by per-UoM content hashes.
+
+    A request whose UoMs were all seen before is a hit. Otherwise the cached matrix
+    sharing the most UoMs is reused and only the rows and columns of new or changed
+    UoMs are computed, which costs O(U) pairs per changed UoM instead of O(U^2). Cached
+    pairs whose UoMs swapped order are computed again, since with ties the distance
+    depends on which sample comes first.
+    Entries are kept per dtype (see :func:`matrix_dtype`), so a result never depends on
+    which requests came before it. The cache is shared between threads; matrices are
+    computed outside its lock, so a miss never holds up hits of other callers.
+
+    Args:
+        max_bytes: Memory bound for the cached matrices; least recently used ones are evicted.
+        cache_dir: Optional directory where matrices are also saved as ``.npz`` so that
+            later sessions can start from them.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()  # key -> (hashes, matrix)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'pairs_computed': 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def nbytes(self):
+        return sum(matrix.nbytes for _, matrix in self._entries.values())
+
+    def get_matrix(self, samples, scaled=False, n_jobs=1, progress=None):
+        """KS distance matrix for ``samples``, reusing cached rows wherever possible.
+
+        The returned array is read-only because it may be shared with the cache. It is
+        float64 for ``n_jobs=1`` and float32 otherwise, as without the cache.
+        ``progress(done, total, partial)`` reports computed rows (or tiles); see
+        :func:`uom_core.ks.ks_distance_matrix`.
+        """
+        hashes = sample_hashes(samples)
+        dtype = matrix_dtype(n_jobs)
+        key = _entry_key(hashes, dtype)
+        with self._lock:
+            entry = self._entries.get(key)
+            base = None if entry is not None else self._closest(hashes, dtype)
+        if entry is None:
+            entry = self._load(key)
+        if entry is not None:
+            with self._lock:
+                self.stats['hits'] += 1
+                self._store(key, entry)
+            matrix = entry[1]
+        else:
+            if base is None and self.cache_dir:
+                base = self._latest_on_disk(dtype)
+            # Two callers missing on the same key both compute it; the later store wins.
+            matrix, pairs = self._compute(samples, hashes, dtype, base, n_jobs, progress)
+            matrix.setflags(write=False)
+            with self._lock:
+                self.stats['misses'] += 1
+                self.stats['pairs_computed'] += pairs
+                self._store(key, (hashes, matrix))
+            self._save(key, hashes, matrix)
+        if scaled:
+            return matrix * scale_factors(samples.counts).astype(matrix.dtype)
+        return matrix
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _compute(self, samples, hashes, dtype, base, n_jobs, progress=None):
+        """Matrix for ``hashes`` from the ``base`` (hashes, matrix) entry, or from scratch.
+
+        Returns:
+            Tuple of (matrix, number of pairs computed).
+        """
+        num_uoms = len(hashes)
+        base_hashes, base = base if base is not None else ([], None)
+        base_index = {h: k for k, h in enumerate(base_hashes)}
+        known = np.array([h in base_index for h in hashes], dtype=bool)
+        if not known.any():
+            pairs = num_uoms * (num_uoms + 1) // 2
+            if n_jobs == 1:
+                return ks_distance_matrix(samples, progress=progress), pairs
+            return ks_distance_matrix_parallel(samples, n_jobs=n_jobs, progress=progress), pairs
+
+        matrix = np.empty((num_uoms, num_uoms), dtype=dtype)
+        new_pos = np.flatnonzero(known)
+        old_pos = np.array([base_index[hashes[k]] for k in new_pos])
+        matrix[np.ix_(new_pos, new_pos)] = base[np.ix_(old_pos, old_pos)]
+        pairs = 0
+
+        # With ties the distance depends on which sample is first (the lower index), so a
+        # cached pair whose two UoMs now come in the opposite order is computed again. This
+        # happens when UoMs are relabelled or when several UoMs have the same losses.
+        if (np.diff(old_pos) < 0).any():
+            for k in range(len(new_pos) - 1):
+                flipped = new_pos[k + 1:][old_pos[k + 1:] < old_pos[k]]
+                if len(flipped):
+                    row = ks_distance_row(samples, new_pos[k], flipped, first=True)
+                    matrix[new_pos[k], flipped] = row
+                    matrix[flipped, new_pos[k]] = row
+                    pairs += len(flipped)
+
+        # Each changed UoM needs one row against every UoM; later changed rows skip the
+        # columns already filled by earlier ones. As in the full matrix, the lower index
+        # of each pair is the first sample, which matters for ties.
+        changed = np.flatnonzero(~known)
+        done = known.copy()
+        for step, i in enumerate(changed, 1):
+            done[i] = True
+            cols = np.flatnonzero(done)
+            lower, upper = cols[cols < i], cols[cols >= i]
+            for part, first in ((lower, False), (upper, True)):
+                row = ks_distance_row(samples, i, part, first=first)
+                matrix[i, part] = row
+                matrix[part, i] = row
+            pairs += len(cols)
+            if progress is not None:
+                progress(step, len(changed), None)
+        return matrix, pairs
+
+    def _closest(self, hashes, dtype):
+        """Cached (hashes, matrix) of ``dtype`` sharing the most UoMs with ``hashes``, or None."""
+        wanted = set(hashes)
+        best, best_overlap = None, 0
+        for entry_hashes, matrix in self._entries.values():
+            if matrix.dtype != dtype:
+                continue
+            overlap = len(wanted.intersection(entry_hashes))
+            if overlap > best_overlap:
+                best, best_overlap = (entry_hashes, matrix), overlap
+        return best
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > 1 and self.nbytes > self.max_bytes:
+            self._entries.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"ks_{key}.npz")
+
+    def _save(self, key, hashes, matrix):
+        if not self.cache_dir:
+            return
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, hashes=np.array(hashes), matrix=matrix)
+        os.replace(tmp_path, self._path(key))
+
+    def _load(self, key):
+        if not self.cache_dir or not os.path.exists(self._path(key)):
+            return None
+        return self._read(self._path(key))
+
+    def _latest_on_disk(self, dtype):
+        paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                 if name.startswith('ks_') and name.endswith('.npz')]
+        for path in sorted(paths, key=os.path.getmtime, reverse=True):
+            entry = self._read(path)
+            if entry[1].dtype == dtype:
+                return entry
+        return None
+
+    @staticmethod
+    def _read(path):
+        with np.load(path) as stored:
+            matrix = stored['matrix']
+            matrix.setflags(write=False)
+            return [str(h) for h in stored['hashes']], matrix
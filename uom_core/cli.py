@@ -0,0 +1,174 @@
+"""Command-line entry point: ``python -m uom_core {generate,stream,run,sweep} ...``.
+
+Runs data generation, grouping, homogeneity assessment and capital estimation on files without Streamlit,
+for batch jobs. Only numpy, pandas and (when needed) scipy/pyarrow are imported.
+"""
+import argparse
+import os
+import sys
+import time
+
+
+def load_input(path):
+    """Reads a loss data file: Parquet/Arrow through :mod:`uom_core.io`, or CSV."""
+    import pandas as pd
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Loss data file '{path}' does not exist.")
+    if path.lower().endswith('.csv'):
+        return pd.read_csv(path, dtype={'event_type': 'category', 'business_line': 'category'})
+    from uom_core.io import load_loss_data
+
+    return load_loss_data(path)
+
+
+def write_output(data, path):
+    if path.lower().endswith('.csv'):
+        data.to_csv(path, index=False)
+    else:
+        data.to_parquet(path, index=False)
+
+
+def _generate(args):
+    from uom_core.data import generate_synthetic_data
+
+    data = generate_synthetic_data(args.num_uoms, args.events_per_uom, tuple(args.severity_mean),
+                                   tuple(args.severity_std), random_state=args.seed)
+    write_output(data, args.output)
+    print(f"Wrote {len(data):,} loss events for {args.num_uoms} UoMs to {args.output}")
+
+
+def _stream(args):
+    from uom_core.data import SyntheticStream, draw_uom_parameters, write_synthetic_parquet
+
+    started = time.perf_counter()
+    parameters = draw_uom_parameters(args.num_uoms, tuple(args.annual_frequency), tuple(args.severity_mean),
+                                     tuple(args.severity_std), years=args.years, seed=args.seed)
+    stream = SyntheticStream(parameters, chunk_rows=args.chunk_rows, seed=args.seed, years=args.years)
+    paths = write_synthetic_parquet(stream, args.output_dir, n_jobs=args.n_jobs)
+    elapsed = time.perf_counter() - started
+    size = sum(os.path.getsize(path) for path in paths) / 2**20
+    print(f"Wrote {stream.n_events:,} loss events for {args.num_uoms} UoMs to {len(paths)} files in "
+          f"{args.output_dir} ({size:,.0f} MiB) in {elapsed:.2f} s")
+
+
+def _run(args):
+    from uom_core.pipeline import run_pipeline, write_results
+
+    started = time.perf_counter()
+    data = load_input(args.input)
+    results = run_pipeline(
+        data, strategy=args.strategy, scaled=args.scaled, pvalues=args.pvalues, n_jobs=args.n_jobs,
+        event_types=args.event_types, k=args.k, method=args.method,
+        override_categories=args.override_categories, override_factor=args.override_factor,
+        capital_years=args.capital_years, frequency_model=args.frequency_model,
+    )
+    for path in write_results(results, args.output_dir, matrix_format=args.matrix_format):
+        print(f"Wrote {path}")
+    print(f"{len(data):,} loss events, {data['uom_id'].nunique()} UoMs -> "
+          f"{len(results['homogeneity'])} groups in {time.perf_counter() - started:.2f} s")
+
+
+def _sweep(args):
+    from uom_core.grouping import create_ks_distance_matrix
+    from uom_core.index import LossIndex
+    from uom_core.sweep import sweep_configurations, sweep_groupings
+
+    started = time.perf_counter()
+    data = load_input(args.input)
+    if 'event_type' not in data.columns:
+        raise KeyError("The 'event_type' column is missing; the sweep needs it for business grouping.")
+    event_types = args.event_types or sorted(data['event_type'].dropna().unique())
+    configurations = sweep_configurations(event_types, range(args.k_min, args.k_max + 1), args.override_categories)
+    index = LossIndex(data)
+    ks_matrix = create_ks_distance_matrix(data, n_jobs=args.n_jobs, index=index)
+    summary, per_group = sweep_groupings(data, configurations, ks_matrix, n_jobs=args.n_jobs, index=index)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name, table in (('sweep_summary.csv', summary), ('sweep_groups.csv', per_group)):
+        path = os.path.join(args.output_dir, name)
+        table.to_csv(path, index=table is summary)
+        print(f"Wrote {path}")
+    print(f"Scored {len(configurations)} configurations in {time.perf_counter() - started:.2f} s; "
+          f"best: {summary.index[0]}")
+
+
+def build_parser():
+    from uom_core.pipeline import STRATEGIES
+
+    parser = argparse.ArgumentParser(prog='python -m uom_core', description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="Write synthetic operational loss data to a file.")
+    generate.add_argument('output', help="Output .parquet or .csv file.")
+    generate.add_argument('--num-uoms', type=int, default=5)
+    generate.add_argument('--events-per-uom', type=int, default=100)
+    generate.add_argument('--severity-mean', type=float, nargs=2, default=(5.0, 7.0), metavar=('LOW', 'HIGH'),
+                          help="Range of the log-normal mu.")
+    generate.add_argument('--severity-std', type=float, nargs=2, default=(1.0, 2.0), metavar=('LOW', 'HIGH'),
+                          help="Range of the log-normal sigma.")
+    generate.add_argument('--seed', type=int, default=42)
+    generate.set_defaults(handler=_generate)
+
+    stream = commands.add_parser('stream', help="Write a large synthetic portfolio as a directory of Parquet files, "
+                                                "generated chunk by chunk on all cores.")
+    stream.add_argument('output_dir', help="Output directory; it must not already contain Parquet files.")
+    stream.add_argument('--num-uoms', type=int, default=1000)
+    stream.add_argument('--annual-frequency', type=float, nargs=2, default=(500.0, 5000.0), metavar=('LOW', 'HIGH'),
+                        help="Range of the Poisson annual frequency of each UoM.")
+    stream.add_argument('--years', type=int, default=1, help="Years of losses to generate.")
+    stream.add_argument('--severity-mean', type=float, nargs=2, default=(5.0, 7.0), metavar=('LOW', 'HIGH'),
+                        help="Range of the log-normal mu of each UoM.")
+    stream.add_argument('--severity-std', type=float, nargs=2, default=(1.0, 2.0), metavar=('LOW', 'HIGH'),
+                        help="Range of the log-normal sigma of each UoM.")
+    stream.add_argument('--chunk-rows', type=int, default=1_000_000, help="Loss events per Parquet file.")
+    stream.add_argument('--seed', type=int, default=42)
+    stream.add_argument('--n-jobs', type=int, default=-1, help="Worker processes; -1 for all cores.")
+    stream.set_defaults(handler=_stream)
+
+    run = commands.add_parser('run', help="Group UoMs and assess homogeneity; write the results to a directory.")
+    run.add_argument('input', help="Loss data: .parquet/.pq, .arrow/.feather/.ipc, a Parquet directory, or .csv.")
+    run.add_argument('--output-dir', default='results')
+    run.add_argument('--strategy', choices=STRATEGIES, default='none')
+    run.add_argument('--event-types', nargs='*', default=['Fraud', 'Error'],
+                     help="Event types merged by the 'business' strategy.")
+    run.add_argument('--k', type=int, default=3, help="Number of clusters for 'cluster' and 'combined'.")
+    run.add_argument('--method', choices=('average', 'kmedoids'), default='average')
+    run.add_argument('--override-categories', nargs='*', default=['Fraud'],
+                     help="Dominant event types whose distances 'combined' scales by --override-factor.")
+    run.add_argument('--override-factor', type=float, default=0.5)
+    run.add_argument('--scaled', action='store_true', help="Write the sample-size scaled KS matrix.")
+    run.add_argument('--pvalues', action='store_true', help="Add bootstrap p-values to the homogeneity table.")
+    run.add_argument('--capital-years', type=int, default=0,
+                     help="Simulate this many years per group and write VaR/ES 99.9%% to capital.csv.")
+    run.add_argument('--frequency-model', choices=('auto', 'poisson', 'negative_binomial'), default='auto',
+                     help="Frequency distribution fitted for --capital-years.")
+    run.add_argument('--matrix-format', choices=('csv', 'npy'), default='csv')
+    run.add_argument('--n-jobs', type=int, default=1, help="Worker processes; -1 for all cores.")
+    run.set_defaults(handler=_run)
+
+    sweep = commands.add_parser('sweep', help="Rank many grouping configurations by within-group KS statistic.")
+    sweep.add_argument('input', help="Loss data file, as for 'run'.")
+    sweep.add_argument('--output-dir', default='results')
+    sweep.add_argument('--event-types', nargs='*',
+                       help="Event types whose subsets are merged by business grouping (default: all in the data).")
+    sweep.add_argument('--k-min', type=int, default=2)
+    sweep.add_argument('--k-max', type=int, default=8)
+    sweep.add_argument('--override-categories', nargs='*', default=['Fraud'],
+                       help="Category of the override runs; pass none to skip them.")
+    sweep.add_argument('--n-jobs', type=int, default=1, help="Worker processes; -1 for all cores.")
+    sweep.set_defaults(handler=_sweep)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.handler(args)
+    except (ImportError, OSError, KeyError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
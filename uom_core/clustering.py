@@ -0,0 +1,188 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Candidate medoids evaluated at once in a swap step; bounds memory to a few n x block arrays.
+SWAP_BLOCK = 512
+# Number of dendrograms kept by ``average_linkage``.
+LINKAGE_CACHE_SIZE = 8
+# Up to this many UoMs the seriation also optimises the leaf order (cubic in the UoM count).
+OPTIMAL_ORDERING_MAX = 300
+
+_linkage_cache = OrderedDict()
+_linkage_lock = threading.Lock()
+
+
+def as_distance(ks_matrix, out=None):
+    """Symmetric float64 distance matrix with a zero diagonal, as clustering expects.
+
+    The KS engine reports 1/n on the diagonal (its tie convention for a sample against
+    itself), which is not a distance. Pass a preallocated ``out`` to avoid a new array.
+    """
+    if out is None:
+        out = np.array(ks_matrix, dtype=float)
+    else:
+        np.copyto(out, ks_matrix)
+    np.fill_diagonal(out, 0.0)
+    return out
+
+
+def apply_override(dist, members, factor=0.5):
+    """Scales, in place, the distances between every pair of UoMs flagged in ``members``.
+
+    Implements d~_ij = factor * d_ij when both i and j belong to the predefined category
+    and d~_ij = d_ij otherwise.
+    """
+    members = np.asarray(members, dtype=bool)
+    np.multiply(dist, factor, out=dist, where=members[:, None] & members[None, :])
+    return dist
+
+
+def dominant_categories(data, column='event_type', weights=None):
+    """Most frequent value of ``column`` for every UoM, indexed by uom_id.
+
+    ``weights`` names a column of row counts, for frames where each row stands for several
+    losses (such as the cell frame of sketch mode).
+    """
+    if column not in data.columns:
+        raise KeyError(f"The '{column}' column is missing, so UoMs have no dominant category.")
+    if weights is None:
+        counts = pd.crosstab(data['uom_id'], data[column])
+    else:
+        counts = pd.crosstab(data['uom_id'], data[column], values=data[weights], aggfunc='sum').fillna(0)
+    return counts.idxmax(axis=1)
+
+
+def average_linkage(dist):
+    """Average-linkage dendrogram of a square distance matrix, cached by content.
+
+    Moving the K slider only cuts the cached tree again with :func:`cut_tree`.
+    """
+    from scipy.cluster.hierarchy import linkage
+    from scipy.spatial.distance import squareform
+
+    key = hashlib.blake2b(np.ascontiguousarray(dist).tobytes(), digest_size=16).hexdigest()
+    with _linkage_lock:
+        if key in _linkage_cache:
+            _linkage_cache.move_to_end(key)
+            return _linkage_cache[key]
+    tree = linkage(squareform(dist, checks=False), method='average')
+    with _linkage_lock:
+        _linkage_cache[key] = tree
+        while len(_linkage_cache) > LINKAGE_CACHE_SIZE:
+            _linkage_cache.popitem(last=False)
+    return tree
+
+
+def seriation_order(dist):
+    """UoM order that puts similar UoMs next to each other, for heatmaps.
+
+    The leaves of the cached average-linkage dendrogram, so every cluster is a contiguous
+    block; for up to ``OPTIMAL_ORDERING_MAX`` UoMs the leaves are also flipped to minimise
+    the distance between neighbours.
+    """
+    from scipy.cluster.hierarchy import leaves_list, optimal_leaf_ordering
+    from scipy.spatial.distance import squareform
+
+    if len(dist) < 3:
+        return np.arange(len(dist))
+    tree = average_linkage(dist)
+    if len(dist) <= OPTIMAL_ORDERING_MAX:
+        tree = optimal_leaf_ordering(tree, squareform(dist, checks=False))
+    return leaves_list(tree)
+
+
+def cut_tree(tree, k):
+    """Cluster labels ``0..k-1`` from cutting a linkage tree into at most ``k`` clusters."""
+    from scipy.cluster.hierarchy import fcluster
+
+    return fcluster(tree, t=k, criterion='maxclust') - 1
+
+
+def _nearest_two(dist, medoids):
+    """Distance to the nearest and second-nearest medoid, and the nearest medoid's slot."""
+    to_medoids = dist[:, medoids]
+    if len(medoids) == 1:
+        return to_medoids[:, 0], np.full(len(dist), np.inf), np.zeros(len(dist), dtype=np.intp)
+    order = np.argsort(to_medoids, axis=1, kind='stable')[:, :2]
+    rows = np.arange(len(dist))
+    return to_medoids[rows, order[:, 0]], to_medoids[rows, order[:, 1]], order[:, 0]
+
+
+def _build(dist, medoids, k):
+    """Greedy BUILD: add the medoid with the largest cost reduction until there are ``k``."""
+    medoids = list(medoids)
+    if not medoids:
+        medoids.append(int(np.argmin(dist.sum(axis=0))))
+    nearest = dist[:, medoids].min(axis=1)
+    while len(medoids) < k:
+        gain = np.maximum(nearest[:, None] - dist, 0.0).sum(axis=0)
+        gain[medoids] = -1.0
+        best = int(np.argmax(gain))
+        medoids.append(best)
+        nearest = np.minimum(nearest, dist[:, best])
+    return medoids
+
+
+def _shrink(dist, medoids, k):
+    """Drop the medoid whose removal costs least until only ``k`` remain."""
+    medoids = list(medoids)
+    while len(medoids) > k:
+        d1, d2, slot = _nearest_two(dist, medoids)
+        loss = np.bincount(slot, weights=d2 - d1, minlength=len(medoids))
+        medoids.pop(int(np.argmin(loss)))
+    return medoids
+
+
+def kmedoids(dist, k, medoids=None, max_iter=100, tol=1e-12):
+    """K-medoids (PAM) on a precomputed distance matrix.
+
+    Swap steps use the FastPAM1 decomposition: with each point's nearest and
+    second-nearest medoid known, the cost change of every (medoid, candidate) swap is
+    computed in one vectorized pass over a block of candidates. ``medoids`` warm-starts
+    from a previous solution; when K changed it is first grown greedily or shrunk.
+
+    Returns:
+        Tuple of (medoid indices, labels ``0..k-1`` giving each point's medoid slot).
+    """
+    n = len(dist)
+    k = max(1, min(int(k), n))
+    medoids = [int(m) for m in (medoids if medoids is not None else []) if 0 <= m < n]
+    medoids = list(dict.fromkeys(medoids))
+    medoids = _shrink(dist, medoids, k) if len(medoids) > k else _build(dist, medoids, k)
+
+    for _ in range(max_iter):
+        d1, d2, slot = _nearest_two(dist, medoids)
+        onehot = np.zeros((n, k))
+        onehot[np.arange(n), slot] = 1.0
+        best_delta, best_swap = -tol, None
+        for start in range(0, n, SWAP_BLOCK):
+            cand = dist[:, start:start + SWAP_BLOCK]
+            # Points that move to the candidate whichever medoid leaves ...
+            shared = np.minimum(cand - d1[:, None], 0.0)
+            # ... and the extra change for points whose own medoid is the one removed.
+            own = np.minimum(cand, d2[:, None]) - d1[:, None] - shared
+            delta = shared.sum(axis=0)[None, :] + onehot.T @ own
+            in_block = [m - start for m in medoids if start <= m < start + SWAP_BLOCK]
+            delta[:, in_block] = np.inf
+            slot_i, x = np.unravel_index(np.argmin(delta), delta.shape)
+            if delta[slot_i, x] < best_delta:
+                best_delta, best_swap = delta[slot_i, x], (slot_i, start + x)
+        if best_swap is None:
+            break
+        medoids[best_swap[0]] = int(best_swap[1])
+
+    labels = np.argmin(dist[:, medoids], axis=1)
+    return np.array(medoids), labels
+
+
+def labels_to_group_ids(uom_ids, labels):
+    """Maps each UoM to the smallest UoM id in its cluster, a stable name for the group."""
+    uom_ids = np.asarray(uom_ids)
+    group_ids = {}
+    for uid, label in zip(uom_ids, labels):
+        group_ids[label] = min(group_ids.get(label, uid), uid)
+    return {uid: group_ids[label] for uid, label in zip(uom_ids, labels)}
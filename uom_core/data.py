@@ -0,0 +1,184 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from uom_core.parallel import process_pool, resolve_n_jobs
+
+EVENT_TYPES = ['Fraud', 'Error', 'System Failure']
+BUSINESS_LINES = ['Retail', 'Investment', 'Corporate']
+START_DATE = np.datetime64('2023-01-01', 'D')
+# Loss events per chunk of the streaming generator, and per Parquet file it writes.
+CHUNK_ROWS = 1_000_000
+
+
+def _check_ranges(severity_mean_range, severity_std_range):
+    if severity_mean_range[0] > severity_mean_range[1] or any(x < 0 for x in severity_mean_range):
+        raise ValueError("Invalid severity mean range.")
+    if severity_std_range[0] > severity_std_range[1] or any(x < 0 for x in severity_std_range):
+        raise ValueError("Invalid severity std range.")
+
+
+def _loss_frame(rng, uom_id, mean, std, days=365):
+    """Loss events of the given UoMs and log-normal parameters, one per element."""
+    n = len(uom_id)
+    loss_amount = rng.lognormal(mean, std)
+    loss_date = START_DATE + rng.integers(0, days, size=n).astype('timedelta64[D]')
+    event_type = pd.Categorical.from_codes(rng.integers(0, len(EVENT_TYPES), size=n), categories=EVENT_TYPES)
+    business_line = pd.Categorical.from_codes(rng.integers(0, len(BUSINESS_LINES), size=n), categories=BUSINESS_LINES)
+    return pd.DataFrame({
+        'uom_id': uom_id,
+        'loss_amount': loss_amount,
+        'loss_date': loss_date.astype('datetime64[ns]'),
+        'event_type': event_type,
+        'business_line': business_line,
+    })
+
+
+def generate_synthetic_data(num_uoms, loss_events_per_uom, severity_mean_range, severity_std_range, random_state=None):
+    """Generates synthetic operational loss data.
+
+    Every column is drawn in one batch rather than event by event. Each event still gets
+    its own log-normal mean and std, so the output follows the same distribution as the
+    original per-row generator.
+
+    Args:
+        random_state: Seed or ``numpy.random.Generator``; pass a fixed value for reproducible runs.
+    """
+    _check_ranges(severity_mean_range, severity_std_range)
+
+    rng = np.random.default_rng(random_state)
+    n = num_uoms * loss_events_per_uom
+    mean = rng.uniform(severity_mean_range[0], severity_mean_range[1], size=n)
+    std = rng.uniform(severity_std_range[0], severity_std_range[1], size=n)
+    return _loss_frame(rng, np.repeat(np.arange(num_uoms), loss_events_per_uom), mean, std)
+
+
+# ---------- Streaming generation ----------
+
+def draw_uom_parameters(num_uoms, annual_frequency_range, severity_mean_range, severity_std_range, years=1, seed=0):
+    """Draws the loss model of every UoM once, for :class:`SyntheticStream`.
+
+    Each UoM gets a Poisson annual frequency and a log-normal mu and sigma, uniform over
+    their ranges, and a Poisson number of events over ``years``. The draws use the
+    ``SeedSequence(seed, spawn_key=(0,))`` stream, apart from those of the chunks.
+
+    Returns:
+        DataFrame indexed by uom_id with annual_frequency, n_events, severity_mu and severity_sigma.
+    """
+    _check_ranges(severity_mean_range, severity_std_range)
+    if annual_frequency_range[0] > annual_frequency_range[1] or any(x < 0 for x in annual_frequency_range):
+        raise ValueError("Invalid annual frequency range.")
+
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(0,)))
+    frequency = rng.uniform(annual_frequency_range[0], annual_frequency_range[1], size=num_uoms)
+    return pd.DataFrame({
+        'annual_frequency': frequency,
+        'n_events': rng.poisson(frequency * years),
+        'severity_mu': rng.uniform(severity_mean_range[0], severity_mean_range[1], size=num_uoms),
+        'severity_sigma': rng.uniform(severity_std_range[0], severity_std_range[1], size=num_uoms),
+    }, index=pd.RangeIndex(num_uoms, name='uom_id'))
+
+
+class SyntheticStream:
+    """The loss events of a table of UoM parameters, cut into chunks of ``chunk_rows``.
+
+    Events are laid out UoM after UoM, and chunk ``c`` holds events
+    ``[c * chunk_rows, (c + 1) * chunk_rows)`` drawn from its own stream
+    ``SeedSequence(seed, spawn_key=(1, c))``. Any chunk can therefore be generated alone,
+    by any worker and in any order, with the same result; the data depends only on the
+    parameters, ``chunk_rows`` and ``seed``.
+    """
+
+    def __init__(self, parameters, chunk_rows=CHUNK_ROWS, seed=0, years=1):
+        counts = parameters['n_events'].to_numpy(dtype=np.int64)
+        self.ends = np.cumsum(counts)
+        self.starts = self.ends - counts
+        self.uom_ids = parameters.index.to_numpy()
+        self.mu = parameters['severity_mu'].to_numpy(dtype=float)
+        self.sigma = parameters['severity_sigma'].to_numpy(dtype=float)
+        self.chunk_rows = int(chunk_rows)
+        self.seed = seed
+        self.days = int(365 * years)
+
+    @property
+    def n_events(self):
+        return int(self.ends[-1]) if len(self.ends) else 0
+
+    def __len__(self):
+        return -(-self.n_events // self.chunk_rows)
+
+    def chunk(self, index):
+        """DataFrame of the events of chunk ``index``, in the columns of :func:`generate_synthetic_data`."""
+        low = index * self.chunk_rows
+        high = min(low + self.chunk_rows, self.n_events)
+        first = int(np.searchsorted(self.ends, low, side='right'))
+        last = int(np.searchsorted(self.ends, high - 1, side='right')) + 1
+        counts = np.minimum(self.ends[first:last], high) - np.maximum(self.starts[first:last], low)
+        rows = np.repeat(np.arange(first, last), counts)
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(1, index)))
+        return _loss_frame(rng, self.uom_ids[rows], self.mu[rows], self.sigma[rows], self.days)
+
+
+# Per-worker stream set up once by ``_init_stream_worker``.
+_worker = {}
+
+
+def _init_stream_worker(stream):
+    _worker['stream'] = stream
+
+
+def _stream_chunk(index):
+    return _worker['stream'].chunk(index)
+
+
+def _write_chunk(stream, index, directory):
+    path = os.path.join(directory, f"part-{index:05d}.parquet")
+    stream.chunk(index).to_parquet(path, index=False)
+    return path
+
+
+def _write_stream_chunk(task):
+    return _write_chunk(_worker['stream'], *task)
+
+
+def iter_synthetic_chunks(stream, n_jobs=1):
+    """Yields the chunks of a :class:`SyntheticStream` in order.
+
+    With several jobs, worker processes generate ahead of the consumer, at most two chunks
+    per worker, so memory stays bounded however slowly the chunks are consumed.
+    """
+    n_jobs = min(resolve_n_jobs(n_jobs), len(stream))
+    if n_jobs <= 1:
+        for index in range(len(stream)):
+            yield stream.chunk(index)
+        return
+    with process_pool(n_jobs, _init_stream_worker, (stream,)) as pool:
+        pending = [pool.submit(_stream_chunk, index) for index in range(min(2 * n_jobs, len(stream)))]
+        for index in range(len(stream)):
+            chunk = pending[index].result()
+            pending[index] = None
+            if index + 2 * n_jobs < len(stream):
+                pending.append(pool.submit(_stream_chunk, index + 2 * n_jobs))
+            yield chunk
+
+
+def write_synthetic_parquet(stream, directory, n_jobs=1):
+    """Writes a :class:`SyntheticStream` as a directory of Parquet files, one per chunk.
+
+    Every worker process generates and writes its own chunks, so generation and
+    compression run on all cores and only file paths travel back. The directory can be
+    read back with :func:`uom_core.io.load_loss_data` or :func:`uom_core.io.iter_loss_batches`.
+
+    Returns:
+        List of the written file paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    if any(name.endswith('.parquet') for name in os.listdir(directory)):
+        raise FileExistsError(f"Directory '{directory}' already contains Parquet files.")
+    tasks = [(index, directory) for index in range(len(stream))]
+    n_jobs = min(resolve_n_jobs(n_jobs), len(tasks))
+    if n_jobs <= 1:
+        return [_write_chunk(stream, *task) for task in tasks]
+    with process_pool(n_jobs, _init_stream_worker, (stream,)) as pool:
+        return list(pool.map(_write_stream_chunk, tasks))
@@ -0,0 +1,27 @@
+import numpy as np
+
+# Points kept per ECDF curve; the drawn curve is then within 1/ECDF_MAX_POINTS of the full one.
+ECDF_MAX_POINTS = 500
+
+
+def ecdf_points(sorted_values):
+    """(x, F(x)) at every observation of an ascending sample."""
+    n = len(sorted_values)
+    return sorted_values, np.arange(1, n + 1) / n
+
+
+def downsample_ecdf(sorted_values, max_points=ECDF_MAX_POINTS, cdf=None):
+    """ECDF of an ascending sample reduced to at most ``max_points`` points.
+
+    Points are kept at evenly spaced ECDF levels (quantiles), always including the first
+    and last observation. Between two kept points the full curve rises by at most
+    ``ceil(n / (max_points - 1)) / n``, which bounds the vertical error of the reduced
+    curve at roughly ``1 / max_points`` however large the sample is. Pass ``cdf`` to reduce
+    a precomputed curve, such as the one of a quantile sketch, instead.
+    """
+    x, y = ecdf_points(sorted_values) if cdf is None else (sorted_values, cdf)
+    n = len(x)
+    if n <= max_points:
+        return x, y
+    keep = np.unique(np.linspace(0, n - 1, max(max_points, 2)).round().astype(np.int64))
+    return x[keep], y[keep]
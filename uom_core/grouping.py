@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pd
+
+from uom_core.clustering import apply_override, as_distance, average_linkage, cut_tree, kmedoids, labels_to_group_ids
+from uom_core.ks import SortedSamples, ks_distance_matrix, scale_factors
+from uom_core.parallel import ks_distance_matrix_parallel
+from uom_core.significance import DEFAULT_RESAMPLES, ks_pvalue_matrix
+from uom_core.sketch import sketch_ks_distance_matrix, sketches_by_column
+
+
+# grouped_uom_id given to every loss whose event type is merged by business grouping.
+BUSINESS_GROUP_ID = 9999
+
+
+def _compact_ids(ids):
+    """int32 copy of an id array when every id fits, else int64."""
+    ids = np.asarray(ids)
+    if ids.size and (ids.min() < np.iinfo(np.int32).min or ids.max() > np.iinfo(np.int32).max):
+        return ids.astype(np.int64)
+    return ids.astype(np.int32)
+
+
+class GroupedLosses:
+    """A grouping of a shared loss frame, stored as one grouped_uom_id label per row.
+
+    The base frame is referenced, never copied, and must be treated as read-only; a
+    grouping strategy only adds a compact int32 label array. :meth:`frame` exposes the
+    familiar DataFrame with a grouped_uom_id column whose other columns share the base
+    frame's memory. ``name`` optionally describes the strategy that produced the labels.
+    """
+
+    def __init__(self, data, labels, name=None):
+        if len(labels) != len(data):
+            raise ValueError("A grouping needs exactly one label per row of the data.")
+        self.data = data
+        self.labels = _compact_ids(labels)
+        self.name = name
+
+    @classmethod
+    def from_mapping(cls, data, mapping, name=None):
+        """Labels every row through a ``uom_id -> grouped_uom_id`` mapping."""
+        uom_ids, codes = np.unique(data['uom_id'].to_numpy(), return_inverse=True)
+        return cls(data, np.array([mapping[uid] for uid in uom_ids])[codes], name=name)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def group_ids(self):
+        return np.unique(self.labels)
+
+    def frame(self, columns=None):
+        """DataFrame of ``columns`` (default: all) plus grouped_uom_id, sharing the base columns."""
+        columns = list(self.data.columns) if columns is None else list(columns)
+        frame = pd.DataFrame({name: self.data[name] for name in columns}, copy=False)
+        frame['grouped_uom_id'] = pd.Series(self.labels, index=self.data.index, copy=False)
+        return frame
+
+    def head(self, n=5):
+        return self.data.head(n).assign(grouped_uom_id=self.labels[:n])
+
+    def counts(self, weights=None):
+        """Rows (or the sum of the ``weights`` column) per grouped_uom_id."""
+        group_ids, codes = np.unique(self.labels, return_inverse=True)
+        values = None if weights is None else self.data[weights].to_numpy()
+        counts = np.bincount(codes, weights=values, minlength=len(group_ids))
+        return pd.Series(counts.astype(np.int64), index=pd.Index(group_ids, name='grouped_uom_id'), name='count')
+
+
+def business_group_labels(data, event_types_to_group):
+    """grouped_uom_id of every row: its uom_id, or ``BUSINESS_GROUP_ID`` for the selected event types."""
+    labels = _compact_ids(data['uom_id'].to_numpy())
+    if event_types_to_group and 'event_type' not in data.columns:
+        raise KeyError("The 'event_type' column is missing, so losses cannot be grouped by event type.")
+    if event_types_to_group:
+        labels[data['event_type'].isin(event_types_to_group).to_numpy()] = BUSINESS_GROUP_ID
+    return labels
+
+
+def group_uoms_by_business_knowledge(data, event_types_to_group):
+    """Groups UoMs based on business rules (event types).
+
+    Returns the data with a grouped_uom_id column; the other columns share the memory of
+    ``data``, which is left unchanged.
+    """
+    return GroupedLosses(data, business_group_labels(data, event_types_to_group)).frame()
+
+
+def cluster_group_mapping(uom_ids, ks_matrix, k, method="average", medoids=None,
+                          override_uoms=None, override_factor=0.5, buffer=None):
+    """Clusters raw UoMs on their KS distance matrix into a ``uom_id -> grouped_uom_id`` mapping.
+
+    Args:
+        uom_ids: Sorted ids of the UoMs, in the order of the matrix rows.
+        ks_matrix: KS distance matrix, as from create_ks_distance_matrix. It is never modified.
+        k: Desired number of clusters.
+        method: "average" cuts a cached average-linkage dendrogram; "kmedoids" runs PAM.
+        medoids: Medoid UoM ids of an earlier k-medoids run to warm-start from.
+        override_uoms: UoM ids of a predefined business category; distances between two of
+            them are multiplied by ``override_factor`` before clustering.
+        buffer: Optional preallocated float64 array of the matrix's shape, reused for the
+            adjusted distances instead of allocating a new one.
+    Returns:
+        Tuple of (dict of grouped_uom_id by uom_id, medoid UoM ids or None for "average").
+    """
+    uom_ids = np.asarray(uom_ids)
+    dist = as_distance(ks_matrix, out=buffer)
+    if override_uoms is not None and len(override_uoms):
+        apply_override(dist, np.isin(uom_ids, list(override_uoms)), factor=override_factor)
+    if method == "kmedoids":
+        position = {uid: pos for pos, uid in enumerate(uom_ids)}
+        start = [position[uid] for uid in (medoids if medoids is not None else []) if uid in position]
+        medoid_pos, labels = kmedoids(dist, k, medoids=start)
+        medoids = uom_ids[medoid_pos]
+    else:
+        labels = cut_tree(average_linkage(dist), k)
+        medoids = None
+    return labels_to_group_ids(uom_ids, labels), medoids
+
+
+def cluster_uoms_by_ks_distance(data, ks_matrix, k, method="average", medoids=None,
+                                override_uoms=None, override_factor=0.5, buffer=None):
+    """Groups raw UoMs by clustering their KS distance matrix.
+
+    Takes the arguments of :func:`cluster_group_mapping`, with ``data`` (uom_id and
+    loss_amount) in place of the UoM ids.
+
+    Returns:
+        Tuple of (data with grouped_uom_id, sharing the memory of ``data``, medoid UoM ids
+        or None for "average").
+    """
+    mapping, medoids = cluster_group_mapping(np.sort(data['uom_id'].unique()), ks_matrix, k, method=method,
+                                             medoids=medoids, override_uoms=override_uoms,
+                                             override_factor=override_factor, buffer=buffer)
+    return GroupedLosses.from_mapping(data, mapping).frame(), medoids
+
+
+def create_ks_distance_matrix(data, scaled=False, n_jobs=1, cache=None, progress=None, index=None):
+    """Creates a symmetric matrix of KS distances between all raw UoMs.
+
+    Each UoM is sorted once and pairs are evaluated in vectorized blocks. With
+    ``scaled=True`` the entries are the scaled distances d_ij = n_i n_j / (n_i + n_j) * D_ij.
+    Any ``n_jobs`` other than 1 shards the matrix across that many processes (``None`` or
+    -1 for all cores) and returns float32 values; small inputs still run serially.
+    Passing a ``KSMatrixCache`` reuses distances of UoMs whose losses have not changed.
+    ``progress(done, total, partial)`` is called as rows (or tiles) complete and may raise
+    to cancel, as in :func:`uom_core.ks.ks_distance_matrix`. A ``LossIndex`` of ``data``
+    supplies the sorted samples without sorting again.
+    """
+    samples = SortedSamples.from_frame(data) if index is None else index.uoms
+    if cache is not None:
+        ks_matrix = cache.get_matrix(samples, scaled=scaled, n_jobs=n_jobs, progress=progress)
+    elif n_jobs == 1:
+        ks_matrix = ks_distance_matrix(samples, scaled=scaled, progress=progress)
+    else:
+        ks_matrix = ks_distance_matrix_parallel(samples, n_jobs=n_jobs, scaled=scaled, progress=progress)
+    labels = [f"UoM {uid}" for uid in samples.ids]
+    return pd.DataFrame(ks_matrix, index=labels, columns=labels)
+
+
+def create_ks_pvalue_matrix(data, n_resamples=DEFAULT_RESAMPLES, alpha=0.05, n_jobs=1, seed=0, index=None):
+    """Permutation p-values of the KS distance between all raw UoMs, labelled like the KS matrix.
+
+    Replicates are drawn in vectorized batches over the pre-sorted samples, and a pair stops
+    resampling once its p-value is clearly above or below ``alpha``.
+    """
+    samples = SortedSamples.from_frame(data) if index is None else index.uoms
+    pvalues = ks_pvalue_matrix(samples, n_resamples=n_resamples, alpha=alpha, seed=seed, n_jobs=n_jobs)
+    labels = [f"UoM {uid}" for uid in samples.ids]
+    return pd.DataFrame(pvalues, index=labels, columns=labels)
+
+
+def create_sketch_ks_distance_matrix(data, sketches, scaled=False):
+    """KS distance matrix of raw UoMs from their quantile sketches (out-of-core mode).
+
+    The (UoM, event type) sketches of each UoM are merged first. Returns the matrix as a
+    DataFrame and the largest error bound of its entries (99% confidence).
+    """
+    per_uom = sketches_by_column(data, sketches, 'uom_id')
+    ks_matrix, errors = sketch_ks_distance_matrix(per_uom.values())
+    if scaled:
+        factors = scale_factors([sketch.n for sketch in per_uom.values()])
+        ks_matrix, errors = ks_matrix * factors, errors * factors
+    labels = [f"UoM {uid}" for uid in per_uom]
+    return pd.DataFrame(ks_matrix, index=labels, columns=labels), float(errors.max(initial=0.0))
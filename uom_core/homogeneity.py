@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+
+from uom_core.ks import SortedSamples, ks_distance_row
+from uom_core.significance import DEFAULT_RESAMPLES, normal_ks_pvalues
+from uom_core.sketch import sketch_normal_ks_statistic, sketches_by_column
+
+# Losses per chunk when :func:`assess_homogeneity` reports progress.
+PROGRESS_CHUNK = 1_000_000
+
+
+def normal_ks_statistics(samples):
+    """One-sample KS statistic of every segment against a normal fitted to that segment.
+
+    Equivalent to ``scipy.stats.kstest(x, 'norm', args=(mean, std))`` per segment, with
+    the population std (``ddof=0``), but computed for all segments in one vectorized pass
+    over the sorted buffer. Segments with fewer than two observations, or no spread, get NaN.
+    """
+    from scipy.special import ndtr
+
+    counts = samples.counts
+    stats = np.full(len(counts), np.nan)
+    if len(samples.values) == 0:
+        return stats
+    nonempty = counts > 0
+    starts = samples.offsets[:-1][nonempty]
+    n = counts[nonempty]
+    seg = np.repeat(np.arange(len(n)), n)
+    values = samples.values
+
+    mean = np.add.reduceat(values, starts) / n
+    centered = values - mean[seg]
+    std = np.sqrt(np.add.reduceat(centered * centered, starts) / n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cdf = ndtr(centered / std[seg])
+    pos = np.arange(len(values)) - np.repeat(starts, n)
+    d_plus = np.maximum.reduceat((pos + 1) / n[seg] - cdf, starts)
+    d_minus = np.maximum.reduceat(cdf - pos / n[seg], starts)
+
+    d = np.maximum(d_plus, d_minus)
+    d[(n < 2) | (std == 0)] = np.nan
+    stats[nonempty] = d
+    return stats
+
+
+def group_samples(data, group_col='grouped_uom_id', uom_col='uom_id', value_col='loss_amount'):
+    """Sorted buffers for groups and for the raw UoMs inside each group.
+
+    Losses are sorted once by (group, loss). A stable sort of that buffer by raw UoM then
+    yields one ascending segment per (group, raw UoM) cell without sorting values again.
+
+    Returns:
+        Tuple of (per-group ``SortedSamples``, per-cell ``SortedSamples`` whose ids are
+        the raw UoM ids, cell offsets of each group so that group ``g`` owns cells
+        ``cell_offsets[g]:cell_offsets[g + 1]``).
+    """
+    group_codes, group_ids = pd.factorize(data[group_col], sort=True)
+    uom_codes, uom_ids = pd.factorize(data[uom_col], sort=True)
+    values = data[value_col].to_numpy(dtype=float)
+    keep = (group_codes >= 0) & (uom_codes >= 0)
+    if not keep.all():
+        group_codes, uom_codes, values = group_codes[keep], uom_codes[keep], values[keep]
+
+    order = np.argsort(values, kind='stable')
+    order = order[np.argsort(group_codes[order], kind='stable')]
+    group_counts = np.bincount(group_codes, minlength=len(group_ids))
+    groups = SortedSamples(np.asarray(group_ids), values[order],
+                           np.concatenate(([0], np.cumsum(group_counts))).astype(np.int64))
+
+    # Cell code of every row of the group-sorted buffer, in (group, uom) order.
+    cell_codes = group_codes[order].astype(np.int64) * len(uom_ids) + uom_codes[order]
+    by_cell = np.argsort(cell_codes, kind='stable')
+    present, cell_sizes = np.unique(cell_codes, return_counts=True)
+    cells = SortedSamples(np.asarray(uom_ids)[present % len(uom_ids)], groups.values[by_cell],
+                          np.concatenate(([0], np.cumsum(cell_sizes))).astype(np.int64))
+    cell_offsets = np.searchsorted(present // len(uom_ids), np.arange(len(group_ids) + 1))
+    return groups, cells, cell_offsets
+
+
+def indexed_group_samples(data, index=None, group_col='grouped_uom_id'):
+    """:func:`group_samples` of ``data``, from a ``LossIndex`` of its rows when one is given."""
+    if index is None:
+        return group_samples(data, group_col=group_col)
+    return index.group_samples(data[group_col].to_numpy())
+
+
+def within_group_ks_distances(groups, cells, cell_offsets):
+    """KS distance between every pair of raw UoMs that share a group.
+
+    Takes the buffers returned by :func:`group_samples`.
+
+    Returns:
+        DataFrame with grouped_uom_id, uom_id_1, uom_id_2 and ks_distance.
+    """
+    group_col, uom_1, uom_2, distances = [], [], [], []
+    for g in range(len(groups)):
+        first, last = cell_offsets[g], cell_offsets[g + 1]
+        for i in range(first, last - 1):
+            partners = np.arange(i + 1, last)
+            distances.append(ks_distance_row(cells, i, partners))
+            group_col.append(np.repeat(groups.ids[g:g + 1], len(partners)))
+            uom_1.append(np.repeat(cells.ids[i:i + 1], len(partners)))
+            uom_2.append(cells.ids[partners])
+    if not distances:
+        return pd.DataFrame(columns=['grouped_uom_id', 'uom_id_1', 'uom_id_2', 'ks_distance'])
+    return pd.DataFrame({
+        'grouped_uom_id': np.concatenate(group_col),
+        'uom_id_1': np.concatenate(uom_1),
+        'uom_id_2': np.concatenate(uom_2),
+        'ks_distance': np.concatenate(distances),
+    })
+
+
+def assess_homogeneity(data, progress=None, index=None):
+    """Evaluates homogeneity within each grouped UoM using KS test.
+    Args:
+        data: DataFrame with uom_id, loss_amount, grouped_uom_id.
+        progress: Optional ``progress(groups_done, num_groups, partial_results)``, called
+            after every chunk of about ``PROGRESS_CHUNK`` losses; it may raise to cancel.
+        index: Optional ``LossIndex`` of the rows of ``data``, whose sorted buffer is
+            regrouped instead of sorting the losses again.
+    Returns:
+        Dictionary of homogeneity metrics for each grouped_uom_id.
+    """
+    if not isinstance(data, pd.DataFrame):
+        raise TypeError("Input data must be a Pandas DataFrame.")
+    if data.empty:
+        return {}
+    if 'grouped_uom_id' not in data.columns:
+        raise KeyError("The 'grouped_uom_id' column is missing.")
+    if 'loss_amount' not in data.columns:
+        raise KeyError("The 'loss_amount' column is missing.")
+    if not pd.api.types.is_numeric_dtype(data['loss_amount']):
+        raise TypeError("The 'loss_amount' column must be numeric.")
+
+    # One sort by (group, loss); every group is then a contiguous segment of the buffer.
+    if index is None:
+        groups = SortedSamples.from_frame(data, key='grouped_uom_id')
+    else:
+        groups, _, _ = indexed_group_samples(data, index)
+    if progress is None:
+        ks_statistics = normal_ks_statistics(groups)  # NaN where a group has < 2 losses
+        return dict(zip(groups.ids, ks_statistics))
+    results = {}
+    for first, last in _group_chunks(groups.offsets, PROGRESS_CHUNK):
+        start, end = groups.offsets[first], groups.offsets[last]
+        chunk = SortedSamples(groups.ids[first:last], groups.values[start:end], groups.offsets[first:last + 1] - start)
+        results.update(zip(chunk.ids, normal_ks_statistics(chunk)))
+        progress(last, len(groups), results)
+    return results
+
+
+def _group_chunks(offsets, chunk_size):
+    """(first, last) group ranges holding about ``chunk_size`` values each."""
+    num_groups = len(offsets) - 1
+    first = 0
+    while first < num_groups:
+        last = max(first + 1, int(np.searchsorted(offsets, offsets[first] + chunk_size, side='right')) - 1)
+        last = min(last, num_groups)
+        yield first, last
+        first = last
+
+
+def assess_within_group_distances(data, index=None):
+    """KS distances between every pair of raw UoMs that were merged into the same group.
+    Args:
+        data: DataFrame with uom_id, loss_amount, grouped_uom_id.
+        index: Optional ``LossIndex`` of the rows of ``data``.
+    Returns:
+        DataFrame with grouped_uom_id, uom_id_1, uom_id_2 and ks_distance.
+    """
+    return within_group_ks_distances(*indexed_group_samples(data, index))
+
+
+def assess_homogeneity_pvalues(data, n_resamples=DEFAULT_RESAMPLES, n_jobs=1, seed=0, index=None):
+    """Parametric bootstrap p-values of the KS statistics of :func:`assess_homogeneity`.
+    Args:
+        data: DataFrame with uom_id, loss_amount, grouped_uom_id.
+        index: Optional ``LossIndex`` of the rows of ``data``.
+    Returns:
+        Dictionary of p-values for each grouped_uom_id (NaN where the statistic is NaN).
+    """
+    if index is None:
+        groups = SortedSamples.from_frame(data, key='grouped_uom_id')
+    else:
+        groups, _, _ = indexed_group_samples(data, index)
+    pvalues, _ = normal_ks_pvalues(groups, normal_ks_statistics(groups), n_resamples=n_resamples,
+                                   seed=seed, n_jobs=n_jobs)
+    return dict(zip(groups.ids, pvalues))
+
+
+def assess_homogeneity_sketched(data, sketches):
+    """Approximate KS statistic per grouped UoM from quantile sketches (out-of-core mode).
+    Args:
+        data: Sketch cell frame with uom_id, event_type and grouped_uom_id.
+        sketches: Dict of (uom_id, event_type) key to ``KLLSketch``.
+    Returns:
+        Tuple of (dictionary of KS statistics by grouped_uom_id, dictionary of error bounds).
+    """
+    groups = sketches_by_column(data, sketches, 'grouped_uom_id')
+    return ({group: sketch_normal_ks_statistic(sketch) for group, sketch in groups.items()},
+            {group: sketch.rank_error for group, sketch in groups.items()})
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+from uom_core.ecdf import ECDF_MAX_POINTS, downsample_ecdf
+from uom_core.ks import SortedSamples, calculate_ks_distance
+
+
+class LossIndex:
+    """Sorted-sample index of a loss frame, built once and shared by every computation.
+
+    Losses are sorted once by (uom_id, loss_amount) into ``uoms``, the buffer of the KS
+    engine. The frame row of every buffer entry and the order of the whole buffer by
+    amount are kept too, so the sorted samples of any grouping of the rows
+    (:meth:`group_samples`) come from stable sorts of integer labels instead of sorting
+    the losses again. ECDFs of raw UoMs are computed on first use and kept.
+
+    The frame must not change while the index is in use; build a new index for new data.
+
+    Attributes:
+        uoms: ``SortedSamples`` of the raw UoMs (sorted buffer, offsets and counts).
+        rows: Frame row of every entry of ``uoms.values``.
+        by_amount: Positions in ``uoms.values`` in ascending order of amount.
+    """
+
+    def __init__(self, data, key='uom_id', value='loss_amount'):
+        codes, ids = pd.factorize(data[key], sort=True)
+        values = data[value].to_numpy(dtype=float)
+        position_dtype = np.int32 if len(values) < 2**31 else np.int64
+        by_value = np.argsort(values, kind='stable')
+        if (codes < 0).any():  # rows with a missing key belong to no UoM
+            by_value = by_value[codes[by_value] >= 0]
+        rows = by_value[np.argsort(codes[by_value], kind='stable')]
+        counts = np.bincount(codes[rows], minlength=len(ids))
+        self.n_rows = len(values)
+        self.uoms = SortedSamples(np.asarray(ids), values[rows],
+                                  np.concatenate(([0], np.cumsum(counts))).astype(np.int64))
+        self.rows = rows.astype(position_dtype)
+        position = np.empty(len(values), dtype=position_dtype)
+        position[rows] = np.arange(len(rows), dtype=position_dtype)
+        self.by_amount = position[by_value]
+        self._grouping = None  # (labels, result) of the last group_samples call
+        self._ecdfs = {}
+
+    def __len__(self):
+        return len(self.uoms)
+
+    @property
+    def nbytes(self):
+        return self.uoms.values.nbytes + self.rows.nbytes + self.by_amount.nbytes
+
+    def position(self, uom_id):
+        """Segment of ``uom_id`` in ``uoms``."""
+        k = int(np.searchsorted(self.uoms.ids, uom_id))
+        if k == len(self.uoms) or self.uoms.ids[k] != uom_id:
+            raise KeyError(f"UoM {uom_id} is not in the loss data.")
+        return k
+
+    def sample(self, uom_id):
+        """Sorted losses of one raw UoM."""
+        return self.uoms.sample(self.position(uom_id))
+
+    def ks_distance(self, uom_id_1, uom_id_2):
+        """:func:`uom_core.ks.calculate_ks_distance` of two raw UoMs without sorting them again."""
+        return calculate_ks_distance(self.sample(uom_id_1), self.sample(uom_id_2), presorted=True)
+
+    def ecdf(self, uom_id, sorted_losses, max_points=ECDF_MAX_POINTS):
+        """Reduced ECDF of ``sorted_losses``, a sample of ``uom_id``; kept when it is the whole UoM."""
+        k = self.position(uom_id)
+        if len(sorted_losses) != self.uoms.counts[k]:
+            return downsample_ecdf(sorted_losses, max_points)
+        if (k, max_points) not in self._ecdfs:
+            self._ecdfs[k, max_points] = downsample_ecdf(self.uoms.sample(k), max_points)
+        return self._ecdfs[k, max_points]
+
+    def group_samples(self, labels):
+        """Sorted buffers of a grouping, as :func:`uom_core.homogeneity.group_samples` returns.
+
+        Args:
+            labels: Group of every row of the indexed frame, such as its grouped_uom_id column.
+        Returns:
+            Tuple of (per-group ``SortedSamples``, per (group, raw UoM) cell ``SortedSamples``
+            whose ids are the raw UoM ids, cell offsets of each group). The result for the
+            last labels is kept and returned again while the same labels are passed.
+        """
+        labels = np.asarray(labels)
+        if len(labels) != self.n_rows:
+            raise ValueError("The group labels do not match the rows of the indexed loss data.")
+        cached = self._grouping
+        if cached is not None and cached[0].dtype == labels.dtype and np.array_equal(cached[0], labels):
+            return cached[1]
+
+        group_codes, group_ids = pd.factorize(labels[self.rows], sort=True)
+        if len(group_ids) < 2**15:
+            group_codes = group_codes.astype(np.int16)  # stable sorts of int16 are radix sorts
+        missing = int((group_codes < 0).sum())  # code -1 sorts first and is dropped
+        group_counts = np.bincount(group_codes[group_codes >= 0], minlength=len(group_ids))
+        values = self.uoms.values
+
+        # The buffer is in (uom, amount) order and ``by_amount`` in amount order, so stable
+        # sorts by group code give (group, amount) and (group, uom, amount) orders.
+        by_group = self.by_amount[np.argsort(group_codes[self.by_amount], kind='stable')][missing:]
+        groups = SortedSamples(np.asarray(group_ids), values[by_group],
+                               np.concatenate(([0], np.cumsum(group_counts))).astype(np.int64))
+
+        by_cell = np.argsort(group_codes, kind='stable')[missing:]
+        num_uoms = len(self.uoms)
+        uom_codes = np.repeat(np.arange(num_uoms), self.uoms.counts)
+        cell_codes = group_codes[by_cell].astype(np.int64) * num_uoms + uom_codes[by_cell]
+        starts = np.flatnonzero(np.diff(cell_codes, prepend=-1))
+        present = cell_codes[starts]
+        cells = SortedSamples(self.uoms.ids[present % num_uoms], values[by_cell],
+                              np.append(starts, len(cell_codes)).astype(np.int64))
+        cell_offsets = np.searchsorted(present // num_uoms, np.arange(len(group_ids) + 1))
+
+        result = (groups, cells, cell_offsets)
+        self._grouping = (labels.copy(), result)
+        return result
@@ -0,0 +1,115 @@
+import os
+
+import pandas as pd
+
+# Columns the pages work with; anything else in a file is never read.
+LOSS_COLUMNS = ['uom_id', 'loss_amount', 'event_type', 'business_line', 'loss_date']
+REQUIRED_COLUMNS = ['uom_id', 'loss_amount']
+
+_FORMATS = {'.parquet': 'parquet', '.pq': 'parquet', '.arrow': 'ipc', '.feather': 'ipc', '.ipc': 'ipc'}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError("Reading Parquet/Arrow files requires pyarrow (pip install pyarrow).") from e
+
+
+def infer_format(path):
+    """'parquet' or 'ipc' from the file suffix; directories are read as Parquet datasets."""
+    if os.path.isdir(path):
+        return 'parquet'
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix not in _FORMATS:
+        raise ValueError(f"Unsupported loss data file '{path}'. Expected one of: {', '.join(sorted(_FORMATS))}.")
+    return _FORMATS[suffix]
+
+
+def open_loss_dataset(path, file_format=None):
+    """Opens a Parquet/Arrow file or directory of files as a memory-mapped pyarrow dataset."""
+    _require_pyarrow()
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+
+    return ds.dataset(path, format=file_format or infer_format(path),
+                      filesystem=fs.LocalFileSystem(use_mmap=True))
+
+
+def date_filter(dataset, start_date=None, end_date=None):
+    """Dataset filter keeping ``start_date <= loss_date < end_date``; ``None`` when unbounded."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    if start_date is None and end_date is None:
+        return None
+    if 'loss_date' not in dataset.schema.names:
+        raise KeyError("The 'loss_date' column is missing, so the data cannot be filtered by date.")
+    date_type = dataset.schema.field('loss_date').type
+    bounds = []
+    if start_date is not None:
+        bounds.append(ds.field('loss_date') >= pa.scalar(pd.Timestamp(start_date).to_pydatetime()).cast(date_type))
+    if end_date is not None:
+        bounds.append(ds.field('loss_date') < pa.scalar(pd.Timestamp(end_date).to_pydatetime()).cast(date_type))
+    return bounds[0] if len(bounds) == 1 else bounds[0] & bounds[1]
+
+
+def compact_loss_table(table):
+    """Casts a loss table to compact types: int32 ids, float32 amounts, dictionary strings."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    targets = {'uom_id': pa.int32(), 'loss_amount': pa.float32()}
+    for name in table.column_names:
+        column = table[name]
+        if name in targets and column.type != targets[name]:
+            column = pc.cast(column, targets[name])
+        elif pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            column = pc.dictionary_encode(column)
+        table = table.set_column(table.column_names.index(name), name, column)
+    return table
+
+
+def load_loss_data(path, start_date=None, end_date=None, columns=None, file_format=None):
+    """Loads loss events from Parquet or Arrow IPC files into a compact DataFrame.
+
+    Only the loss columns are read (column projection), and the date range is pushed down
+    to the file reader so that row groups outside it are skipped. Files are memory-mapped,
+    and numeric columns without nulls are handed to pandas without a copy.
+
+    Args:
+        path: A .parquet/.pq or .arrow/.feather/.ipc file, or a directory of Parquet files.
+        start_date: Keep losses on or after this date.
+        end_date: Keep losses strictly before this date.
+        columns: Columns to read; defaults to those of ``LOSS_COLUMNS`` present in the file.
+    Returns:
+        DataFrame with int32 uom_id, float32 loss_amount and categorical string columns.
+    """
+    dataset = open_loss_dataset(path, file_format)
+    missing = [name for name in REQUIRED_COLUMNS if name not in dataset.schema.names]
+    if missing:
+        raise KeyError(f"Loss data file is missing required columns: {', '.join(missing)}.")
+    if columns is None:
+        columns = [name for name in LOSS_COLUMNS if name in dataset.schema.names]
+    table = dataset.to_table(columns=columns, filter=date_filter(dataset, start_date, end_date))
+    return compact_loss_table(table).to_pandas(split_blocks=True, self_destruct=True)
+
+
+def iter_loss_batches(path, start_date=None, end_date=None, columns=None, batch_size=1 << 20, file_format=None):
+    """Yields the loss data as compact DataFrames of at most ``batch_size`` rows.
+
+    Same projection, date filter and dtypes as :func:`load_loss_data`, but the data set is
+    never fully materialised, so files larger than memory can be streamed.
+    """
+    import pyarrow as pa
+
+    dataset = open_loss_dataset(path, file_format)
+    missing = [name for name in REQUIRED_COLUMNS if name not in dataset.schema.names]
+    if missing:
+        raise KeyError(f"Loss data file is missing required columns: {', '.join(missing)}.")
+    if columns is None:
+        columns = [name for name in LOSS_COLUMNS if name in dataset.schema.names]
+    for batch in dataset.to_batches(columns=columns, filter=date_filter(dataset, start_date, end_date),
+                                    batch_size=batch_size):
+        if batch.num_rows:
+            yield compact_loss_table(pa.Table.from_batches([batch])).to_pandas()
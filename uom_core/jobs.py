@@ -0,0 +1,148 @@
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's progress callback once the job has been cancelled."""
+
+
+def frame_digest(data, columns):
+    """Content hash of some columns of a DataFrame, used to key jobs by their input."""
+    digest = hashlib.blake2b(digest_size=16)
+    for name in columns:
+        values = data[name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.cat.codes
+        elif values.dtype == object:
+            values = pd.util.hash_pandas_object(values, index=False)
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(values.to_numpy()).tobytes())
+    return digest.hexdigest()
+
+
+class Job:
+    """One background computation: its progress, latest partial result and outcome.
+
+    The running function receives :meth:`report` as its ``progress`` callback. Reporting
+    after :meth:`cancel` raises ``JobCancelled``, which is how cancellation stops the work
+    at the next checkpoint.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.done = 0
+        self.total = None
+        self.partial = None
+        self.started = time.perf_counter()
+        self.future = None
+        self._cancel = threading.Event()
+
+    def report(self, done, total, partial=None):
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.done, self.total, self.partial = done, total, partial
+
+    def cancel(self):
+        self._cancel.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.future is not None and self.future.done()
+
+    @property
+    def fraction(self):
+        if self.finished:
+            return 1.0
+        return self.done / self.total if self.total else 0.0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class JobOwner:
+    """Identity of one session's jobs. The session keeps it alive; once the session is
+    gone, its finished jobs are dropped with it."""
+
+
+class BackgroundJobs:
+    """Runs long computations on a thread pool, one current job per (owner, name) slot.
+
+    Submitting to a slot whose job has the same ``key`` (a hash of the inputs) returns
+    that job, running or finished, so reruns of a page pick up the work where it is.
+    A different key cancels the slot's job and starts a new one. Only unfinished jobs
+    hold a slot; each slot keeps its last ``keep_finished`` finished jobs (failed ones
+    included), so returning to the previous inputs is free and other sessions never
+    evict them. Finished jobs are held weakly by owner (a :class:`JobOwner`), so a
+    session that ended leaves nothing behind.
+    """
+
+    def __init__(self, max_workers=2, keep_finished=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='uom-job')
+        self._slots = {}
+        self._finished = weakref.WeakKeyDictionary()  # owner -> {name: OrderedDict(key -> job)}
+        self._lock = threading.Lock()
+        self.keep_finished = keep_finished
+
+    def submit(self, owner, name, key, func, *args, **kwargs):
+        """Job computing ``func(*args, progress=job.report, **kwargs)`` for this slot and key."""
+        slot = (owner, name)
+        with self._lock:
+            job = self._slots.get(slot)
+            if job is not None and job.key == key and not job.cancelled:
+                return job
+            if job is not None:
+                job.cancel()
+                del self._slots[slot]
+            finished = self._finished.get(owner, {}).get(name)
+            if finished is not None and key in finished:
+                finished.move_to_end(key)
+                return finished[key]
+            job = Job(key)
+            job.future = self._executor.submit(self._run, weakref.ref(owner), name, job, func, args, kwargs)
+            self._slots[slot] = job
+        return job
+
+    def get(self, owner, name):
+        """The slot's unfinished job, else its most recently used finished job, else None."""
+        with self._lock:
+            job = self._slots.get((owner, name))
+            if job is not None:
+                return job
+            finished = self._finished.get(owner, {}).get(name)
+            return next(reversed(finished.values())) if finished else None
+
+    def _run(self, owner_ref, name, job, func, args, kwargs):
+        # The owner is passed weakly: a failed job's traceback keeps this frame alive, and
+        # must not keep the session's finished jobs alive with it.
+        try:
+            return func(*args, progress=job.report, **kwargs)
+        finally:
+            self._finish(owner_ref(), name, job)
+
+    def _finish(self, owner, name, job):
+        with self._lock:
+            if self._slots.get((owner, name)) is job:
+                del self._slots[(owner, name)]
+            if owner is not None and not job.cancelled:
+                finished = self._finished.setdefault(owner, {}).setdefault(name, OrderedDict())
+                finished[job.key] = job
+                finished.move_to_end(job.key)
+                while len(finished) > self.keep_finished:
+                    finished.popitem(last=False)
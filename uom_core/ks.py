@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+
+# Upper bound on the number of ECDF evaluations held in memory for one block of pairs.
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+
+def calculate_ks_distance(data1, data2, presorted=False):
+    """Calculates the Kolmogorov-Smirnov distance (D-statistic) between two datasets.
+
+    Matches the original two-pointer merge exactly, including its tie convention: on equal
+    values the step of ``data1`` is taken before the step of ``data2``. Pass
+    ``presorted=True`` for ascending samples, such as segments of a ``SortedSamples``.
+    """
+    data1 = np.asarray(data1, dtype=float)
+    data2 = np.asarray(data2, dtype=float)
+    if not presorted:
+        data1, data2 = np.sort(data1), np.sort(data2)
+    n1 = len(data1)
+    n2 = len(data2)
+    if n1 == 0 or n2 == 0:
+        return 0.0  # Handle empty datasets
+    d1 = np.abs(np.arange(1, n1 + 1) / n1 - np.searchsorted(data2, data1, side='left') / n2).max()
+    d2 = np.abs(np.searchsorted(data1, data2, side='right') / n1 - np.arange(1, n2 + 1) / n2).max()
+    return float(max(d1, d2))
+
+
+class SortedSamples:
+    """Loss samples of many UoMs stored in one buffer, each segment sorted once.
+
+    Attributes:
+        ids: Sorted unique UoM ids; segment ``k`` belongs to ``ids[k]``.
+        values: Loss amounts, ascending within each segment.
+        offsets: Segment boundaries, ``values[offsets[k]:offsets[k + 1]]`` is UoM ``ids[k]``.
+        counts: Number of losses per UoM.
+    """
+
+    def __init__(self, ids, values, offsets):
+        self.ids = np.asarray(ids)
+        self.values = values
+        self.offsets = offsets
+        self.counts = np.diff(offsets)
+
+    @classmethod
+    def from_frame(cls, data, key='uom_id', value='loss_amount'):
+        """Builds the buffer from a long DataFrame with one global sort."""
+        codes, ids = pd.factorize(data[key], sort=True)
+        values = data[value].to_numpy(dtype=float)
+        if (codes < 0).any():  # rows with a missing key belong to no segment
+            values, codes = values[codes >= 0], codes[codes >= 0]
+        return cls.from_codes(codes, np.asarray(ids), values)
+
+    @classmethod
+    def from_codes(cls, codes, ids, values):
+        """Builds the buffer from integer segment codes ``0..len(ids)-1`` and raw values."""
+        # Sort by value, then stable-sort by code so that each segment stays ascending.
+        order = np.argsort(values, kind='stable')
+        order = order[np.argsort(codes[order], kind='stable')]
+        counts = np.bincount(codes, minlength=len(ids))
+        offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        return cls(ids, values[order], offsets)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def sample(self, k):
+        """Sorted losses of the ``k``-th UoM."""
+        return self.values[self.offsets[k]:self.offsets[k + 1]]
+
+
+def _segment_positions(offsets, counts, cols):
+    """Buffer indices and within-segment positions of the segments listed in ``cols``."""
+    sizes = counts[cols]
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    total = int(sizes.sum())
+    local = np.arange(total) - np.repeat(starts, sizes)
+    return np.repeat(offsets[cols], sizes) + local, local, starts, sizes
+
+
+def ks_distance_row(samples, i, cols, block_size=DEFAULT_BLOCK_SIZE, first=True):
+    """KS distances between UoM ``i`` and each UoM in ``cols``.
+
+    The other samples of a block of columns are located in sample ``i`` with a single
+    ``searchsorted`` call; a per-segment histogram of those positions then gives both
+    ECDFs at every point of the merged support without any per-pair Python work.
+    With ties the distance depends on argument order: ``first=True`` gives
+    ``calculate_ks_distance(sample i, sample j)`` and ``first=False`` gives
+    ``calculate_ks_distance(sample j, sample i)``.
+    """
+    cols = np.asarray(cols, dtype=np.int64)
+    out = np.zeros(len(cols))
+    n1 = int(samples.counts[i])
+    if n1 == 0 or len(cols) == 0:
+        return out
+    a = samples.sample(i)
+    cdf_a = np.arange(1, n1 + 1) / n1
+    nonempty = np.flatnonzero(samples.counts[cols] > 0)
+
+    # Group columns so that one block touches at most ``block_size`` ECDF values.
+    cost = np.cumsum(samples.counts[cols[nonempty]] + n1)
+    block_ids = cost // max(block_size, 1)
+    for block in np.split(nonempty, np.flatnonzero(np.diff(block_ids)) + 1):
+        if len(block) == 0:
+            continue
+        idx, local, starts, sizes = _segment_positions(samples.offsets, samples.counts, cols[block])
+        b = samples.values[idx]
+        seg = np.repeat(np.arange(len(block)), sizes)
+
+        # Insertion points of b in sample i; on ties the first sample steps first, so
+        # values of b go after equal values of i when i is first and before them otherwise.
+        pos = np.searchsorted(a, b, side='right' if first else 'left')
+
+        # Steps of the other samples: F_i at b (ties counted), F_j just after b.
+        gap_b = np.abs(pos / n1 - (local + 1) / np.repeat(sizes, sizes))
+        d_b = np.maximum.reduceat(gap_b, starts)
+
+        # Steps of sample i: F_i just after a[k], F_j below a[k] (strictly when i is first,
+        # else up to and including it). A value of b counts exactly when its insertion
+        # point is at most k.
+        hist = np.bincount(seg * (n1 + 1) + pos, minlength=len(block) * (n1 + 1))
+        below = np.cumsum(hist.reshape(len(block), n1 + 1), axis=1)[:, :n1]
+        d_a = np.abs(cdf_a[None, :] - below / sizes[:, None]).max(axis=1)
+
+        out[block] = np.maximum(d_a, d_b)
+    return out
+
+
+def ks_distance_matrix(samples, scaled=False, block_size=DEFAULT_BLOCK_SIZE, progress=None):
+    """Symmetric matrix of KS distances between all UoMs in ``samples``.
+
+    With ``scaled=True`` every entry is multiplied by ``n_i n_j / (n_i + n_j)``.
+    ``progress(rows_done, num_uoms, matrix)`` is called after every row; rows and columns
+    ``< rows_done`` of the unscaled matrix are then final. It may raise to stop early.
+    """
+    num_uoms = len(samples)
+    ks_matrix = np.zeros((num_uoms, num_uoms))
+    for i in range(num_uoms):
+        row = ks_distance_row(samples, i, np.arange(i, num_uoms), block_size=block_size)
+        ks_matrix[i, i:] = row
+        ks_matrix[i:, i] = row
+        if progress is not None:
+            progress(i + 1, num_uoms, ks_matrix)
+    if scaled:
+        ks_matrix *= scale_factors(samples.counts)
+    return ks_matrix
+
+
+def scale_factors(counts):
+    """Matrix of ``n_i n_j / (n_i + n_j)`` used for the scaled distance d_ij."""
+    n = np.asarray(counts, dtype=float)
+    total = n[:, None] + n[None, :]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        factors = np.outer(n, n) / total
+    return np.nan_to_num(factors)
@@ -0,0 +1,152 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from uom_core.ks import DEFAULT_BLOCK_SIZE, SortedSamples, ks_distance_matrix, ks_distance_row, scale_factors
+
+# Below this many ECDF evaluations the serial engine beats the cost of starting a pool.
+PARALLEL_MIN_WORK = 20_000_000
+
+
+def resolve_n_jobs(n_jobs):
+    """Number of worker processes for ``n_jobs`` (``None`` or negative means all cores)."""
+    if n_jobs is None or n_jobs < 0:
+        return os.cpu_count() or 1
+    return max(1, int(n_jobs))
+
+
+class SharedArray:
+    """A numpy array backed by a named shared-memory block.
+
+    Only ``spec`` (name, shape, dtype) is sent to worker processes, which map the same
+    memory with :meth:`attach` instead of receiving a pickled copy.
+    """
+
+    def __init__(self, shm, shape, dtype):
+        self.shm = shm
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, shape, dtype, fill=None):
+        dtype = np.dtype(dtype)
+        nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        shared = cls(SharedMemory(create=True, size=nbytes), shape, dtype)
+        if fill is not None:
+            shared.array[...] = fill
+        return shared
+
+    @classmethod
+    def copy_of(cls, array):
+        shared = cls.create(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, spec):
+        name, shape, dtype = spec
+        return cls(SharedMemory(name=name), shape, dtype)
+
+    @property
+    def spec(self):
+        return self.shm.name, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+
+    def release(self):
+        """Closes and frees the block; call once from the owning process."""
+        self.close()
+        self.shm.unlink()
+
+
+def process_pool(n_jobs, initializer=None, initargs=()):
+    """Process pool used by the parallel engines.
+
+    Workers are spawned rather than forked because Streamlit runs scripts in threads,
+    and forking a multi-threaded process is unsafe.
+    """
+    return ProcessPoolExecutor(max_workers=n_jobs, mp_context=get_context('spawn'),
+                               initializer=initializer, initargs=initargs)
+
+
+# Per-worker state set up once by ``_init_ks_worker``.
+_worker = {}
+
+
+def _init_ks_worker(ids, values_spec, offsets, result_spec, block_size):
+    values = SharedArray.attach(values_spec)
+    result = SharedArray.attach(result_spec)
+    _worker['buffers'] = (values, result)
+    _worker['samples'] = SortedSamples(ids, values.array, offsets)
+    _worker['result'] = result.array
+    _worker['block_size'] = block_size
+
+
+def _ks_tile(rows, cols):
+    """Fills one tile of the upper triangle (and its mirror) in the shared result."""
+    samples, result = _worker['samples'], _worker['result']
+    for i in range(*rows):
+        start = max(cols[0], i)
+        if start >= cols[1]:
+            continue
+        row = ks_distance_row(samples, i, np.arange(start, cols[1]), block_size=_worker['block_size'])
+        result[i, start:cols[1]] = row
+        result[start:cols[1], i] = row
+    return rows, cols
+
+
+def upper_triangle_tiles(num_uoms, tile_size):
+    """(row range, column range) pairs covering the upper triangle including the diagonal."""
+    edges = list(range(0, num_uoms, tile_size)) + [num_uoms]
+    bounds = list(zip(edges[:-1], edges[1:]))
+    return [(r, c) for k, r in enumerate(bounds) for c in bounds[k:]]
+
+
+def ks_distance_matrix_parallel(samples, n_jobs=None, scaled=False, tile_size=None,
+                                block_size=DEFAULT_BLOCK_SIZE, min_work=PARALLEL_MIN_WORK, progress=None):
+    """KS distance matrix computed by a process pool, returned as float32.
+
+    The upper triangle is cut into square tiles that are handed to the workers. Sorted
+    samples are placed in shared memory once and every worker writes its tiles straight
+    into a preallocated shared float32 matrix. Inputs with fewer than ``min_work`` ECDF
+    evaluations, or ``n_jobs=1``, run serially without starting a pool.
+    ``progress(tiles_done, num_tiles, None)`` is called as tiles complete (row by row,
+    with the partial matrix, when serial); if it raises, pending tiles are cancelled.
+    """
+    num_uoms = len(samples)
+    n_jobs = resolve_n_jobs(n_jobs)
+    work = (num_uoms + 1) * int(samples.counts.sum())
+    if n_jobs == 1 or num_uoms < 2 or work < min_work:
+        return ks_distance_matrix(samples, scaled=scaled, block_size=block_size, progress=progress).astype(np.float32)
+
+    if tile_size is None:
+        # About four tiles per worker along each axis keeps the pool evenly loaded.
+        tile_size = max(1, math.ceil(num_uoms / (4 * n_jobs)))
+    values = SharedArray.copy_of(samples.values)
+    result = SharedArray.create((num_uoms, num_uoms), np.float32, fill=0.0)
+    try:
+        initargs = (samples.ids, values.spec, samples.offsets, result.spec, block_size)
+        with process_pool(n_jobs, _init_ks_worker, initargs) as pool:
+            tiles = upper_triangle_tiles(num_uoms, tile_size)
+            futures = [pool.submit(_ks_tile, rows, cols) for rows, cols in tiles]
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    future.result()
+                    if progress is not None:
+                        progress(done, len(tiles), None)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        ks_matrix = result.array.copy()
+    finally:
+        values.release()
+        result.release()
+    if scaled:
+        ks_matrix *= scale_factors(samples.counts).astype(np.float32)
+    return ks_matrix
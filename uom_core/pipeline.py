@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from uom_core.cache import KSMatrixCache
+from uom_core.capital import fit_loss_models, simulate_capital
+from uom_core.clustering import dominant_categories
+from uom_core.grouping import GroupedLosses, business_group_labels, cluster_group_mapping, create_ks_distance_matrix
+from uom_core.homogeneity import assess_homogeneity, assess_homogeneity_pvalues
+from uom_core.index import LossIndex
+
+STRATEGIES = ('none', 'business', 'cluster', 'combined')
+
+
+def group_losses(data, strategy='none', ks_matrix=None, event_types=None, k=3, method='average',
+                 override_categories=None, override_factor=0.5):
+    """Applies one of the grouping strategies of the UoM Grouping page without a UI.
+
+    Args:
+        data: DataFrame with uom_id, loss_amount and event_type.
+        strategy: One of ``STRATEGIES``: raw UoMs, business grouping of ``event_types``,
+            KS clustering into ``k`` groups, or clustering after halving the distances of
+            UoMs whose dominant event type is in ``override_categories``.
+        ks_matrix: KS distance matrix of the raw UoMs, required by the clustering strategies.
+    Returns:
+        :class:`GroupedLosses` labelling the rows of ``data``, which is not copied.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown grouping strategy '{strategy}'. Expected one of: {', '.join(STRATEGIES)}.")
+    if strategy == 'none':
+        return GroupedLosses(data, data['uom_id'].to_numpy())
+    if strategy == 'business':
+        return GroupedLosses(data, business_group_labels(data, event_types or []))
+    if ks_matrix is None:
+        raise ValueError(f"The '{strategy}' strategy needs the KS distance matrix.")
+    override_uoms = None
+    if strategy == 'combined' and override_categories:
+        categories = dominant_categories(data)
+        override_uoms = categories.index[categories.isin(override_categories)]
+    mapping, _ = cluster_group_mapping(np.sort(data['uom_id'].unique()), ks_matrix, k, method=method,
+                                       override_uoms=override_uoms, override_factor=override_factor)
+    return GroupedLosses.from_mapping(data, mapping)
+
+
+def run_pipeline(data, strategy='none', scaled=False, pvalues=False, n_jobs=1, capital_years=0,
+                 frequency_model='auto', **grouping_options):
+    """Runs KS matrix, grouping and homogeneity assessment on a loss data set.
+
+    ``grouping_options`` are passed to :func:`group_losses`. The clustering strategies always
+    use the unscaled matrix, as on the UoM Grouping page; ``scaled`` only affects the
+    matrix that is returned. With ``capital_years`` the fitted loss models and the simulated
+    capital of every group are added.
+
+    Returns:
+        Dict with the KS matrix (DataFrame), the grouped data, the homogeneity table
+        indexed by grouped_uom_id (with a p-value column when ``pvalues`` is set), and with
+        ``capital_years`` a capital table of fitted parameters, VaR and ES per group.
+    """
+    cache = KSMatrixCache()  # the scaled matrix is derived from the cached raw one
+    index = LossIndex(data)  # losses sorted once for every step
+    ks_matrix = create_ks_distance_matrix(data, n_jobs=n_jobs, cache=cache, index=index)
+    grouped_data = group_losses(data, strategy, ks_matrix=ks_matrix, **grouping_options).frame()
+    homogeneity = pd.DataFrame.from_dict(assess_homogeneity(grouped_data, index=index), orient='index',
+                                         columns=['ks_statistic'])
+    if pvalues:
+        homogeneity['p_value'] = pd.Series(assess_homogeneity_pvalues(grouped_data, n_jobs=n_jobs, index=index))
+    homogeneity.index.name = 'grouped_uom_id'
+    if scaled:
+        ks_matrix = create_ks_distance_matrix(data, scaled=True, n_jobs=n_jobs, cache=cache, index=index)
+    results = {'ks_matrix': ks_matrix, 'grouped_data': grouped_data, 'homogeneity': homogeneity.sort_index()}
+    if capital_years:
+        models = fit_loss_models(grouped_data, frequency_model=frequency_model)
+        results['capital'] = models.join(simulate_capital(models, n_years=capital_years, n_jobs=n_jobs))
+    return results
+
+
+def group_labels(grouped_data):
+    """Distinct (uom_id[, event_type], grouped_uom_id) rows: where each raw UoM's losses went."""
+    columns = ['uom_id', 'grouped_uom_id']
+    # Business grouping can split a UoM by event type; only then is the event type needed.
+    if ('event_type' in grouped_data.columns
+            and grouped_data.groupby('uom_id', observed=True)['grouped_uom_id'].nunique().max() > 1):
+        columns.insert(1, 'event_type')
+    return grouped_data[columns].drop_duplicates().sort_values(columns).reset_index(drop=True)
+
+
+def write_results(results, output_dir, matrix_format='csv'):
+    """Writes ks_matrix.{csv,npy}, groups.csv, homogeneity.csv (and capital.csv) to ``output_dir``.
+
+    Returns:
+        List of the paths written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    ks_matrix = results['ks_matrix']
+    if matrix_format == 'npy':
+        paths.append(os.path.join(output_dir, 'ks_matrix.npy'))
+        np.save(paths[-1], ks_matrix.to_numpy())
+    else:
+        paths.append(os.path.join(output_dir, 'ks_matrix.csv'))
+        ks_matrix.to_csv(paths[-1])
+    paths.append(os.path.join(output_dir, 'groups.csv'))
+    group_labels(results['grouped_data']).to_csv(paths[-1], index=False)
+    paths.append(os.path.join(output_dir, 'homogeneity.csv'))
+    results['homogeneity'].to_csv(paths[-1])
+    if 'capital' in results:
+        paths.append(os.path.join(output_dir, 'capital.csv'))
+        results['capital'].to_csv(paths[-1])
+    return paths
@@ -0,0 +1,153 @@
+import math
+
+import numpy as np
+
+from uom_core.ecdf import ECDF_MAX_POINTS, downsample_ecdf
+from uom_core.homogeneity import indexed_group_samples
+from uom_core.sketch import sketches_by_column
+
+# Above this many plotted points the ECDF traces switch to WebGL (Scattergl).
+WEBGL_MIN_POINTS = 10_000
+# Heatmaps are block-averaged down to at most this many cells along each axis.
+HEATMAP_MAX_SIDE = 200
+# Cells are annotated with their value only up to this many cells along each axis.
+HEATMAP_TEXT_MAX_SIDE = 30
+
+
+def ecdf_curves(data, grouped_uom_id_col='grouped_uom_id', max_points=ECDF_MAX_POINTS, index=None):
+    """Reduced ECDF of every raw UoM, as a list of (grouped id, [(raw id, x, F(x)), ...]).
+
+    With a ``LossIndex`` of the rows of ``data``, curves of raw UoMs kept whole by the
+    grouping are the index's stored ECDFs.
+    """
+    groups, cells, cell_offsets = indexed_group_samples(data, index, group_col=grouped_uom_id_col)
+    curves = []
+    for i, grouped_id in enumerate(groups.ids):
+        members = []
+        for cell in range(cell_offsets[i], cell_offsets[i + 1]):
+            sorted_losses = cells.sample(cell)
+            if len(sorted_losses) > 1:
+                if index is None:
+                    x_cdf, y_cdf = downsample_ecdf(sorted_losses, max_points)
+                else:
+                    x_cdf, y_cdf = index.ecdf(cells.ids[cell], sorted_losses, max_points)
+                members.append((cells.ids[cell], x_cdf, y_cdf))
+        curves.append((grouped_id, members))
+    return curves
+
+
+def sketch_ecdf_curves(data, sketches, grouped_uom_id_col='grouped_uom_id', max_points=ECDF_MAX_POINTS):
+    """Like :func:`ecdf_curves`, from quantile sketches merged per (group, raw UoM)."""
+    cells = data.assign(_cell=list(zip(data[grouped_uom_id_col], data['uom_id'])))
+    curves = {}
+    for (grouped_id, raw_uom_id), sketch in sketches_by_column(cells, sketches, '_cell').items():
+        if sketch.n > 1:
+            x_cdf, y_cdf = sketch.ecdf()
+            curves.setdefault(grouped_id, []).append((raw_uom_id, *downsample_ecdf(x_cdf, max_points, cdf=y_cdf)))
+    return list(curves.items())
+
+
+def plot_cdfs(data, grouped_uom_id_col='grouped_uom_id', max_points=ECDF_MAX_POINTS, sketches=None, index=None):
+    """Plots Empirical CDFs of losses for each raw UoM within its grouped UoM.
+
+    The raw UoMs of all groups come out of a single sort, and each curve is reduced to at
+    most ``max_points`` quantile points, so the figure size does not grow with the
+    number of loss events. With ``sketches`` (out-of-core mode) the curves are the
+    approximate CDFs of the quantile sketches instead. A ``LossIndex`` of the rows of
+    ``data`` replaces that sort.
+    """
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    if sketches is None:
+        curves = ecdf_curves(data, grouped_uom_id_col, max_points, index=index)
+    else:
+        curves = sketch_ecdf_curves(data, sketches, grouped_uom_id_col, max_points)
+
+    # Define a color-blind-friendly palette
+    colors = px.colors.qualitative.Plotly  # Or other suitable palette like D3, Safe, Pastel
+
+    traces = []
+    for i, (grouped_id, members) in enumerate(curves):
+        for j, (raw_uom_id, x_cdf, y_cdf) in enumerate(members):
+            # Assign a distinct color for each raw UoM within the group, cycling through colors
+            trace_color = colors[(i * len(members) + j) % len(colors)]
+            traces.append(dict(x=x_cdf, y=y_cdf,
+                               mode='lines',
+                               name=f'Group {grouped_id} - Raw UoM {raw_uom_id}',
+                               line=dict(color=trace_color),
+                               hovertemplate=f"Raw UoM: {raw_uom_id}<br>Loss Amount: %{{x}}<br>CDF: %{{y:.2f}}<extra></extra>"))
+
+    # SVG rendering slows down sharply with many points; WebGL keeps the browser responsive.
+    trace_type = go.Scattergl if sum(len(t['x']) for t in traces) > WEBGL_MIN_POINTS else go.Scatter
+    fig.add_traces([trace_type(**trace) for trace in traces])
+
+    fig.update_layout(title='Empirical CDFs of Losses per Grouped UoM',
+                      xaxis_title='Loss Amount',
+                      yaxis_title='CDF',
+                      legend_title='UoMs',
+                      hovermode='x unified',
+                      font=dict(size=12))  # Ensure font size >= 12 pt
+    return fig
+
+
+def block_edges(n, max_side=HEATMAP_MAX_SIDE):
+    """Boundaries of the equal blocks that reduce ``n`` rows to at most ``max_side``."""
+    block = max(1, math.ceil(n / max_side))
+    return np.minimum(np.arange(0, n + block, block), n)[:math.ceil(n / block) + 1]
+
+
+def block_aggregate(matrix, row_edges, col_edges=None):
+    """float32 mean of every (row block, column block) tile of a matrix."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    col_edges = row_edges if col_edges is None else col_edges
+    if len(row_edges) == matrix.shape[0] + 1 and len(col_edges) == matrix.shape[1] + 1:
+        return matrix
+    sums = np.add.reduceat(np.add.reduceat(matrix, row_edges[:-1], axis=0), col_edges[:-1], axis=1)
+    return sums / np.outer(np.diff(row_edges), np.diff(col_edges)).astype(np.float32)
+
+
+def block_labels(labels, edges):
+    """Axis label of every block: the label itself, or 'first – last' of a range."""
+    labels = np.asarray(labels)
+    return [str(labels[a]) if b - a == 1 else f"{labels[a]} – {labels[b - 1]}" for a, b in zip(edges[:-1], edges[1:])]
+
+
+def plot_heatmap(matrix, labels, title, color_label, column_labels=None, colorscale=None, zmin=None, zmax=None,
+                 order=None, max_side=HEATMAP_MAX_SIDE, text_max_side=HEATMAP_TEXT_MAX_SIDE, text_format=".2f"):
+    """Heatmap of a UoM matrix whose size is bounded whatever the number of UoMs.
+
+    Rows and columns of a square matrix are first put in ``order`` (e.g. from
+    :func:`uom_core.clustering.seriation_order`), then averaged over blocks of UoMs down to
+    at most ``max_side`` cells along each axis. Values are sent to the browser as one
+    float32 array, and cell text is added only when the heatmap has at most
+    ``text_max_side`` cells along each axis. ``column_labels`` is needed for a
+    rectangular matrix, such as one tile of a larger heatmap.
+
+    Returns:
+        Tuple of (figure, row block edges in the ordered matrix, ordered row labels).
+        Block ``i`` covers the ordered rows ``edges[i]:edges[i + 1]``.
+    """
+    import plotly.graph_objects as go
+
+    matrix = np.asarray(matrix)
+    labels = np.asarray(labels)
+    column_labels = labels if column_labels is None else np.asarray(column_labels)
+    if order is not None:
+        matrix, labels, column_labels = matrix[np.ix_(order, order)], labels[order], column_labels[order]
+    row_edges = block_edges(matrix.shape[0], max_side)
+    col_edges = block_edges(matrix.shape[1], max_side)
+    z = block_aggregate(matrix, row_edges, col_edges)
+    x, y = block_labels(column_labels, col_edges), block_labels(labels, row_edges)
+    text = {'texttemplate': f"%{{z:{text_format}}}"} if max(z.shape) <= text_max_side else {}
+    aggregated = z.shape != matrix.shape
+    fig = go.Figure(go.Heatmap(
+        z=z, x=x, y=y, colorscale=colorscale, zmin=zmin, zmax=zmax,
+        colorbar=dict(title=f"{color_label} (block mean)" if aggregated else color_label),
+        hovertemplate="%{y} vs %{x}<br>%{z:.3f}<extra></extra>", **text
+    ))
+    fig.update_layout(title_text=title, font=dict(size=12))
+    fig.update_xaxes(side="top", type="category")
+    fig.update_yaxes(autorange="reversed", type="category")
+    return fig, row_edges, labels
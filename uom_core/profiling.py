@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager, nullcontext
+
+# Returned by ``Profiler.span`` while profiling is off, so a disabled span costs one call.
+_NO_SPAN = nullcontext()
+
+# tracemalloc is process-wide: its start, stop and peak reset would disturb the spans of
+# every other profiler. One profiler at a time owns memory tracing.
+_tracing_lock = threading.RLock()  # re-entrant: the owner's weakref callback may run inside
+_tracing = {'owner': None, 'started': False}
+
+
+def _claim_tracing(profiler):
+    """Makes ``profiler`` the owner of memory tracing unless another live profiler is."""
+    with _tracing_lock:
+        owner = _tracing['owner']() if _tracing['owner'] is not None else None
+        if owner is not None:
+            return owner is profiler
+        _tracing['owner'] = weakref.ref(profiler, _release_tracing)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing['started'] = True
+        return True
+
+
+def _release_tracing(owner_ref):
+    """Stops the tracing we started once its owner (a weakref) gives it up or is collected."""
+    with _tracing_lock:
+        if _tracing['owner'] is not owner_ref:
+            return
+        _tracing['owner'] = None
+        if _tracing['started']:
+            tracemalloc.stop()
+            _tracing['started'] = False
+
+
+class Profiler:
+    """Collects timing spans (and optional tracemalloc memory figures) of one run.
+
+    Wrap each stage in ``with profiler.span("name"):``. Spans nest; each records its start
+    relative to :meth:`reset`, its duration, and with ``trace_memory`` the change in traced
+    memory and the peak reached inside it. While ``enabled`` is False nothing is recorded.
+
+    tracemalloc is process-wide, so only one profiler of the process traces memory at a
+    time: the first to ask keeps it until it turns tracing off or is garbage collected,
+    and ``tracing_memory`` tells a profiler whether it got it. The figures include memory
+    allocated meanwhile by other threads of the process.
+    """
+
+    def __init__(self, enabled=False, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.tracing_memory = False
+        self.spans = []
+        self._stack = []
+        self._origin = time.perf_counter_ns()
+
+    def reset(self):
+        """Drops the recorded spans and starts timing a new run."""
+        self.spans = []
+        self._stack = []
+        self._origin = time.perf_counter_ns()
+        if self.enabled and self.trace_memory:
+            self.tracing_memory = _claim_tracing(self)
+        elif self.tracing_memory:
+            _release_tracing(_tracing['owner'])
+            self.tracing_memory = False
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return _NO_SPAN
+        return self._span(name, attrs)
+
+    @contextmanager
+    def _span(self, name, attrs):
+        memory = self.tracing_memory and tracemalloc.is_tracing()
+        frame = {'child_peak': 0}
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:  # keep the parent's peak so far; reset_peak below would lose it
+                self._stack[-1]['child_peak'] = max(self._stack[-1]['child_peak'], peak)
+            tracemalloc.reset_peak()
+            frame['memory'] = current
+        self._stack.append(frame)
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            self._stack.pop()
+            record = {'name': name, 'depth': len(self._stack),
+                      'start_ms': (start - self._origin) / 1e6, 'duration_ms': (end - start) / 1e6,
+                      'thread': threading.get_ident()}
+            if memory:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, frame['child_peak'])
+                record['memory_delta_kib'] = (current - frame['memory']) / 1024
+                record['peak_kib'] = (peak - frame['memory']) / 1024
+                if self._stack:
+                    self._stack[-1]['child_peak'] = max(self._stack[-1]['child_peak'], peak)
+            if attrs:
+                record['attrs'] = attrs
+            self.spans.append(record)
+
+    def summary(self):
+        """Spans ordered by start time."""
+        return sorted(self.spans, key=lambda span: span['start_ms'])
+
+    def to_json(self):
+        return json.dumps({'spans': self.summary()}, indent=2, default=str)
+
+    def to_trace_events(self):
+        """Spans in the Chrome trace-event format, for chrome://tracing or Perfetto."""
+        pid = os.getpid()
+        events = []
+        for span in self.summary():
+            args = dict(span.get('attrs', {}))
+            for key in ('memory_delta_kib', 'peak_kib'):
+                if key in span:
+                    args[key] = span[key]
+            events.append({'name': span['name'], 'ph': 'X', 'pid': pid, 'tid': span['thread'],
+                           'ts': span['start_ms'] * 1000, 'dur': span['duration_ms'] * 1000, 'args': args})
+        return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}, default=str)
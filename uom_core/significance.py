@@ -0,0 +1,215 @@
+import hashlib
+
+import numpy as np
+
+from uom_core.parallel import process_pool, resolve_n_jobs
+
+DEFAULT_RESAMPLES = 10_000
+# Resampled values held at once per batch (replicates x sample size), about 40 MB of work arrays.
+BATCH_ELEMENTS = 2_000_000
+# Replicates in the first batch; later batches double until they reach the memory bound.
+FIRST_BATCH = 500
+# z-score of the early-stopping test; a p-value is resolved once it differs from alpha at 99.9%.
+EARLY_STOP_Z = 3.29
+
+
+def merge_sorted(a, b):
+    """Merges two ascending samples without sorting, putting ``a`` first within ties.
+
+    Returns:
+        Tuple of (pooled ascending values, bool labels that are True for items of ``a``).
+    """
+    pooled = np.empty(len(a) + len(b), dtype=np.result_type(a, b))
+    from_a = np.zeros(len(pooled), dtype=bool)
+    pos_a = np.arange(len(a)) + np.searchsorted(b, a, side='left')
+    pos_b = np.arange(len(b)) + np.searchsorted(a, b, side='right')
+    pooled[pos_a], pooled[pos_b] = a, b
+    from_a[pos_a] = True
+    return pooled, from_a
+
+
+def tie_blocks(pooled):
+    """First and last index of every run of equal values in an ascending sample."""
+    change = np.flatnonzero(pooled[1:] != pooled[:-1])
+    return np.concatenate(([0], change + 1)), np.append(change, len(pooled) - 1)
+
+
+def labelled_ks_statistics(labels, n1, starts, ends):
+    """KS distance of every row of a (replicates x pooled size) bool label matrix.
+
+    Row ``r`` splits the pooled sorted sample into the items labelled True (sample 1, of
+    size ``n1``) and the rest. The two ECDFs are compared at the tie blocks ``starts`` /
+    ``ends`` of the pooled values using the engine's convention that sample 1 steps first
+    within ties, so the result matches :func:`uom_core.ks.calculate_ks_distance` up to
+    rounding. Gaps are kept as integers ``n2 * A - n1 * B`` until the final division.
+    """
+    labels = np.atleast_2d(labels)
+    size = labels.shape[1]
+    n2 = size - n1
+    dtype = np.int32 if size * size < 2**31 else np.int64
+    cum = np.cumsum(labels, axis=1, dtype=dtype)
+    if len(ends) == size:  # no ties: every position ends a block
+        a_end = cum
+    else:
+        a_end = cum[:, ends]
+    # n2 * A - n1 * B with B = ends + 1 - A after each block ...
+    gap = a_end * dtype(size) - ((ends + 1) * n1).astype(dtype)
+    widest = np.maximum(gap.max(axis=1), -gap.min(axis=1))
+    if len(ends) < size:
+        # ... and before the block's items of sample 2, where B = starts - (A before the block).
+        a_before = np.where(starts > 0, cum[:, np.maximum(starts - 1, 0)], 0)
+        gap = a_end * dtype(n2) - (starts - a_before) * dtype(n1)
+        widest = np.maximum(widest, np.abs(gap).max(axis=1))
+    return widest / (n1 * n2)
+
+
+def _permutation_null(rng, size, n1, n2, starts, ends):
+    """KS distances of ``size`` random relabellings of a pooled sample of ``n1 + n2`` values."""
+    # The positions of the n1 smallest of N uniform keys form a uniformly random label set.
+    keys = rng.random((size, n1 + n2))
+    labels = keys <= np.partition(keys, n1 - 1, axis=1)[:, n1 - 1:n1]
+    return labelled_ks_statistics(labels, n1, starts, ends)
+
+
+def _normal_null(rng, size, n):
+    """One-sample KS statistics of ``size`` normal samples of size ``n`` against their own fit."""
+    from scipy.special import ndtr
+
+    x = np.sort(rng.standard_normal((size, n)), axis=1)
+    mean = x.mean(axis=1, keepdims=True)
+    std = x.std(axis=1, keepdims=True)
+    cdf = ndtr((x - mean) / std)
+    pos = np.arange(n)
+    return np.maximum(((pos + 1) / n - cdf).max(axis=1), (cdf - pos / n).max(axis=1))
+
+
+def _resolved(exceed, done, alpha):
+    """True where ``(exceed + 1) / (done + 1)`` is clearly on one side of ``alpha``."""
+    pvalue = (exceed + 1) / (done + 1)
+    return np.abs(pvalue - alpha) > EARLY_STOP_Z * np.sqrt(alpha * (1 - alpha) / done)
+
+
+def _monte_carlo_pvalues(task):
+    """Resamples one null distribution in batches and tests every statistic sharing it.
+
+    Batches start at ``FIRST_BATCH`` replicates and double, so clear-cut cases stop early.
+    Statistics whose p-value is resolved (see :func:`_resolved`) stop counting; the loop
+    ends once all are resolved or ``n_resamples`` replicates were drawn.
+    """
+    kind, params, observed, n_resamples, batch, alpha, early_stop, seed = task
+    rng = np.random.default_rng(seed)
+    exceed = np.zeros(len(observed), dtype=np.int64)
+    done = np.zeros(len(observed), dtype=np.int64)
+    active = np.isfinite(observed)
+    drawn = 0
+    while drawn < n_resamples and active.any():
+        size = min(batch, n_resamples - drawn, max(FIRST_BATCH, drawn))
+        null = np.sort(_permutation_null(rng, size, *params) if kind == 'permutation'
+                       else _normal_null(rng, size, *params))
+        # Small tolerance so that statistics equal up to rounding count as exceedances.
+        exceed[active] += size - np.searchsorted(null, observed[active] * (1 - 1e-12), side='left')
+        done[active] += size
+        drawn += size
+        if early_stop:
+            active &= ~_resolved(exceed, done, alpha)
+    with np.errstate(invalid='ignore'):
+        pvalues = np.where(np.isfinite(observed), (exceed + 1) / (done + 1), np.nan)
+    return pvalues, done
+
+
+def _run_tasks(tasks, n_jobs):
+    n_jobs = min(resolve_n_jobs(n_jobs), len(tasks))
+    if n_jobs <= 1:
+        return [_monte_carlo_pvalues(task) for task in tasks]
+    with process_pool(n_jobs) as pool:
+        return list(pool.map(_monte_carlo_pvalues, tasks))
+
+
+def _batch_size(sample_size, n_resamples):
+    return int(min(n_resamples, max(1, BATCH_ELEMENTS // max(sample_size, 1))))
+
+
+def ks_permutation_pvalues(samples, pairs, n_resamples=DEFAULT_RESAMPLES, alpha=0.05,
+                           early_stop=True, seed=None, n_jobs=1):
+    """Permutation p-values of the two-sample KS distance for pairs of sorted samples.
+
+    Each pair's two sorted segments are merged without sorting again. A permutation only
+    relabels the pooled sorted values, so a batch of replicates is a bool matrix and its
+    KS distances come out of one cumulative sum. The null distribution depends only on the
+    two sample sizes and the tie pattern of the pooled values, so pairs sharing those share
+    one set of replicates. Those null distributions are spread over ``n_jobs`` processes.
+
+    With ``early_stop`` a pair stops resampling once its p-value is clearly above or
+    below ``alpha`` (a z-test at ``EARLY_STOP_Z``); otherwise all ``n_resamples`` are used.
+
+    Args:
+        samples: ``SortedSamples`` of the UoMs.
+        pairs: Sequence of (i, j) segment indices.
+    Returns:
+        Tuple of (KS distances, p-values, replicates used), one entry per pair.
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    statistics = np.zeros(len(pairs))
+    pvalues = np.ones(len(pairs))
+    used = np.zeros(len(pairs), dtype=np.int64)
+    null_groups = {}
+    for p, (i, j) in enumerate(pairs):
+        a, b = samples.sample(i), samples.sample(j)
+        if len(a) == 0 or len(b) == 0:
+            continue
+        pooled, from_a = merge_sorted(a, b)
+        starts, ends = tie_blocks(pooled)
+        statistics[p] = labelled_ks_statistics(from_a, len(a), starts, ends)[0]
+        ties = None if len(starts) == len(pooled) else hashlib.blake2b(starts.tobytes(), digest_size=16).digest()
+        key = (len(a), len(b), ties)
+        if key not in null_groups:
+            null_groups[key] = ((len(a), len(b), starts, ends), [])
+        null_groups[key][1].append(p)
+
+    seeds = np.random.SeedSequence(seed).spawn(len(null_groups))
+    tasks = [('permutation', params, statistics[members], n_resamples,
+              _batch_size(params[0] + params[1], n_resamples), alpha, early_stop, child)
+             for ((params, members), child) in zip(null_groups.values(), seeds)]
+    for (_, members), (group_pvalues, group_used) in zip(null_groups.values(), _run_tasks(tasks, n_jobs)):
+        pvalues[members], used[members] = group_pvalues, group_used
+    return statistics, pvalues, used
+
+
+def ks_pvalue_matrix(samples, n_resamples=DEFAULT_RESAMPLES, alpha=0.05, early_stop=True, seed=None, n_jobs=1):
+    """Symmetric matrix of permutation p-values for every pair of samples (ones on the diagonal)."""
+    rows, cols = np.triu_indices(len(samples), k=1)
+    _, pvalues, _ = ks_permutation_pvalues(samples, np.column_stack((rows, cols)), n_resamples=n_resamples,
+                                           alpha=alpha, early_stop=early_stop, seed=seed, n_jobs=n_jobs)
+    matrix = np.ones((len(samples), len(samples)))
+    matrix[rows, cols] = matrix[cols, rows] = pvalues
+    return matrix
+
+
+def normal_ks_pvalues(samples, statistics, n_resamples=DEFAULT_RESAMPLES, alpha=0.05,
+                      early_stop=True, seed=None, n_jobs=1):
+    """Parametric bootstrap p-values for :func:`uom_core.homogeneity.normal_ks_statistics`.
+
+    The statistic compares each segment with a normal fitted to that same segment, so its
+    null distribution (Lilliefors) is simulated by fitting and testing normal samples of the
+    segment's size. It does not depend on the fitted mean or std, so segments of equal size
+    share one set of replicates. Segments whose statistic is NaN get a NaN p-value.
+
+    Returns:
+        Tuple of (p-values, replicates used), one entry per segment.
+    """
+    statistics = np.asarray(statistics, dtype=float)
+    pvalues = np.full(len(statistics), np.nan)
+    used = np.zeros(len(statistics), dtype=np.int64)
+    sizes = samples.counts
+    by_size = {}
+    for g in np.flatnonzero(np.isfinite(statistics)):
+        by_size.setdefault(int(sizes[g]), []).append(g)
+
+    seeds = np.random.SeedSequence(seed).spawn(len(by_size))
+    tasks = [('normal', (n,), statistics[members], n_resamples, _batch_size(n, n_resamples),
+              alpha, early_stop, child)
+             for ((n, members), child) in zip(by_size.items(), seeds)]
+    for members, (group_pvalues, group_used) in zip(by_size.values(), _run_tasks(tasks, n_jobs)):
+        pvalues[members], used[members] = group_pvalues, group_used
+    return pvalues, used
+
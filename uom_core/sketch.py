@@ -0,0 +1,299 @@
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# Default accuracy parameter; about 1.7% rank error at 99% confidence.
+DEFAULT_K = 200
+# Smallest buffer kept on the lowest levels of a sketch.
+MIN_CAPACITY = 8
+
+
+def normalized_rank_error(k):
+    """Rank error of a KLL sketch with parameter ``k`` that holds with 99% confidence.
+
+    Uses the double-sided (CDF/PMF) constant measured for KLL by the Apache DataSketches
+    project: every value of the sketch's CDF is within this distance of the exact ECDF.
+    """
+    return 2.446 / k ** 0.9433
+
+
+class KLLSketch:
+    """Mergeable KLL quantile sketch of one stream of losses, plus its exact moments.
+
+    Items live in levels; an item on level ``h`` stands for ``2**h`` losses. When a level
+    outgrows its capacity it is sorted and every second item (from a random offset) is
+    promoted to the next level. Capacities shrink geometrically towards the lower levels,
+    so memory stays at O(k) however many losses are added.
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def mean(self):
+        return self._mean if self.n else np.nan
+
+    @property
+    def std(self):
+        """Population standard deviation (``ddof=0``) of every loss added."""
+        return np.sqrt(self._m2 / self.n) if self.n else np.nan
+
+    @property
+    def is_exact(self):
+        """True while no compaction has happened, i.e. the sketch still holds every loss."""
+        return all(len(items) == 0 for items in self.levels[1:])
+
+    @property
+    def rank_error(self):
+        return 0.0 if self.is_exact else normalized_rank_error(self.k)
+
+    @property
+    def nbytes(self):
+        return sum(items.nbytes for items in self.levels)
+
+    def update(self, values):
+        """Adds a batch of losses; NaNs are ignored."""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            mean = values.mean()
+            self._add_moments(len(values), mean, ((values - mean) ** 2).sum())
+            self.levels[0] = np.concatenate((self.levels[0], values))
+            self._compress()
+        return self
+
+    def merge(self, other):
+        """Adds every loss summarised by ``other`` (e.g. another file or partition) in place."""
+        if other.n:
+            self._add_moments(other.n, other._mean, other._m2)
+            while len(self.levels) < len(other.levels):
+                self.levels.append(np.empty(0))
+            for h, items in enumerate(other.levels):
+                self.levels[h] = np.concatenate((self.levels[h], items))
+            self._compress()
+        return self
+
+    def copy(self):
+        clone = KLLSketch(self.k)
+        clone.levels = [items.copy() for items in self.levels]
+        clone.n, clone._mean, clone._m2 = self.n, self._mean, self._m2
+        clone._rng = np.random.default_rng(self._rng.integers(2**63))
+        return clone
+
+    def _add_moments(self, count, mean, m2):
+        # Chan et al. pairwise update, exact for merged partitions.
+        total = self.n + count
+        delta = mean - self._mean
+        self._mean += delta * count / total
+        self._m2 += m2 + delta * delta * self.n * count / total
+        self.n = total
+
+    def _capacity(self, h):
+        depth = len(self.levels) - 1 - h
+        return max(MIN_CAPACITY, int(np.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            if len(self.levels[h]) > self._capacity(h):
+                self._compact(h)
+                h = 0  # adding a level shrinks the capacity of the ones below it
+            else:
+                h += 1
+
+    def _compact(self, h):
+        items = np.sort(self.levels[h])
+        if h + 1 == len(self.levels):
+            self.levels.append(np.empty(0))
+        odd = len(items) % 2
+        offset = self._rng.integers(2)
+        self.levels[h] = items[:odd]
+        self.levels[h + 1] = np.concatenate((self.levels[h + 1], items[odd + offset::2]))
+
+    def weighted_items(self):
+        """Retained items in ascending order and the number of losses each stands for."""
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** h) for h, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        return values[order], weights[order]
+
+    def ecdf(self):
+        """Distinct retained values and the sketch's CDF at each of them."""
+        values, weights = self.weighted_items()
+        if len(values) == 0:
+            return values, values
+        cdf = np.cumsum(weights) / self.n
+        last = np.append(values[1:] != values[:-1], True)  # keep the final copy of ties
+        return values[last], cdf[last]
+
+    def cdf(self, x):
+        """Approximate fraction of losses ``<= x``."""
+        values, cdf = self.ecdf()
+        pos = np.searchsorted(values, x, side='right')
+        return np.where(pos > 0, cdf[np.maximum(pos - 1, 0)], 0.0)
+
+    def quantile(self, q):
+        values, cdf = self.ecdf()
+        return values[np.minimum(np.searchsorted(cdf, q, side='left'), len(values) - 1)]
+
+
+def combine(sketches, k=DEFAULT_K):
+    """A new sketch summarising all losses of ``sketches``; the inputs are left unchanged."""
+    combined = KLLSketch(k)
+    for sketch in sketches:
+        combined.merge(sketch)
+    return combined
+
+
+def build_sketches(batches, keys=('uom_id', 'event_type'), value='loss_amount', k=DEFAULT_K, seed=0):
+    """Streams DataFrame batches into one sketch per combination of ``keys``.
+
+    Only one batch is in memory at a time. Sketches from different files or partitions
+    can be combined afterwards with :func:`merge_sketch_maps`.
+
+    Returns:
+        Dict mapping key tuples to ``KLLSketch``.
+    """
+    sketches = {}
+    for batch in batches:
+        keys_present = [key for key in keys if key in batch.columns]
+        grouped = batch.groupby(keys_present, observed=True, sort=False)[value]
+        for key, losses in grouped:
+            key = key if isinstance(key, tuple) else (key,)
+            if key not in sketches:
+                # Seeded per key, so the result does not depend on the order of the batches' keys.
+                sketches[key] = KLLSketch(k, seed=[seed, zlib.crc32(repr(key).encode())])
+            sketches[key].update(losses.to_numpy())
+    return sketches
+
+
+def merge_sketch_maps(*sketch_maps):
+    """Combines per-key sketches built from separate files or partitions."""
+    merged = {}
+    for sketch_map in sketch_maps:
+        for key, sketch in sketch_map.items():
+            if key in merged:
+                merged[key].merge(sketch)
+            else:
+                merged[key] = sketch.copy()
+    return merged
+
+
+def group_sketches(sketches, key_to_group):
+    """Merges keyed sketches into one sketch per group, with ``key_to_group(key) -> group``."""
+    members = {}
+    for key, sketch in sketches.items():
+        members.setdefault(key_to_group(key), []).append(sketch)
+    return {group: combine(parts) for group, parts in members.items()}
+
+
+def sketch_cell_frame(sketches, keys=('uom_id', 'event_type')):
+    """One row per sketched key combination with its loss count, standing in for raw rows."""
+    frame = pd.DataFrame(list(sketches.keys()), columns=list(keys))
+    frame['n_events'] = [sketch.n for sketch in sketches.values()]
+    return frame
+
+
+def sketches_by_column(cell_frame, sketches, column, keys=('uom_id', 'event_type')):
+    """Merges keyed sketches by the value of ``column`` in the matching cell frame rows.
+
+    ``cell_frame`` is a (possibly regrouped) frame from :func:`sketch_cell_frame`, e.g. with
+    a grouped_uom_id column added. Returns a dict ordered by ``column`` value.
+    """
+    keys = [key for key in keys if key in cell_frame.columns]
+    mapping = dict(zip(cell_frame[keys].itertuples(index=False, name=None), cell_frame[column]))
+    merged = group_sketches({key: sketch for key, sketch in sketches.items() if key in mapping},
+                            mapping.__getitem__)
+    return dict(sorted(merged.items()))
+
+
+def ks_error_bound(sketch1, sketch2):
+    """Bound, at 99% confidence per sketch, on |KS(sketch1, sketch2) - KS(exact samples)|."""
+    return sketch1.rank_error + sketch2.rank_error
+
+
+def sketch_ks_distance(sketch1, sketch2):
+    """Two-sample KS distance between the distributions summarised by two sketches."""
+    if sketch1.n == 0 or sketch2.n == 0:
+        return 0.0
+    x1, f1 = sketch1.ecdf()
+    x2, f2 = sketch2.ecdf()
+    support = np.concatenate((x1, x2))
+    return float(np.abs(sketch1.cdf(support) - sketch2.cdf(support)).max())
+
+
+def _curve_ks_row(values, cdfs, offsets, i, cols):
+    """Sup gap between curve ``i`` and each curve in ``cols`` of a concatenated curve buffer.
+
+    Every curve holds distinct ascending values and its right-continuous CDF at them, so
+    both CDFs are compared at every jump of either curve, as in the exact KS row engine.
+    """
+    a, f_a = values[offsets[i]:offsets[i + 1]], cdfs[offsets[i]:offsets[i + 1]]
+    n1 = len(a)
+    counts = np.diff(offsets)[cols]
+    out = np.zeros(len(cols))
+    if n1 == 0 or counts.sum() == 0:
+        return out
+    nonempty = counts > 0
+    cols, counts = np.asarray(cols)[nonempty], counts[nonempty]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    idx = np.repeat(offsets[cols], counts) + np.arange(counts.sum()) - np.repeat(starts, counts)
+    b, f_b = values[idx], cdfs[idx]
+    seg = np.repeat(np.arange(len(cols)), counts)
+
+    # Jumps of the other curves: curve i evaluated at b.
+    f_a_ext = np.concatenate(([0.0], f_a))
+    gap_b = np.maximum.reduceat(np.abs(f_a_ext[np.searchsorted(a, b, side='right')] - f_b), starts)
+
+    # Jumps of curve i: number of b <= a[k] per curve, then that curve's CDF there.
+    hist = np.bincount(seg * (n1 + 1) + np.searchsorted(a, b, side='left'), minlength=len(cols) * (n1 + 1))
+    below = np.cumsum(hist.reshape(len(cols), n1 + 1), axis=1)[:, :n1]
+    f_b_ext = np.concatenate(([0.0], f_b))
+    f_b_at_a = np.where(below > 0, f_b_ext[(starts[:, None] + below)], 0.0)
+    gap_a = np.abs(f_a[None, :] - f_b_at_a).max(axis=1)
+
+    out[nonempty] = np.maximum(gap_a, gap_b)
+    return out
+
+
+def sketch_ks_distance_matrix(sketches):
+    """Symmetric matrix of sketch KS distances and the matching matrix of error bounds.
+
+    Entry (i, j) of the error matrix bounds |D_ij(sketch) - D_ij(exact)| with 99%
+    confidence per sketch; it is zero for pairs of sketches that never compacted.
+    """
+    sketches = list(sketches)
+    curves = [sketch.ecdf() for sketch in sketches]
+    sizes = [len(x) for x, _ in curves]
+    offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+    values = np.concatenate([x for x, _ in curves]) if curves else np.zeros(0)
+    cdfs = np.concatenate([f for _, f in curves]) if curves else np.zeros(0)
+    num = len(sketches)
+    ks_matrix = np.zeros((num, num))
+    for i in range(num - 1):
+        row = _curve_ks_row(values, cdfs, offsets, i, np.arange(i + 1, num))
+        ks_matrix[i, i + 1:] = row
+        ks_matrix[i + 1:, i] = row
+    errors = np.array([sketch.rank_error for sketch in sketches])
+    return ks_matrix, errors[:, None] + errors[None, :]
+
+
+def sketch_normal_ks_statistic(sketch):
+    """KS statistic of a sketch against a normal with the exact mean and std of its losses.
+
+    NaN when fewer than two losses were added or they have no spread, as in the exact engine.
+    """
+    from scipy.special import ndtr
+
+    if sketch.n < 2 or sketch.std == 0:
+        return np.nan
+    values, cdf = sketch.ecdf()
+    normal = ndtr((values - sketch.mean) / sketch.std)
+    before = np.concatenate(([0.0], cdf[:-1]))
+    return float(max((cdf - normal).max(), (normal - before).max()))
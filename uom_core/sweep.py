@@ -0,0 +1,199 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from uom_core.clustering import dominant_categories
+from uom_core.grouping import BUSINESS_GROUP_ID, cluster_group_mapping
+from uom_core.homogeneity import normal_ks_statistics
+from uom_core.ks import SortedSamples
+from uom_core.parallel import PARALLEL_MIN_WORK, SharedArray, process_pool, resolve_n_jobs
+
+# Unique groups scored per task of the process pool.
+GROUPS_PER_TASK = 64
+
+
+# ---------- Configurations ----------
+
+def event_type_subsets(event_types):
+    """Every non-empty subset of ``event_types``, smallest first."""
+    return [list(subset) for size in range(1, len(event_types) + 1) for subset in combinations(event_types, size)]
+
+
+def sweep_configurations(event_types, k_values, override_categories=None):
+    """The grid of a sweep: raw UoMs, business grouping of every event type subset, and
+    clustering for every K with the business override off and (given categories) on.
+
+    Returns:
+        List of dicts with name, strategy and the options of that strategy.
+    """
+    configurations = [{'name': "Raw UoMs", 'strategy': 'none'}]
+    configurations += [{'name': f"Business ({', '.join(subset)})", 'strategy': 'business', 'event_types': subset}
+                       for subset in event_type_subsets(event_types)]
+    for k in k_values:
+        configurations.append({'name': f"Clustering (K={k})", 'strategy': 'cluster', 'k': k})
+        if override_categories:
+            configurations.append({'name': f"Combined (K={k}, override: {', '.join(override_categories)})",
+                                   'strategy': 'combined', 'k': k, 'override_categories': list(override_categories)})
+    return configurations
+
+
+# ---------- Cell buffer ----------
+
+class LossCells:
+    """Losses sorted once by (uom_id, event_type) cell and by amount within each cell.
+
+    Every grouping strategy of the app assigns whole cells to groups, so a group is a set
+    of cells and its sorted sample is a merge of their presorted segments.
+
+    Given the :class:`uom_core.index.LossIndex` of ``data``, the cells are split from its
+    (uom_id, amount) buffer by a stable sort of integer cell codes instead of sorting the
+    losses again.
+    """
+
+    def __init__(self, data, index=None):
+        if 'event_type' not in data.columns:
+            raise KeyError("The 'event_type' column is missing; the sweep needs it for business grouping.")
+        event_codes, event_types = pd.factorize(data['event_type'], sort=True)
+        if index is None:
+            uom_codes, uom_ids = pd.factorize(data['uom_id'], sort=True)
+            present, codes = np.unique(uom_codes.astype(np.int64) * len(event_types) + event_codes,
+                                       return_inverse=True)
+            self.samples = SortedSamples.from_codes(codes, np.arange(len(present)),
+                                                    data['loss_amount'].to_numpy(dtype=float))
+        else:
+            uom_ids = index.uoms.ids
+            uom_codes = np.repeat(np.arange(len(uom_ids), dtype=np.int64), index.uoms.counts)
+            codes = uom_codes * len(event_types) + event_codes[index.rows]
+            order = np.argsort(codes, kind='stable')  # amounts stay ascending within each cell
+            present, counts = np.unique(codes[order], return_counts=True)
+            self.samples = SortedSamples(np.arange(len(present)), index.uoms.values[order],
+                                         np.concatenate(([0], np.cumsum(counts))).astype(np.int64))
+        self.uom_ids = np.asarray(uom_ids)[present // len(event_types)]
+        self.event_types = np.asarray(event_types)[present % len(event_types)]
+        # Cells are sorted by uom_id, so every raw UoM owns a contiguous run of them.
+        uom_ids, starts = np.unique(self.uom_ids, return_index=True)
+        bounds = np.append(starts, len(present))
+        self.uom_cells = {uid: tuple(range(bounds[i], bounds[i + 1])) for i, uid in enumerate(uom_ids)}
+
+    def __len__(self):
+        return len(self.samples)
+
+    def groups(self, configuration, ks_matrix=None, dominant=None):
+        """(grouped_uom_id, tuple of cell indices) of every group of one configuration."""
+        strategy = configuration['strategy']
+        uom_cells = self.uom_cells
+        if strategy == 'none':
+            return list(uom_cells.items())
+        if strategy == 'business':
+            merged = np.isin(self.event_types, configuration['event_types'])
+            groups = [(uid, tuple(c for c in cells if not merged[c])) for uid, cells in uom_cells.items()]
+            groups = [(uid, cells) for uid, cells in groups if cells]
+            return groups + [(BUSINESS_GROUP_ID, tuple(np.flatnonzero(merged)))] if merged.any() else groups
+        override_uoms = None
+        if strategy == 'combined':
+            override_uoms = dominant.index[dominant.isin(configuration['override_categories'])]
+        mapping, _ = cluster_group_mapping(np.array(sorted(uom_cells)), ks_matrix, configuration['k'],
+                                           override_uoms=override_uoms)
+        members = {}
+        for uid, cells in uom_cells.items():
+            members.setdefault(mapping[uid], []).extend(cells)
+        return [(group, tuple(sorted(cells))) for group, cells in sorted(members.items())]
+
+
+def merged_samples(samples, memberships):
+    """One sorted segment per membership, each the merge of its cells' segments."""
+    parts, counts = [], []
+    for cells in memberships:
+        values = np.concatenate([samples.sample(c) for c in cells])
+        if len(cells) > 1:
+            values.sort(kind='stable')  # runs of presorted cells make the merge cheap
+        parts.append(values)
+        counts.append(len(values))
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    values = np.concatenate(parts) if parts else np.empty(0)
+    return SortedSamples(np.arange(len(memberships)), values, offsets)
+
+
+# ---------- Scoring ----------
+
+# Per-worker state set up once by ``_init_sweep_worker``.
+_worker = {}
+
+
+def _init_sweep_worker(values_spec, offsets):
+    values = SharedArray.attach(values_spec)
+    _worker['buffer'] = values
+    _worker['samples'] = SortedSamples(np.arange(len(offsets) - 1), values.array, offsets)
+
+
+def _score_memberships(memberships):
+    return normal_ks_statistics(merged_samples(_worker['samples'], memberships))
+
+
+def score_memberships(samples, memberships, n_jobs=1, min_work=PARALLEL_MIN_WORK):
+    """KS statistic against a fitted normal of every membership (tuple of cell indices).
+
+    Memberships are scored in chunks by a process pool that maps the cell buffer from
+    shared memory; small sweeps, or ``n_jobs=1``, run serially.
+    """
+    n_jobs = resolve_n_jobs(n_jobs)
+    work = sum(int(samples.counts[list(cells)].sum()) for cells in memberships)
+    chunks = [memberships[start:start + GROUPS_PER_TASK] for start in range(0, len(memberships), GROUPS_PER_TASK)]
+    if n_jobs == 1 or len(chunks) < 2 or work < min_work:
+        return normal_ks_statistics(merged_samples(samples, memberships))
+    values = SharedArray.copy_of(samples.values)
+    try:
+        with process_pool(min(n_jobs, len(chunks)), _init_sweep_worker, (values.spec, samples.offsets)) as pool:
+            return np.concatenate(list(pool.map(_score_memberships, chunks)))
+    finally:
+        values.release()
+
+
+def sweep_groupings(data, configurations, ks_matrix=None, n_jobs=1, cells=None, scores=None, index=None):
+    """Scores many grouping configurations with the per-group KS statistic of the
+    Homogeneity Assessment page.
+
+    Losses are sorted once into a :class:`LossCells` buffer. Each group is identified by
+    the cells it contains, so a group that appears in several configurations (such as an
+    unmerged raw UoM, or a cluster that survives another K) is scored only once.
+
+    Args:
+        data: DataFrame with uom_id, event_type and loss_amount.
+        configurations: Dicts from :func:`sweep_configurations`.
+        ks_matrix: KS distance matrix of the raw UoMs, needed by clustering configurations.
+        cells: A ``LossCells`` of ``data`` to reuse across sweeps.
+        index: ``LossIndex`` of ``data`` to build the cells from when ``cells`` is not given.
+        scores: Dict of membership -> KS statistic from earlier sweeps of the same data;
+            it is updated in place, so only new memberships are computed.
+    Returns:
+        Tuple of (summary with one row per configuration, ranked by the event-weighted
+        mean KS statistic; per-group table with configuration, grouped_uom_id, n_events
+        and ks_statistic).
+    """
+    cells = LossCells(data, index=index) if cells is None else cells
+    scores = {} if scores is None else scores
+    dominant = dominant_categories(data) if any(c['strategy'] == 'combined' for c in configurations) else None
+    groups = [cells.groups(configuration, ks_matrix, dominant) for configuration in configurations]
+
+    new = list(dict.fromkeys(m for config_groups in groups for _, m in config_groups if m not in scores))
+    if new:
+        scores.update(zip(new, score_memberships(cells.samples, new, n_jobs=n_jobs)))
+
+    rows = [{'configuration': configuration['name'], 'grouped_uom_id': group,
+             'n_events': int(cells.samples.counts[list(members)].sum()), 'ks_statistic': scores[members]}
+            for configuration, config_groups in zip(configurations, groups) for group, members in config_groups]
+    per_group = pd.DataFrame(rows, columns=['configuration', 'grouped_uom_id', 'n_events', 'ks_statistic'])
+
+    scored = per_group.dropna(subset=['ks_statistic'])
+    weighted = (scored['ks_statistic'] * scored['n_events']).groupby(scored['configuration']).sum()
+    summary = pd.DataFrame({
+        'strategy': [configuration['strategy'] for configuration in configurations],
+        'groups': per_group.groupby('configuration', sort=False).size(),
+        'weighted_mean_ks': weighted / scored.groupby('configuration')['n_events'].sum(),
+        'mean_ks': scored.groupby('configuration')['ks_statistic'].mean(),
+        'max_ks': scored.groupby('configuration')['ks_statistic'].max(),
+    }, index=pd.Index([configuration['name'] for configuration in configurations], name='configuration'))
+    summary = summary.sort_values(['weighted_mean_ks', 'groups'])
+    summary.insert(0, 'rank', np.arange(1, len(summary) + 1))
+    return summary, per_group